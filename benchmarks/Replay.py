@@ -0,0 +1,240 @@
+import asyncio
+import bisect
+import copy
+import datetime
+import email.parser
+import json
+import os
+import threading
+import time
+import urllib.parse
+from types import SimpleNamespace
+
+import httplib2
+from google.genai import types
+
+from modules.EventIterator import toUtc
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+SUMMARIES = ["Team standup", "Design review", "1:1", "Lunch", "Focus time", "Customer call",
+             "Planning", "Gym", "Interview", "Retro", "Dentist", "Coffee chat"]
+
+def loadFixture(name):
+    with open(os.path.join(FIXTURES, name), "r") as f:
+        return json.load(f)
+
+def formatUtc(moment):
+    return moment.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+class SyntheticCalendar():
+    """
+    A deterministic calendar of `size` events spread over `days` days, shaped like the
+    recorded event fixture. Events are generated on demand from their index, so a 100k
+    event calendar costs no memory until it is paged through.
+    """
+
+    def __init__(self, size, days=365, start=datetime.datetime(2026, 1, 1, tzinfo=datetime.timezone.utc)):
+        self.size = size
+        self.days = days
+        self.start = start
+        self.template = loadFixture("event.json")
+        self.inserted = []
+        self._lock = threading.Lock()
+
+    def startMinutes(self, index):
+        # Non-decreasing in index, so the calendar is already in start-time order
+        return (index * self.days * 1440 // max(self.size, 1)) // 5 * 5
+
+    def event(self, index):
+        begin = self.start + datetime.timedelta(minutes=self.startMinutes(index))
+        end = begin + datetime.timedelta(minutes=15 * (1 + (index * 2654435761) % 8))
+        event = dict(self.template)
+        event.update(
+            id=f"evt{index:07d}",
+            summary=SUMMARIES[index % len(SUMMARIES)],
+            htmlLink=f"https://www.google.com/calendar/event?eid=evt{index:07d}",
+            iCalUID=f"evt{index:07d}@google.com",
+            start={"dateTime": formatUtc(begin), "timeZone": "UTC"},
+            end={"dateTime": formatUtc(end), "timeZone": "UTC"},
+        )
+        return event
+
+    def firstIndex(self, timeMin):
+        # Events last at most two hours, so anything starting earlier cannot reach timeMin
+        if timeMin is None:
+            return 0
+        bound = datetime.datetime.strptime(timeMin, "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=datetime.timezone.utc) - self.start
+        minutes = bound.total_seconds() / 60 - 120
+        return bisect.bisect_left(range(self.size), minutes, key=self.startMinutes)
+
+    def listPage(self, params):
+        pageSize = int(params.get("maxResults", 250))
+        if "syncToken" in params:
+            # Incremental sync: only the events inserted since the token was issued
+            seen = int(params["syncToken"].rsplit("-", 1)[-1])
+            with self._lock:
+                items = self.inserted[seen:]
+                return {"kind": "calendar#events", "items": items, "nextSyncToken": f"sync-{seen + len(items)}"}
+
+        timeMin = toUtc(params["timeMin"]) if "timeMin" in params else None
+        timeMax = toUtc(params["timeMax"]) if "timeMax" in params else None
+        index = int(params["pageToken"]) if "pageToken" in params else self.firstIndex(timeMin)
+        items = []
+        while index < self.size and len(items) < pageSize:
+            event = self.event(index)
+            index += 1
+            if timeMax is not None and event["start"]["dateTime"] >= timeMax:
+                index = self.size
+                break
+            if timeMin is None or event["end"]["dateTime"] > timeMin:
+                items.append(event)
+
+        page = {"kind": "calendar#events", "items": items}
+        if index < self.size:
+            page["nextPageToken"] = str(index)
+        else:
+            with self._lock:
+                page["nextSyncToken"] = f"sync-{len(self.inserted)}"
+        return page
+
+    def insert(self, body):
+        with self._lock:
+            event = copy.deepcopy(body)
+            eventId = f"new{len(self.inserted):07d}"
+            event.update(id=eventId, status="confirmed", htmlLink=f"https://www.google.com/calendar/event?eid={eventId}")
+            self.inserted.append(event)
+            return event
+
+class ReplayHttp():
+    """
+    Local stand-in for httplib2.Http that answers Calendar v3 requests from a
+    SyntheticCalendar and the recorded fixtures: events list/insert, calendarList and
+    multipart batch requests. Install it with `CalendarService.httpClass = ReplayHttp` after
+    pointing ReplayHttp.calendar at the SyntheticCalendar to serve.
+    """
+
+    calendar = None
+    latency = 0.0  # simulated network round trip, in seconds
+
+    def __init__(self, timeout=None):
+        self.timeout = timeout
+        self.connections = {}
+        self.requests = 0
+
+    def request(self, uri, method="GET", body=None, headers=None, redirections=5, connection_type=None):
+        self.requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+        parsed = urllib.parse.urlparse(uri)
+        status, payload, contentType = self.route(method, parsed.path, dict(urllib.parse.parse_qsl(parsed.query)), body, headers or {})
+        # Mimics a kept-alive connection from the second request on
+        self.connections.setdefault(parsed.netloc, True)
+        return httplib2.Response({"status": str(status), "content-type": contentType}), payload
+
+    def route(self, method, path, params, body, headers):
+        if path.startswith("/batch/"):
+            return self.batch(body, headers)
+        if path.endswith("/users/me/calendarList"):
+            return 200, json.dumps(loadFixture("calendar_list.json")).encode(), "application/json"
+        if path.endswith("/events"):
+            if method == "GET":
+                return 200, json.dumps(self.calendar.listPage(params)).encode(), "application/json"
+            if method == "POST":
+                return 200, json.dumps(self.calendar.insert(json.loads(body))).encode(), "application/json"
+        error = {"error": {"code": 404, "message": "Not Found", "errors": [{"reason": "notFound"}]}}
+        return 404, json.dumps(error).encode(), "application/json"
+
+    def batch(self, body, headers):
+        contentType = {key.lower(): value for key, value in headers.items()}["content-type"]
+        body = body.encode() if isinstance(body, str) else body
+        message = email.parser.BytesParser().parsebytes(f"Content-Type: {contentType}\r\n\r\n".encode() + body)
+
+        boundary = "batch_replay_boundary"
+        parts = []
+        for part in message.get_payload():
+            contentId = part["Content-ID"].strip("<>")
+            requestLine, _, rest = part.get_payload().replace("\r\n", "\n").partition("\n")
+            method, target, _ = requestLine.split(" ", 2)
+            partBody = rest.partition("\n\n")[2]
+            parsed = urllib.parse.urlparse(target)
+            status, payload, _ = self.route(method, parsed.path, dict(urllib.parse.parse_qsl(parsed.query)), partBody.encode(), {})
+            parts.append(f"--{boundary}\r\nContent-Type: application/http\r\nContent-ID: <response-{contentId}>\r\n\r\n"
+                         f"HTTP/1.1 {status} OK\r\nContent-Type: application/json\r\n\r\n{payload.decode()}\r\n")
+        return 200, ("".join(parts) + f"--{boundary}--\r\n").encode(), f"multipart/mixed; boundary={boundary}"
+
+class ReplayModels():
+    """
+    Stand-in for client.models that replays the recorded Gemini responses of a prompt: the
+    n-th model call after a prompt gets the n-th recorded response for it.
+    """
+
+    def __init__(self, turns, latency=0.0):
+        self.turns = {turn["prompt"]: [types.GenerateContentResponse.model_validate(response) for response in turn["responses"]]
+                      for turn in turns}
+        self.latency = latency
+        self.calls = 0
+
+    def respond(self, contents):
+        self.calls += 1
+        for offset, content in enumerate(reversed(contents)):
+            texts = [part.text for part in content.parts or [] if part.text]
+            if content.role == "user" and texts:
+                responses = self.turns.get(texts[0])
+                if responses is None:
+                    break
+                rounds = sum(1 for later in contents[len(contents) - offset:] if later.role == "model")
+                return responses[min(rounds, len(responses) - 1)]
+        return types.GenerateContentResponse.model_validate(
+            {"candidates": [{"content": {"role": "model", "parts": [{"text": "OK"}]}, "finishReason": "STOP"}]})
+
+    def generate_content(self, model, contents, config=None):
+        if self.latency:
+            time.sleep(self.latency)
+        return self.respond(contents)
+
+    def generate_content_stream(self, model, contents, config=None):
+        yield from self.chunks(self.generate_content(model, contents, config))
+
+    @staticmethod
+    def chunks(response):
+        parts = response.candidates[0].content.parts
+        if any(part.function_call for part in parts):
+            yield response
+            return
+        # Text replies arrive in a few chunks, like a real stream
+        text = "".join(part.text for part in parts if part.text)
+        for start in range(0, len(text), 40):
+            last = start + 40 >= len(text)
+            yield types.GenerateContentResponse(
+                candidates=[types.Candidate(content=types.Content(role="model", parts=[types.Part(text=text[start:start + 40])]))],
+                usage_metadata=response.usage_metadata if last else None)
+
+class ReplayAsyncModels():
+    """
+    Stand-in for client.aio.models over the same ReplayModels; simulated latency is awaited.
+    """
+
+    def __init__(self, models):
+        self.models = models
+
+    async def generate_content(self, model, contents, config=None):
+        if self.models.latency:
+            await asyncio.sleep(self.models.latency)
+        return self.models.respond(contents)
+
+    async def generate_content_stream(self, model, contents, config=None):
+        response = await self.generate_content(model, contents, config)
+
+        async def chunks():
+            for chunk in self.models.chunks(response):
+                yield chunk
+        return chunks()
+
+class ReplayClient():
+    """
+    Stand-in for google.genai.Client backed by ReplayModels, with the client.aio variant.
+    """
+
+    def __init__(self, turns=None, latency=0.0):
+        self.models = ReplayModels(turns if turns is not None else loadFixture("gemini_turns.json"), latency)
+        self.aio = SimpleNamespace(models=ReplayAsyncModels(self.models))
@@ -0,0 +1,166 @@
+"""
+Load test of the multi-user server mode against the local stand-ins.
+
+Starts `main.build_server` in-process with every Calendar request answered by the stand-in
+transport and every Gemini call replayed, then drives it from many concurrent clients, each
+holding a few sessions, and reports throughput and latency percentiles.
+
+Requests go through the production schedulers, so the report includes the time users wait
+on their Calendar quota and on the shared Gemini limit. --lift-rate-limits removes the
+limits to measure what the server itself can handle.
+
+    python -m benchmarks.load --users 20 --requests 2000 --concurrency 32 --model-latency 0.2
+"""
+
+import argparse
+import contextlib
+import datetime
+import http.client
+import json
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.run import ROOT, commitId, lift_rate_limits, percentile
+
+class Client():
+    """
+    One simulated user. Every request goes on a fresh connection, as the server closes them.
+    """
+
+    def __init__(self, host, port, user):
+        self.host = host
+        self.port = port
+        self.user = user
+
+    def request(self, method, path, body=None):
+        connection = http.client.HTTPConnection(self.host, self.port, timeout=120)
+        try:
+            payload = json.dumps(body).encode() if body is not None else None
+            connection.request(method, path, body=payload, headers={"X-User": self.user, "Content-Type": "application/json"})
+            response = connection.getresponse()
+            data = response.read()
+            return response.status, json.loads(data) if data else None
+        finally:
+            connection.close()
+
+def run(users=10, sessionsPerUser=2, requests=500, concurrency=16, size=1000, modelLatency=0.05, workers=16,
+        perUser=2, liftRateLimits=False):
+    import main
+    from google.oauth2.credentials import Credentials
+    from benchmarks.Replay import ReplayClient, ReplayHttp, SyntheticCalendar, loadFixture
+    from modules.CalendarService import CalendarService
+
+    CalendarService.httpClass = ReplayHttp
+    ReplayHttp.calendar = SyntheticCalendar(size)
+    if liftRateLimits:
+        lift_rate_limits()
+    prompts = [turn["prompt"] for turn in loadFixture("gemini_turns.json")]
+    names = [f"user{index:03d}" for index in range(users)]
+
+    with tempfile.TemporaryDirectory() as workdir:
+        main.USERS_DIR = workdir
+        # One credential object per user, as the token managers would hand out
+        tokens = {name: Credentials(token=f"load-{name}") for name in names}
+        server = main.build_server(ReplayClient(latency=modelLatency), credentials=tokens.__getitem__, port=0,
+                                   workers=workers, per_user_concurrency=perUser, quiet=True)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        host, port = server.server_address[:2]
+
+        try:
+            clients = [Client(host, port, name) for name in names]
+            sessions = []
+            for client in clients:
+                for _ in range(sessionsPerUser):
+                    status, body = client.request("POST", "/sessions")
+                    if status != 201:
+                        raise RuntimeError(f"Could not open a session for {client.user}: {status} {body}")
+                    sessions.append((client, body["session"]))
+
+            latencies, statuses, lock = [], {}, threading.Lock()
+
+            def send(index):
+                client, session = sessions[index % len(sessions)]
+                start = time.perf_counter()
+                status, _ = client.request("POST", f"/sessions/{session}/turns", {"prompt": prompts[index % len(prompts)]})
+                elapsed = time.perf_counter() - start
+                with lock:
+                    statuses[status] = statuses.get(status, 0) + 1
+                    if status == 200:
+                        latencies.append(elapsed)
+
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                list(pool.map(send, range(requests)))
+            wall = time.perf_counter() - started
+            serverStats = clients[0].request("GET", "/stats")[1]
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    results = {
+        "requests": requests,
+        "wall_s": wall,
+        "throughput_per_sec": len(latencies) / wall,
+        "statuses": {str(status): count for status, count in sorted(statuses.items())},
+        "server": serverStats,
+    }
+    if latencies:
+        results.update({
+            "latency_p50_ms": percentile(latencies, 0.5) * 1000,
+            "latency_p95_ms": percentile(latencies, 0.95) * 1000,
+            "latency_p99_ms": percentile(latencies, 0.99) * 1000,
+            "latency_max_ms": max(latencies) * 1000,
+        })
+
+    return {
+        "meta": {
+            "commit": commitId(),
+            "timestamp": datetime.datetime.now(tz=datetime.timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "users": users,
+            "sessions_per_user": sessionsPerUser,
+            "concurrency": concurrency,
+            "workers": workers,
+            "per_user": perUser,
+            "calendar_size": size,
+            "model_latency_s": modelLatency,
+            "rate_limits": "lifted" if liftRateLimits else "production",
+        },
+        "results": results,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test of the multi-user server against local stand-ins.")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--sessions-per-user", type=int, default=2)
+    parser.add_argument("--requests", type=int, default=500, help="prompts sent in total")
+    parser.add_argument("--concurrency", type=int, default=16, help="prompts in flight at once")
+    parser.add_argument("--size", type=int, default=1000, help="events in the synthetic calendar every user mirrors")
+    parser.add_argument("--model-latency", type=float, default=0.05,
+                        help="seconds each replayed model call waits, to mimic inference time")
+    parser.add_argument("--workers", type=int, default=16, help="server request workers")
+    parser.add_argument("--per-user", type=int, default=2, help="server limit on one user's concurrent prompts")
+    parser.add_argument("--lift-rate-limits", action="store_true",
+                        help="give every scheduler an unlimited rate instead of the production settings")
+    parser.add_argument("--output", help="write the JSON report to this file instead of stdout")
+    args = parser.parse_args()
+
+    os.chdir(ROOT)
+    # The tools print as they run; keep stdout for the report
+    with contextlib.redirect_stdout(sys.stderr):
+        report = run(args.users, args.sessions_per_user, args.requests, args.concurrency, args.size,
+                     args.model_latency, args.workers, args.per_user, args.lift_rate_limits)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
@@ -0,0 +1,357 @@
+"""
+Offline benchmarks of the assistant's hot paths.
+
+Every Calendar request is answered by a local stand-in transport serving a synthetic calendar
+shaped like the recorded fixtures, and every Gemini call replays recorded responses, so runs
+need no credentials or network and are comparable between commits.
+
+    python -m benchmarks.run --sizes 10,1000,100000 --output bench.json
+    python -m benchmarks.run --compare bench.json
+"""
+
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_SIZES = [10, 100, 1000, 10000, 100000]
+MAX_INSERTS = 2000  # events inserted per size; batching makes larger runs redundant
+# Routine commands the local intent router should answer, and a few it should pass to the model
+ROUTER_PROMPTS = [
+    "list my next 5 events", "What's on my calendar?", "what do I have tomorrow?", "show my schedule for next week",
+    "When am I free tomorrow afternoon for an hour?", "find me a 45-minute slot on thursday",
+    "Add lunch with Sam on Friday at noon", "book dentist tomorrow from 3pm to 4:30pm",
+    "How busy am I next month?", "move my standup to 10", "add standup tomorrow at 9",
+]
+
+def timed(function, repeats=1):
+    """
+    Runs function repeats times and returns (median seconds, last result).
+    """
+
+    samples, result = [], None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = function()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples), result
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
+
+def lift_rate_limits():
+    """
+    Gives every API scheduler, including the per-user ones created later, an unlimited rate.
+    The stand-ins have no quota, so rate limiting would only measure the configured limits.
+    """
+
+    from modules.RequestScheduler import SETTINGS, TokenBucket, schedulers
+
+    for settings in SETTINGS.values():
+        settings.update(rate=1e9, burst=1e9)
+    for scheduler in schedulers.values():
+        scheduler.bucket = TokenBucket(rate=1e9, burst=1e9)
+
+def bench_startup(repeats=5):
+    """
+    Wall time of `import main` in a fresh interpreter, and of the client libraries it defers.
+    """
+
+    code = ("import time; t = time.perf_counter(); import main; a = time.perf_counter() - t; "
+            "t = time.perf_counter(); main.import_client_libraries(); b = time.perf_counter() - t; print(a, b)")
+    imports, deferred = [], []
+    for _ in range(repeats):
+        output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, cwd=ROOT, check=True).stdout
+        first, second = map(float, output.split())
+        imports.append(first)
+        deferred.append(second)
+    return {"import_main_ms": statistics.median(imports) * 1000,
+            "client_libraries_ms": statistics.median(deferred) * 1000}
+
+def bench_calendar(size, creds, workdir):
+    """
+    Full and incremental sync, streamed listing, mirror reads, batched inserts, conflict
+    queries and workload analytics against a synthetic calendar of size events.
+    """
+
+    from benchmarks.Replay import ReplayHttp, SyntheticCalendar
+    from modules.BatchInsert import BatchInserter
+    from modules.CalendarService import CalendarService
+    from modules.CalendarSync import CalendarSync
+    from modules.Database import Database
+    from modules.EventAnalytics import EventAnalytics
+    from modules.EventIterator import iterEvents
+    from modules.IntervalIndex import IntervalIndex
+
+    ReplayHttp.calendar = SyntheticCalendar(size)
+    calendar = CalendarService(creds)
+    database = Database(f"sqlite:///{os.path.join(workdir, f'events-{size}.db')}")
+    mirror = CalendarSync(calendar, database)
+    results = {}
+
+    seconds, _ = timed(mirror.sync)
+    results["sync_full_s"] = seconds
+    results["sync_events_per_sec"] = size / seconds
+    results["sync_incremental_s"], _ = timed(mirror.sync, repeats=3)
+
+    seconds, count = timed(lambda: sum(1 for _ in iterEvents(calendar)))
+    results["list_api_events_per_sec"] = count / seconds
+    seconds, rows = timed(mirror.getEvents, repeats=3)
+    results["list_mirror_events_per_sec"] = len(rows) / seconds
+    results["list_mirror_next10_ms"] = timed(lambda: mirror.getEvents(start="2026-07-01T00:00:00Z", limit=10), repeats=20)[0] * 1000
+
+    inserts = min(size, MAX_INSERTS)
+    events = [{"summary": f"Benchmark {index}",
+               "start": {"dateTime": "2026-07-01T10:00:00Z", "timeZone": "UTC"},
+               "end": {"dateTime": "2026-07-01T10:30:00Z", "timeZone": "UTC"}} for index in range(inserts)]
+    seconds, created = timed(lambda: BatchInserter(calendar).insertEvents(events, calendarId="primary"))
+    results["insert_events"] = inserts
+    results["insert_events_per_sec"] = sum(result["status"] == "created" for result in created) / seconds
+
+    results["index_build_ms"], index = timed(lambda: IntervalIndex(rows), repeats=3)
+    results["index_build_ms"] *= 1000
+    results["conflict_query_us"] = timed(lambda: index.findConflicts("2026-07-01T10:00:00Z", "2026-07-01T11:00:00Z"), repeats=200)[0] * 1e6
+    results["workload_month_ms"] = timed(lambda: EventAnalytics.fromDatabase(
+        database, "2026-07-01T00:00:00Z", "2026-08-01T00:00:00Z", tz=datetime.timezone.utc).summary("week"), repeats=3)[0] * 1000
+    return results
+
+def bench_recurrence(workdir, series=200):
+    """
+    Reads of a mirror holding recurring series, which are stored once and expanded locally:
+    a year of instances with the parsed rules cold and cached, and the next 10 events.
+    """
+
+    from modules.CalendarSync import CalendarSync
+    from modules.Database import Database
+    from modules.Recurrence import expansion
+
+    database = Database(f"sqlite:///{os.path.join(workdir, f'series-{series}.db')}")
+    rules = ["RRULE:FREQ=DAILY;BYDAY=MO,TU,WE,TH,FR", "RRULE:FREQ=WEEKLY;BYDAY=MO,WE", "RRULE:FREQ=MONTHLY;BYMONTHDAY=1"]
+    events = [{"id": f"series{index:05d}", "status": "confirmed", "summary": f"Series {index}",
+               "start": {"dateTime": f"2026-01-{1 + index % 28:02d}T{8 + index % 9:02d}:00:00-05:00", "timeZone": "America/New_York"},
+               "end": {"dateTime": f"2026-01-{1 + index % 28:02d}T{8 + index % 9:02d}:30:00-05:00", "timeZone": "America/New_York"},
+               "recurrence": [rules[index % len(rules)]]} for index in range(series)]
+    CalendarSync(None, database).applyEvents(events)
+
+    def readYear():
+        return database.getEvents(start="2026-01-01T00:00:00Z", end="2027-01-01T00:00:00Z")
+
+    def readCold():
+        expansion.cache_clear()
+        return readYear()
+
+    results = {"series": series}
+    seconds, rows = timed(readCold, repeats=3)
+    results["year_instances"] = len(rows)
+    results["year_read_cold_ms"] = seconds * 1000
+    results["year_read_cached_ms"] = timed(readYear, repeats=3)[0] * 1000
+    results["next10_ms"] = timed(lambda: database.getEvents(start="2026-07-01T00:00:00Z", limit=10), repeats=20)[0] * 1000
+    return results
+
+def bench_dispatch(calls=(1, 4, 8), repeats=200):
+    """
+    Overhead of ToolDispatcher.dispatch over calling the handlers directly, per call.
+    """
+
+    from google.genai import types
+    from modules.ToolDispatcher import ToolDispatcher
+
+    dispatcher = ToolDispatcher({"noop": lambda **kwargs: {"ok": True}})
+    results = {}
+    for count in calls:
+        functionCalls = [types.FunctionCall(id=str(index), name="noop", args={"index": index}) for index in range(count)]
+        direct = timed(lambda: [dispatcher.run(call) for call in functionCalls], repeats)[0]
+        dispatched = timed(lambda: dispatcher.dispatch(functionCalls), repeats)[0]
+        results[f"overhead_{count}_calls_us_per_call"] = (dispatched - direct) / count * 1e6
+    return results
+
+def bench_history(turns=(10, 100, 1000), repeats=5):
+    """
+    Cost of serializing the conversation history for a request, and of compacting it.
+    """
+
+    from google.genai import types
+    from modules.HistoryManager import HistoryManager
+
+    results = {}
+    for count in turns:
+        history = []
+        for index in range(count):
+            history.append(types.Content(role="user", parts=[types.Part(text=f"What is on my calendar on day {index}?")]))
+            history.append(types.Content(role="model", parts=[types.Part(function_call=types.FunctionCall(
+                name="list_calendar_event", args={"quantity": 10}))]))
+            history.append(types.Content(role="user", parts=[types.Part(function_response=types.FunctionResponse(
+                name="list_calendar_event", response={"output": [{"start": "2026-07-01T10:00:00Z", "summary": "Standup"}] * 10}))]))
+            history.append(types.Content(role="model", parts=[types.Part(text="You have ten standups. " * 5)]))
+
+        seconds, payload = timed(lambda: json.dumps([content.model_dump(mode="json", exclude_none=True) for content in history]), repeats)
+        results[f"serialize_{count}_turns_ms"] = seconds * 1000
+        results[f"serialize_{count}_turns_bytes"] = len(payload)
+        results[f"compact_{count}_turns_ms"] = timed(lambda: HistoryManager(budget=8000).compact(list(history)), repeats)[0] * 1000
+    return results
+
+def bench_router(repeats=200):
+    """
+    Parse time of the local intent router and the share of ROUTER_PROMPTS it answers itself.
+    """
+
+    from modules.IntentRouter import IntentRouter
+
+    router = IntentRouter(tz=datetime.timezone.utc)
+    now = datetime.datetime(2026, 6, 29, 8, 0, tzinfo=datetime.timezone.utc)
+    seconds, routes = timed(lambda: [router.route(prompt, now) for prompt in ROUTER_PROMPTS], repeats)
+    return {
+        "parse_us_per_prompt": seconds / len(ROUTER_PROMPTS) * 1e6,
+        "local_hit_rate": sum(route is not None for route in routes) / len(ROUTER_PROMPTS),
+    }
+
+def bench_turns(creds, workdir, size=1000, rounds=3, modelLatency=0.0):
+    """
+    Per-turn latency of the full assistant (context building, tool dispatch, mirror reads) with
+    replayed model responses, plus the hit rates of the tool-result and answer caches and the
+    share of turns the local intent router answered.
+    """
+
+    import main
+    from benchmarks.Replay import ReplayClient, ReplayHttp, SyntheticCalendar, loadFixture
+
+    ReplayHttp.calendar = SyntheticCalendar(size)
+    main.SQLPATH = f"sqlite:///{os.path.join(workdir, 'assistant.db')}"
+    client = ReplayClient(latency=modelLatency)
+    assistant = main.build_assistant(creds, client)
+    assistant.echo = False
+
+    turns = loadFixture("gemini_turns.json")
+    prompts = [turn["prompt"] for turn in turns]
+    # Prompts that write run only once; repeating them would invalidate the answer cache every round
+    writes = {turn["prompt"] for turn in turns for response in turn["responses"]
+              for part in response["candidates"][0]["content"]["parts"]
+              if part.get("functionCall", {}).get("name") in assistant.dispatcher.writeTools}
+    latencies = {prompt: [] for prompt in prompts}
+    for repeat in range(rounds):
+        for prompt in prompts:
+            if repeat and prompt in writes:
+                continue
+            seconds, _ = timed(lambda: assistant.runTurn(prompt))
+            latencies[prompt].append(seconds)
+
+    samples = [seconds for values in latencies.values() for seconds in values]
+    results = {
+        "turn_p50_ms": percentile(samples, 0.5) * 1000,
+        "turn_p95_ms": percentile(samples, 0.95) * 1000,
+        "model_calls": client.models.calls,
+        "tool_cache_hit_rate": main.tool_cache.stats()["hitRate"],
+        "answer_cache_hit_rate": assistant.answerCache.stats()["hitRate"],
+        "local_hit_rate": assistant.router.stats()["handledRate"] if assistant.router else 0.0,
+    }
+    for index, prompt in enumerate(prompts):
+        results[f"turn_{index}_first_ms"] = latencies[prompt][0] * 1000
+    return results
+
+def flatten(results, prefix=""):
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{name}."))
+        else:
+            flat[name] = value
+    return flat
+
+def higherIsBetter(name):
+    return name.endswith("_per_sec") or name.endswith("_hit_rate")
+
+def compare(current, baseline, threshold):
+    """
+    Returns the metrics that moved the wrong way by more than threshold (a fraction).
+    """
+
+    regressions = []
+    previous = flatten(baseline["results"])
+    for name, value in flatten(current["results"]).items():
+        before = previous.get(name)
+        if not isinstance(value, (int, float)) or not before or name.endswith(("_bytes", "_events", "_calls")):
+            continue
+        change = (value - before) / before
+        if (-change if higherIsBetter(name) else change) > threshold:
+            regressions.append({"metric": name, "baseline": before, "current": value, "change": change})
+    return regressions
+
+def commitId():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, cwd=ROOT).stdout.strip() or None
+    except OSError:
+        return None
+
+def run(sizes, modelLatency=0.0, startupRepeats=5):
+    from google.oauth2.credentials import Credentials
+    from benchmarks.Replay import ReplayHttp
+    from modules.CalendarService import CalendarService
+
+    CalendarService.httpClass = ReplayHttp
+    lift_rate_limits()
+    # A token with no expiry is never refreshed, so no request leaves the machine
+    creds = Credentials(token="benchmark")
+
+    results = {"startup": bench_startup(startupRepeats)}
+    with tempfile.TemporaryDirectory() as workdir:
+        results["calendar"] = {str(size): bench_calendar(size, creds, workdir) for size in sizes}
+        results["recurrence"] = bench_recurrence(workdir)
+        results["dispatch"] = bench_dispatch()
+        results["history"] = bench_history()
+        results["router"] = bench_router()
+        results["turns"] = bench_turns(creds, workdir, modelLatency=modelLatency)
+    results["calendar_service"] = {key: value for key, value in CalendarService.stats().items() if key != "lastLatency"}
+
+    return {
+        "meta": {
+            "commit": commitId(),
+            "timestamp": datetime.datetime.now(tz=datetime.timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "sizes": sizes,
+            "model_latency_s": modelLatency,
+        },
+        "results": results,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline benchmarks of the calendar assistant.")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)),
+                        help="comma-separated synthetic calendar sizes")
+    parser.add_argument("--model-latency", type=float, default=0.0,
+                        help="seconds each replayed model call waits, to mimic inference time")
+    parser.add_argument("--startup-repeats", type=int, default=5)
+    parser.add_argument("--output", help="write the JSON report to this file instead of stdout")
+    parser.add_argument("--compare", help="baseline JSON report; exits 1 if any metric regressed")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="relative change counted as a regression by --compare")
+    args = parser.parse_args()
+
+    os.chdir(ROOT)
+    # The tools print as they run; keep stdout for the report
+    with contextlib.redirect_stdout(sys.stderr):
+        report = run([int(size) for size in args.sizes.split(",")], args.model_latency, args.startup_repeats)
+
+    regressions = []
+    if args.compare:
+        with open(args.compare, "r") as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        report["regressions"] = regressions
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    sys.exit(1 if regressions else 0)
@@ -1,54 +1,445 @@
+import argparse
+import asyncio
 import datetime
+import functools
 import os.path
+import subprocess
+import sys
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
-from google import genai
-from google.genai import types
+
+from modules.EventIterator import toUtc
+from modules.RequestScheduler import BACKGROUND, getScheduler, priority, schedulers
+from modules.ResponseCache import AnswerCache, ToolResultCache
+from modules.Tracer import JsonlExporter, OtlpJsonExporter, TraceCollector, formatBreakdown, tracer
+
+# The Google client libraries, pandas, SQLAlchemy and NumPy take about two seconds to import,
+# so they are imported inside the functions that use them. import_client_libraries() loads
+# them all on a background thread while the first prompt is shown.
+CLIENT_LIBRARIES = [
+    "google.genai",
+    "google.genai.types",
+    "google.oauth2.credentials",
+    "google.auth.transport.requests",
+    "google_auth_oauthlib.flow",
+    "modules.TokenManager",
+    "modules.Assistant",
+    "modules.AsyncCalendar",
+    "modules.BatchInsert",
+    "modules.CalendarService",
+    "modules.CalendarSync",
+    "modules.ContextBuilder",
+    "modules.Database",
+    "modules.EventAnalytics",
+    "modules.HistoryManager",
+    "modules.IntentRouter",
+    "modules.IntervalIndex",
+    "modules.MultiCalendar",
+    "modules.SessionServer",
+    "modules.ToolDispatcher",
+]
 
 SQLPATH = "sqlite:///events.db"
+USERS_DIR = "users"  # server mode: <user>.json token and <user>.db mirror of every user
 SCOPES = ["https://www.googleapis.com/auth/calendar"]
+SYNC_MAX_AGE = 60  # seconds a local mirror read may lag behind the calendar
+MAX_TOOL_ROUNDS = 5  # model round trips allowed per prompt while it keeps calling functions
+HISTORY_TOKEN_BUDGET = 8000  # estimated tokens of history resent with every model call
+LOCAL_INTENTS = True  # answer routine list/insert/free-slot commands without calling the model
+TOOL_OUTPUT = True  # print what the calendar tools do; off in server mode, where it would expose users' events
+SERIES_CONFLICT_CHECKS = 100  # occurrences of a new recurring event checked for conflicts
+
+# Per-user state is keyed by the user the credentials were registered for (None for the
+# single local user), so sessions of different users never share a mirror or cache entry
+user_ids = weakref.WeakKeyDictionary()  # credentials -> server user name
+databases = {}  # user -> Database
+calendar_syncs = {}  # (user, calendar_id) -> CalendarSync
+interval_indexes = {}  # (user, calendar_id) -> (database version, IntervalIndex)
+multi_calendars = {}  # user -> MultiCalendar
+state_lock = threading.Lock()
+tool_cache = ToolResultCache(maxSize=256, ttl=SYNC_MAX_AGE)  # read-only tool results by ((user, calendar), window, quantity)
+turn_traces = None  # TraceCollector of recent turns when --profile is on
+
+def register_user(creds, user):
+    """
+    Marks credentials as belonging to a server user, whose mirror lives in USERS_DIR/<user>.db.
+    """
+
+    user_ids[creds] = user
+    return creds
+
+
+def user_of(creds):
+    return user_ids.get(creds)
+
+
+def get_database(creds):
+    """
+    Returns the mirror database of the credentials' user: SQLPATH for the local user, or a
+    database of its own in USERS_DIR for each server user.
+    """
+
+    from modules.Database import Database
+
+    user = user_of(creds)
+    with state_lock:
+        if user not in databases:
+            if user is None:
+                path = SQLPATH
+            else:
+                os.makedirs(USERS_DIR, exist_ok=True)
+                path = f"sqlite:///{os.path.join(USERS_DIR, f'{user}.db')}"
+            databases[user] = Database(path)
+        return databases[user]
+
+
+def get_calendar_sync(creds, calendar_id="primary"):
+    """
+    Returns the local mirror of one of the user's calendars, creating it on first use.
+
+    Parameters:
+        creds (google.oauth2.credentials.Credentials): Authorized credentials to access the Google Calendar API.
+        calendar_id (str): The ID of the calendar to mirror. Defaults to 'primary'.
+
+    Returns:
+        CalendarSync: The sync engine backing reads of that calendar.
+    """
+
+    from modules.CalendarService import CalendarService
+    from modules.CalendarSync import CalendarSync
+
+    key = (user_of(creds), calendar_id)
+    database = get_database(creds)
+    with state_lock:
+        if key not in calendar_syncs:
+            calendar_syncs[key] = CalendarSync(CalendarService(creds, user_of(creds)), database, calendarId=calendar_id)
+        return calendar_syncs[key]
+
+def get_multi_calendar(creds):
+    """
+    Returns the user's MultiCalendar used for queries across several calendars, creating it on first use.
+    """
+
+    from modules.CalendarService import CalendarService
+    from modules.MultiCalendar import MultiCalendar
+
+    user = user_of(creds)
+    with state_lock:
+        if user not in multi_calendars:
+            multi_calendars[user] = MultiCalendar(CalendarService(creds, user))
+        return multi_calendars[user]
+
+def calendar_time_zone(creds, calendar_id="primary"):
+    """
+    Returns the IANA time zone of one of the user's calendars, or None when it cannot be read.
+    """
 
-def insert_calendar_event(event_data, creds, calendar_id="primary"):
+    try:
+        return get_multi_calendar(creds).timeZone(calendar_id)
+    except HttpError:
+        return None
+
+
+def user_time_zone(creds, calendar_id="primary"):
+    """
+    Returns the time zone of the user's calendar, or None when it cannot be read.
     """
-    Inserts a user event into the specified Google Calendar.
+
+    import zoneinfo
+
+    name = calendar_time_zone(creds, calendar_id)
+    try:
+        return zoneinfo.ZoneInfo(name) if name else None
+    except (zoneinfo.ZoneInfoNotFoundError, ValueError):
+        return None
+
+
+def get_interval_index(creds, calendar_id="primary"):
+    """
+    Returns a free/busy index over the local mirror of a calendar. The index is rebuilt only
+    when the mirror has changed since it was last built.
+
+    Parameters:
+        creds (google.oauth2.credentials.Credentials): Authorized credentials to access the Google Calendar API.
+        calendar_id (str): The ID of the calendar. Defaults to 'primary'.
+
+    Returns:
+        IntervalIndex: Index answering conflict and free-slot queries.
+    """
+
+    from modules.IntervalIndex import IntervalIndex
+
+    mirror = get_calendar_sync(creds, calendar_id)
+    mirror.sync(maxAge=SYNC_MAX_AGE)
+
+    key = (user_of(creds), calendar_id)
+    version, index = interval_indexes.get(key, (None, None))
+    if version != mirror.db.version:
+        version = mirror.db.version
+        index = IntervalIndex(mirror.getEvents())
+        interval_indexes[key] = (version, index)
+    return index
+
+
+def tool_print(*args):
+    """
+    Prints a calendar tool's progress to the console unless TOOL_OUTPUT is off.
+    """
+
+    if TOOL_OUTPUT:
+        print(*args)
+
+
+def event_conflicts(event_data, creds, calendar_id="primary"):
+    """
+    Returns the stored events that overlap a proposed event, as short summaries. For a
+    recurring event the first SERIES_CONFLICT_CHECKS occurrences are checked. All-day events
+    do not block time, so they never conflict. A dateTime without an offset is read in the
+    event's timeZone, or in the calendar's when it has none.
+    """
+
+    start, end = event_data["start"], event_data["end"]
+    if "dateTime" not in start:
+        return []
+
+    zone = start.get("timeZone") or calendar_time_zone(creds, calendar_id)
+    start = dict(start, timeZone=zone)
+    end = dict(end, timeZone=end.get("timeZone") or zone)
+
+    index = get_interval_index(creds, calendar_id)
+    if event_data.get("recurrence"):
+        from itertools import islice
+        from modules.CalendarSync import eventToRow
+        from modules.Recurrence import horizon, occurrences
+
+        series = eventToRow(dict(event_data, id="proposed", start=start, end=end), calendar_id)
+        spans = [(occurrence["start"], occurrence["end"])
+                 for occurrence in islice(occurrences(series, end=horizon()), SERIES_CONFLICT_CHECKS)]
+    else:
+        spans = [(toUtc(start["dateTime"], start["timeZone"]), toUtc(end["dateTime"], end["timeZone"]))]
+
+    conflicts = {}
+    for start, end in spans:
+        for event in index.findConflicts(start, end):
+            conflicts.setdefault((event["start"], event["summary"]),
+                                 {"summary": event["summary"], "start": event["start"], "end": event["end"]})
+    return list(conflicts.values())
+
+
+def invalidate_cached_events(creds, calendar_id, events):
+    """
+    Drops cached tool results whose window overlaps events that were just written.
+    """
+
+    for event in events:
+        start = toUtc(event["start"].get("dateTime", event["start"].get("date")))
+        end = toUtc(event["end"].get("dateTime", event["end"].get("date")))
+        if event.get("recurrence"):
+            # A series reaches every window up to its last instance
+            from modules.CalendarSync import eventToRow
+            end = eventToRow(event, calendar_id)["seriesEnd"] or "9999-12-31T23:59:59Z"
+        tool_cache.invalidateEvent((user_of(creds), calendar_id), start, end)
+
+
+def insert_calendar_event(event_data, creds, calendar_id="primary", allow_conflicts=False):
+    """
+    Inserts a user event into the specified Google Calendar, after checking the local mirror
+    for events it would overlap.
 
     Parameters:
         event_data (dict): A dictionary representing the event to insert.
         creds (google.oauth2.credentials.Credentials): Authorized credentials to access the Google Calendar API.
         calendar_id (str): The ID of the calendar to insert the event into. Defaults to 'primary'.
+        allow_conflicts (bool): Insert even if the event overlaps existing events. Defaults to False.
 
     Returns:
-        None
+        dict: The status of the insert with the event link, the conflicting events, or the error message.
 
     Side Effects:
         Prints the URL of the created event to the console if successful.
+        Prints the conflicting events if the event was not inserted because of them.
         Prints an error message if the event insertion fails.
     """
 
+    from modules.CalendarService import CalendarService
+
     try:
-        service = build("calendar", "v3", credentials=creds)
+        conflicts = [] if allow_conflicts else event_conflicts(event_data, creds, calendar_id)
+        if conflicts:
+            tool_print(f'{event_data.get("summary")} conflicts with: {", ".join(conflict["summary"] for conflict in conflicts)}')
+            return {"status": "conflict", "conflicts": conflicts}
+
+        calendar = CalendarService(creds, user_of(creds))
 
-        event = (
-            service.events().insert(calendarId=calendar_id, body=event_data).execute()
+        event = calendar.execute(
+            calendar.events().insert(calendarId=calendar_id, body=event_data)
         )
-        print(f'Event created: {event.get("htmlLink")}')
+        tool_print(f'Event created: {event.get("htmlLink")}')
+        get_calendar_sync(creds, calendar_id).applyEvents([event])
+        invalidate_cached_events(creds, calendar_id, [event])
+        return {"status": "created", "htmlLink": event.get("htmlLink")}
+
+    except HttpError as error:
+        tool_print(f"An error occurred: {error}")
+        return {"status": "failed", "error": str(error)}
+
+
+def insert_calendar_events(events, creds, calendar_id="primary", allow_conflicts=False):
+    """
+    Inserts several user events into the specified Google Calendar using batched requests.
+    Events that overlap existing events in the local mirror are skipped unless allowed.
+
+    Parameters:
+        events (list[dict]): Dictionaries representing the events to insert.
+        creds (google.oauth2.credentials.Credentials): Authorized credentials to access the Google Calendar API.
+        calendar_id (str): The ID of the calendar to insert the events into. Defaults to 'primary'.
+        allow_conflicts (bool): Insert events even if they overlap existing events. Defaults to False.
+
+    Returns:
+        list[dict]: One result per event with its summary, status, link, conflicts and any error.
+
+    Side Effects:
+        Prints the URL of each created event, or the conflicts or error for each event that was not created.
+    """
+
+    from modules.BatchInsert import BatchInserter
+    from modules.CalendarService import CalendarService
+
+    try:
+        conflicts = [[] if allow_conflicts else event_conflicts(event, creds, calendar_id) for event in events]
+    except HttpError as error:
+        tool_print(f"An error occurred: {error}")
+        return [{"summary": event.get("summary"), "status": "failed", "error": str(error)} for event in events]
+
+    clear = [event for event, overlaps in zip(events, conflicts) if not overlaps]
+    created = iter(BatchInserter(CalendarService(creds, user_of(creds))).insertEvents(clear, calendarId=calendar_id) if clear else [])
+    results = [next(created) if not overlaps else {"status": "conflict", "event": None, "error": None}
+               for overlaps in conflicts]
+    created_events = [result["event"] for result in results if result["status"] == "created"]
+    get_calendar_sync(creds, calendar_id).applyEvents(created_events)
+    invalidate_cached_events(creds, calendar_id, created_events)
+
+    summary = []
+    for event, result, overlaps in zip(events, results, conflicts):
+        if result["status"] == "conflict":
+            tool_print(f'{event.get("summary")} conflicts with: {", ".join(conflict["summary"] for conflict in overlaps)}')
+            summary.append({"summary": event.get("summary"), "status": "conflict", "conflicts": overlaps})
+            continue
+        if result["status"] == "created":
+            tool_print(f'Event created: {result["event"].get("htmlLink")}')
+        else:
+            tool_print(f'Could not create {event.get("summary")}: {result["error"]}')
+        summary.append({
+            "summary": event.get("summary"),
+            "status": result["status"],
+            "htmlLink": result["event"].get("htmlLink") if result["event"] else None,
+            "error": result["error"],
+        })
+    return summary
+
+
+def find_conflicts(start, end, creds, calendar_id="primary"):
+    """
+    Finds the events that overlap a time range, using the local free/busy index.
+
+    Parameters:
+        start (str): Start of the range in YYYY-MM-DDTHH:MM:SS-OFFSET format.
+        end (str): End of the range in YYYY-MM-DDTHH:MM:SS-OFFSET format.
+        creds (google.oauth2.credentials.Credentials): Authorized credentials to access the Google Calendar API.
+        calendar_id (str): The ID of the calendar to check. Defaults to 'primary'.
+
+    Returns:
+        dict: The overlapping events with their UTC start and end times.
+    """
+
+    try:
+        return {"conflicts": event_conflicts({"start": {"dateTime": start}, "end": {"dateTime": end}}, creds, calendar_id)}
+    except HttpError as error:
+        tool_print(f"An error occurred: {error}")
+        return {"error": str(error)}
+
+
+def free_slots(window_start, window_end, duration_minutes, creds, calendar_id="primary", calendar_ids=None):
+    """
+    Finds the free periods of at least duration_minutes inside a window, using the local
+    free/busy index. When calendar_ids is given, the periods are free on all of those
+    calendars at once, read live from the API.
+
+    Parameters:
+        window_start (str): Start of the window in YYYY-MM-DDTHH:MM:SS-OFFSET format.
+        window_end (str): End of the window in YYYY-MM-DDTHH:MM:SS-OFFSET format.
+        duration_minutes (int): Minimum length of a free slot.
+        creds (google.oauth2.credentials.Credentials): Authorized credentials to access the Google Calendar API.
+        calendar_id (str): The ID of the calendar to check. Defaults to 'primary'.
+        calendar_ids (list[str]): The IDs of several calendars to check together. Overrides calendar_id.
+
+    Returns:
+        dict: The free slots as UTC start/end pairs, and any calendars that could not be read
+        (their events are missing, so those slots may not be free on them).
+    """
 
+    from modules.IntervalIndex import IntervalIndex
+
+    try:
+        errors = {}
+        if calendar_ids:
+            events, errors = get_multi_calendar(creds).merged(toUtc(window_start), toUtc(window_end), calendar_ids)
+            index = IntervalIndex(events)
+        else:
+            index = get_interval_index(creds, calendar_id)
+        slots = index.freeSlots(window_start, window_end, int(duration_minutes) * 60)
+        result = {"free_slots": [{"start": start, "end": end} for start, end in slots]}
+        if errors:
+            result["errors"] = errors
+        return result
+    except HttpError as error:
+        tool_print(f"An error occurred: {error}")
+        return {"error": str(error)}
+
+
+def calendar_workload(window_start, window_end, creds, group_by="day", calendar_id="primary"):
+    """
+    Summarizes how busy a calendar is within a window, computed locally from the events.db mirror.
+
+    Parameters:
+        window_start (str): Start of the window in YYYY-MM-DDTHH:MM:SS-OFFSET format.
+        window_end (str): End of the window in YYYY-MM-DDTHH:MM:SS-OFFSET format.
+        creds (google.oauth2.credentials.Credentials): Authorized credentials to access the Google Calendar API.
+        group_by (str): 'day' or 'week'. Defaults to 'day'.
+        calendar_id (str): The ID of the calendar to analyze. Defaults to 'primary'.
+
+    Returns:
+        dict: The number of events, total and average booked hours, the hours booked per period,
+            the busiest period and the busiest weekday/hour slots.
+    """
+
+    from modules.EventAnalytics import EventAnalytics
+
+    try:
+        mirror = get_calendar_sync(creds, calendar_id)
+        mirror.sync(maxAge=SYNC_MAX_AGE)
+        return EventAnalytics.fromDatabase(mirror.db, toUtc(window_start), toUtc(window_end),
+                                           calendarId=calendar_id).summary(group_by)
     except HttpError as error:
-        print(f"An error occurred: {error}")
+        tool_print(f"An error occurred: {error}")
+        return {"error": str(error)}
 
 
-def list_calendar_event(creds, quantity=10):
+def list_calendar_event(creds, quantity=10, calendar_id="primary", time_min=None, time_max=None):
     """
-    Retrieves a list of upcoming events from the user's Google Calendar.
+    Retrieves a list of upcoming events from the local mirror of the user's Google Calendar,
+    bringing the mirror up to date first if it is older than SYNC_MAX_AGE seconds.
 
     Parameters:
         creds (google.oauth2.credentials.Credentials): Authorized credentials to access the Google Calendar API.
-        quantity (int): The number of upcoming events to retrieve. Defaults to 10.
+        quantity (int): The number of upcoming events to retrieve. Defaults to 10. Every event in the window when None.
+        calendar_id (str): The ID of the calendar to list. Defaults to 'primary'.
+        time_min (str): Start of the window in YYYY-MM-DDTHH:MM:SS-OFFSET format. Defaults to now.
+        time_max (str): End of the window in YYYY-MM-DDTHH:MM:SS-OFFSET format. Open-ended when None.
 
     Returns:
         list[dict]: A list of events, where each event is a dictionary containing the start time and summary.
@@ -56,39 +447,99 @@ def list_calendar_event(creds, quantity=10):
     Side Effects:
         Prints each event's start time and summary to the console.
         Prints a message if no upcoming events are found or if an API error occurs.
+        Returns {"error": ...} if the API request still fails after the scheduler's retries.
     """
     
     try:
-        service = build("calendar", "v3", credentials=creds)
-
-        # Calling the Calendar API
-        now = datetime.datetime.now(tz=datetime.timezone.utc).isoformat()
-        print(f"Getting the upcoming {quantity} event(s)")
-        events_result = (
-            service.events()
-            .list(
-                calendarId="primary",
-                timeMin=now,
-                maxResults=quantity,
-                singleEvents=True,
-                orderBy="startTime",
-            )
-            .execute()
-        )
-        events = events_result.get("items", [])
+        # Repeated requests within the same minute are answered from the tool result cache
+        now = toUtc(datetime.datetime.now(tz=datetime.timezone.utc).replace(second=0, microsecond=0).isoformat())
+        start = toUtc(time_min) if time_min else now
+        end = toUtc(time_max) if time_max else None
+        tool_print(f"Getting the upcoming {quantity or 'all'} event(s)")
+        key = tool_cache.key((user_of(creds), calendar_id), start, end, quantity)
+        events = tool_cache.get(key)
+
+        if events is None:
+            mirror = get_calendar_sync(creds, calendar_id)
+            mirror.sync(maxAge=SYNC_MAX_AGE)
+
+            # Reading the local mirror
+            events = mirror.getEvents(start=start, end=end, limit=quantity)
+            tool_cache.set(key, events)
 
         if not events:
-            print("No upcoming events found.")
+            tool_print("No upcoming events found.")
 
         event_list = []
         for event in events:
-            start = event["start"].get("dateTime", event["start"].get("date"))
-            end = event["end"].get("dateTime", event["end"].get("date"))
-            print(start, event["summary"])
-            event_list.append({"start" : start, "summary" : event.get("summary", "no title"), "end":end})
+            tool_print(event["start"], event["summary"])
+            event_list.append({"start" : event["start"], "summary" : event["summary"], "end" : event["end"]})
         return event_list
     except HttpError as error:
-        print(f"An error occurred: {error}")
+        tool_print(f"An error occurred: {error}")
+        return {"error": str(error)}
+
+
+def list_calendars(creds):
+    """
+    Lists the calendars on the user's calendar list.
+
+    Parameters:
+        creds (google.oauth2.credentials.Credentials): Authorized credentials to access the Google Calendar API.
+
+    Returns:
+        dict: The calendars with their id, name, whether they are primary or selected, and the user's access role.
+    """
+
+    try:
+        return {"calendars": [{"id": entry["id"],
+                               "summary": entry.get("summary"),
+                               "primary": entry.get("primary", False),
+                               "selected": entry.get("selected", False),
+                               "accessRole": entry.get("accessRole")}
+                              for entry in get_multi_calendar(creds).calendars(refresh=True)]}
+    except HttpError as error:
+        tool_print(f"An error occurred: {error}")
+        return {"error": str(error)}
+
+
+def list_multi_calendar_events(time_min, time_max, creds, calendar_ids=None, quantity=None):
+    """
+    Lists the events of several calendars in one time-ordered list. The calendars are queried
+    in parallel and their results merged by start time.
+
+    Parameters:
+        time_min (str): Start of the window in YYYY-MM-DDTHH:MM:SS-OFFSET format.
+        time_max (str): End of the window in YYYY-MM-DDTHH:MM:SS-OFFSET format.
+        creds (google.oauth2.credentials.Credentials): Authorized credentials to access the Google Calendar API.
+        calendar_ids (list[str]): The IDs of the calendars to query. Every selected calendar when None.
+        quantity (int): Maximum number of events to return. All events in the window when None.
+
+    Returns:
+        dict: The events with their calendar, start, end and summary, and any calendars that could not be read.
+
+    Side Effects:
+        Prints each event's start time, calendar and summary to the console.
+    """
+
+    from itertools import islice
+
+    try:
+        merged, errors = get_multi_calendar(creds).merged(toUtc(time_min), toUtc(time_max), calendar_ids)
+        events = []
+        for event in islice(merged, int(quantity) if quantity else None):
+            tool_print(event["start"], event["calendarId"], event["summary"])
+            events.append({"calendar_id": event["calendarId"], "start": event["start"],
+                           "end": event["end"], "summary": event["summary"]})
+        if not events:
+            tool_print("No events found.")
+        result = {"events": events}
+        if errors:
+            result["errors"] = errors
+        return result
+    except HttpError as error:
+        tool_print(f"An error occurred: {error}")
+        return {"error": str(error)}
 
 
 # Google Gen Ai Function Declarations
@@ -116,7 +567,7 @@ insert_calendar_event_function = {
                             },
                             "timeZone": {
                                 "type": "string",
-                                "description": "Timezone of the event.",
+                                "description": "IANA time zone of the event, e.g. 'America/New_York'.",
                             },
                         },
                         "required": ["dateTime", "timeZone"],
@@ -130,11 +581,19 @@ insert_calendar_event_function = {
                             },
                             "timeZone": {
                                 "type": "string",
-                                "description": "Timezone of the event.",
+                                "description": "IANA time zone of the event, e.g. 'America/New_York'.",
                             },
                         },
                         "required": ["dateTime", "timeZone"],
                     },
+                    "recurrence": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "Makes the event repeat: RFC 5545 RRULE lines, optionally with EXDATE lines, "
+                                       "e.g. ['RRULE:FREQ=WEEKLY;BYDAY=MO,WE;COUNT=10']. Insert a repeating event "
+                                       "once with this instead of inserting each occurrence; start and end are "
+                                       "those of the first occurrence.",
+                    },
                     "attendees": {
                         "type": "array",
                         "items": {
@@ -182,11 +641,122 @@ insert_calendar_event_function = {
                 "type": "string",
                 "description": "Identifier of the calendar. Defaults to 'primary'.",
             },
+            "allow_conflicts": {
+                "type": "boolean",
+                "description": "Insert even if the event overlaps existing events. Only set after the user confirms. Defaults to false.",
+            },
         },
         "required": ["event_data"],
     },
 }
 
+insert_calendar_events_function = {
+    "name": "insert_calendar_events",
+    "description": "Inserts several user provided events into their calendar at once. Use this instead of repeated insert_calendar_event calls when creating more than one event.",
+    "parameters": {
+        "type": "object",
+        "properties": {
+            "events": {
+                "type": "array",
+                "items": insert_calendar_event_function["parameters"]["properties"]["event_data"],
+                "description": "The events to insert.",
+            },
+            "calendar_id": {
+                "type": "string",
+                "description": "Identifier of the calendar. Defaults to 'primary'.",
+            },
+            "allow_conflicts": {
+                "type": "boolean",
+                "description": "Insert events even if they overlap existing events. Only set after the user confirms. Defaults to false.",
+            },
+        },
+        "required": ["events"],
+    },
+}
+
+find_conflicts_function = {
+    "name": "find_conflicts",
+    "description": "Finds the events on the user's calendar that overlap a time range",
+    "parameters": {
+        "type": "object",
+        "properties": {
+            "start": {
+                "type": "string",
+                "description": "Start of the range in YYYY-MM-DDTHH:MM:SS-OFFSET format",
+            },
+            "end": {
+                "type": "string",
+                "description": "End of the range in YYYY-MM-DDTHH:MM:SS-OFFSET format",
+            },
+            "calendar_id": {
+                "type": "string",
+                "description": "Identifier of the calendar. Defaults to 'primary'.",
+            },
+        },
+        "required": ["start", "end"],
+    },
+}
+
+free_slots_function = {
+    "name": "free_slots",
+    "description": "Finds free time on the user's calendar of at least a given length within a window. If the result lists 'errors', those calendars could not be read and the slots may not be free on them; tell the user.",
+    "parameters": {
+        "type": "object",
+        "properties": {
+            "window_start": {
+                "type": "string",
+                "description": "Start of the window to search in YYYY-MM-DDTHH:MM:SS-OFFSET format",
+            },
+            "window_end": {
+                "type": "string",
+                "description": "End of the window to search in YYYY-MM-DDTHH:MM:SS-OFFSET format",
+            },
+            "duration_minutes": {
+                "type": "integer",
+                "description": "Minimum length of a free slot in minutes",
+            },
+            "calendar_id": {
+                "type": "string",
+                "description": "Identifier of the calendar. Defaults to 'primary'.",
+            },
+            "calendar_ids": {
+                "type": "array",
+                "items": {"type": "string"},
+                "description": "Identifiers of several calendars that must all be free, e.g. to find a time that suits everyone. Overrides calendar_id.",
+            },
+        },
+        "required": ["window_start", "window_end", "duration_minutes"],
+    },
+}
+
+calendar_workload_function = {
+    "name": "calendar_workload",
+    "description": "Summarizes how busy the user is within a window: hours booked per day or week, the busiest period and the busiest times of the week. Use this for questions like 'how busy am I next month'.",
+    "parameters": {
+        "type": "object",
+        "properties": {
+            "window_start": {
+                "type": "string",
+                "description": "Start of the window in YYYY-MM-DDTHH:MM:SS-OFFSET format",
+            },
+            "window_end": {
+                "type": "string",
+                "description": "End of the window in YYYY-MM-DDTHH:MM:SS-OFFSET format",
+            },
+            "group_by": {
+                "type": "string",
+                "enum": ["day", "week"],
+                "description": "Whether to report booked hours per day or per week. Defaults to 'day'.",
+            },
+            "calendar_id": {
+                "type": "string",
+                "description": "Identifier of the calendar. Defaults to 'primary'.",
+            },
+        },
+        "required": ["window_start", "window_end"],
+    },
+}
+
 list_calendar_event_function = {
     "name": "list_calendar_event",
     "description": "Lists the events on the calendar and displays them to the user",
@@ -197,92 +767,615 @@ list_calendar_event_function = {
             'type' : 'integer',
             'description' : "number of events to list. Defaults to '10'."
             },
+            "calendar_id": {
+                "type": "string",
+                "description": "Identifier of the calendar. Defaults to 'primary'.",
+            },
+            "time_min": {
+                "type": "string",
+                "description": "Only list events ending after this time, in YYYY-MM-DDTHH:MM:SS-OFFSET format. Defaults to now.",
+            },
+            "time_max": {
+                "type": "string",
+                "description": "Only list events starting before this time, in YYYY-MM-DDTHH:MM:SS-OFFSET format.",
+            },
         },
         "required" : ["quantity"],
     },  
 }
 
+list_calendars_function = {
+    "name": "list_calendars",
+    "description": "Lists the calendars the user has access to, with their identifiers",
+    "parameters": {
+        "type": "object",
+        "properties": {},
+    },
+}
+
+list_multi_calendar_events_function = {
+    "name": "list_multi_calendar_events",
+    "description": "Lists the events of several calendars in a time window as one list ordered by start time. Use this when the user asks about more than their primary calendar.",
+    "parameters": {
+        "type": "object",
+        "properties": {
+            "time_min": {
+                "type": "string",
+                "description": "Start of the window in YYYY-MM-DDTHH:MM:SS-OFFSET format",
+            },
+            "time_max": {
+                "type": "string",
+                "description": "End of the window in YYYY-MM-DDTHH:MM:SS-OFFSET format",
+            },
+            "calendar_ids": {
+                "type": "array",
+                "items": {"type": "string"},
+                "description": "Identifiers of the calendars to query. Defaults to every calendar the user has selected.",
+            },
+            "quantity": {
+                "type": "integer",
+                "description": "Maximum number of events to list. Defaults to all events in the window.",
+            },
+        },
+        "required": ["time_min", "time_max"],
+    },
+}
 
-def main():
+
+def get_credentials(interactive=False):
+    """
+    Returns the user's credentials from the shared token manager of token.json, which keeps
+    refreshing them on a background thread ahead of expiry, so long sessions never refresh in
+    the middle of a request.
+
+    Parameters:
+        interactive (bool): Run the OAuth flow in the browser when there is no usable token.
+            Only honoured on the main thread.
+
+    Returns:
+        google.oauth2.credentials.Credentials: Authorized credentials for the Calendar API.
+
+    Raises:
+        AuthorizationError: There is no usable token and the flow may not run.
+    """
+
+    from modules.TokenManager import TokenManager
+
+    tokens = TokenManager.forPath("token.json", "credentials.json", SCOPES)
+    creds = tokens.credentials(interactive=interactive)
+    tokens.start()
+    return creds
+
+
+def get_user_credentials(user):
+    """
+    Returns a server user's credentials from USERS_DIR/<user>.json, kept fresh by that file's
+    token manager on its background thread, as for the single user, so a turn never refreshes
+    them on the request path and every refresh is saved. The server never runs the OAuth flow
+    itself; see authorize_user().
+
+    Raises:
+        PermissionError: If the user has not authorized calendar access yet.
+        AuthorizationError: If their access was revoked or can no longer be refreshed.
+    """
+
+    from modules.TokenManager import TokenManager
+
+    path = os.path.join(USERS_DIR, f"{user}.json")
+    if not os.path.exists(path):
+        raise PermissionError(f"{user} has not authorized calendar access; run: python main.py --authorize {user}")
+    tokens = TokenManager.forPath(path, "credentials.json", SCOPES)
+    creds = tokens.credentials()
+    tokens.start()
+    return creds
+
+
+def authorize_user(user):
+    """
+    Runs the OAuth flow for a server user in the local browser and stores their token in USERS_DIR.
+    """
+
+    from modules.SessionServer import SessionManager
+    from modules.TokenManager import TokenManager
+
+    SessionManager.checkUser(user)
+    os.makedirs(USERS_DIR, exist_ok=True)
+    TokenManager.forPath(os.path.join(USERS_DIR, f"{user}.json"), "credentials.json", SCOPES).credentials(interactive=True)
+    print(f"Stored calendar access for {user}")
+
+
+def build_context_provider(creds, sync_on_read=True, tz=None):
+    """
+    Returns a function that builds the calendar context for a prompt from the local mirror,
+    covering only the time window the prompt is about.
+
+    Parameters:
+        creds (google.oauth2.credentials.Credentials): Authorized credentials to access the Google Calendar API.
+        sync_on_read (bool): Bring the mirror up to date before building. Callers that refresh the
+            mirror in the background pass False.
+        tz (datetime.tzinfo): The user's time zone, in which "today" and "tomorrow" are read.
+            The machine's when None.
+
+    Returns:
+        Callable[[str], str]: Maps a user prompt to the context text for that turn.
+    """
+
+    from modules.ContextBuilder import ContextBuilder
+
+    mirror = get_calendar_sync(creds)
+    builder = ContextBuilder(
+        fetch=lambda start, end: mirror.getEvents(start=start, end=end),
+        version=lambda: mirror.db.version,
+        tz=tz,
+    )
+
+    def provide(prompt):
+        try:
+            if sync_on_read:
+                mirror.sync(maxAge=SYNC_MAX_AGE)
+        except HttpError as error:
+            tool_print(f"An error occurred: {error}")
+        return ("Here are the events on the user's calendar to take into account when creating new events and listing events:\n"
+                + builder.build(prompt))
+
+    return provide
+
+
+def build_assistant(creds, client, sync_on_read=True, executor=None, router=None, tz=None):
+    """
+    Configures the tools and dispatcher and returns an Assistant that receives fresh calendar
+    context with every prompt.
+
+    Parameters:
+        creds (google.oauth2.credentials.Credentials): Authorized credentials to access the Google Calendar API.
+        client (google.genai.Client): The GenAI client, which can be shared between sessions.
+        sync_on_read (bool): Sync the local mirror before building each prompt's context.
+        executor (concurrent.futures.Executor): Pool that runs tool calls, shared between sessions.
+            Each Assistant gets its own small pool when None.
+        router (IntentRouter): Local parser of routine commands, which can be shared between sessions
+            of one user. A new one is created when None and LOCAL_INTENTS is on.
+        tz (datetime.tzinfo): The user's time zone, for the context and a new router. The machine's when None.
+
+    Returns:
+        Assistant: A new conversation.
+    """
+
+    from google.genai import types
+    from modules.Assistant import Assistant
+    from modules.HistoryManager import HistoryManager
+    from modules.IntentRouter import IntentRouter
+    from modules.ToolDispatcher import ToolDispatcher
+
+    tools = types.Tool(function_declarations=[
+        insert_calendar_event_function,
+        insert_calendar_events_function,
+        find_conflicts_function,
+        free_slots_function,
+        calendar_workload_function,
+        list_calendar_event_function,
+        list_calendars_function,
+        list_multi_calendar_events_function,
+    ])
+    config = types.GenerateContentConfig(tools=[tools])
+    dispatcher = ToolDispatcher(
+        {
+            "insert_calendar_event": functools.partial(insert_calendar_event, creds=creds),
+            "insert_calendar_events": functools.partial(insert_calendar_events, creds=creds),
+            "find_conflicts": functools.partial(find_conflicts, creds=creds),
+            "free_slots": functools.partial(free_slots, creds=creds),
+            "calendar_workload": functools.partial(calendar_workload, creds=creds),
+            "list_calendar_event": functools.partial(list_calendar_event, creds=creds),
+            "list_calendars": functools.partial(list_calendars, creds=creds),
+            "list_multi_calendar_events": functools.partial(list_multi_calendar_events, creds=creds),
+        },
+        writeTools={"insert_calendar_event", "insert_calendar_events"},
+        executor=executor,
+    )
+
+    mirror = get_calendar_sync(creds)
+    return Assistant(client, config, dispatcher, maxToolRounds=MAX_TOOL_ROUNDS,
+                     historyManager=HistoryManager(budget=HISTORY_TOKEN_BUDGET, pinned=0),
+                     contextProvider=build_context_provider(creds, sync_on_read=sync_on_read, tz=tz),
+                     answerCache=AnswerCache(version=lambda: mirror.db.version),
+                     scheduler=getScheduler("gemini"),
+                     router=router or (IntentRouter(tz=tz) if LOCAL_INTENTS else None))
+
+
+def print_turn_timings(assistant):
+    """
+    Prints the time-to-first-token and total time of the assistant's last turn.
+    """
+
+    stats = assistant.turnStats[-1]
+    print(f"[{stats['mode']}] first token {stats['ttft']:.2f}s, total {stats['total']:.2f}s, {stats['rounds']} model call(s)")
+
+
+def print_cache_stats(assistant):
+    """
+    Prints hit/miss statistics of the tool result cache and the assistant's answer cache.
+    """
+
+    for name, cache in (("tool results", tool_cache), ("answers", assistant.answerCache)):
+        stats = cache.stats()
+        print(f"{name}: {stats['hits']} hit(s), {stats['misses']} miss(es), {stats['hitRate']:.0%} hit rate, {stats['size']} cached")
+
+
+def print_router_stats(assistant):
+    """
+    Prints how many prompts the local intent router answered and how many went to the model.
+    """
+
+    if assistant.router is not None:
+        stats = assistant.router.stats()
+        print(f"local intents: {stats['handled']} handled, {stats['fellThrough']} passed to the model, "
+              f"{stats['handledRate']:.0%} handled locally")
+
+
+def print_scheduler_stats():
+    """
+    Prints the calls, retries, throttling responses and current concurrency limit of each API's scheduler.
+    """
+
+    for name, scheduler in schedulers.items():
+        stats = scheduler.stats()
+        print(f"{name}: {stats['calls']} call(s), {stats['retries']} retried, {stats['throttled']} throttled, "
+              f"{stats['failed']} failed, {stats['waitSeconds']:.2f}s queued, concurrency {stats['limit']}")
+
+
+def configure_tracing(profile=False, trace_path=None, trace_format="jsonl"):
+    """
+    Turns on span tracing of turns, model calls, tool dispatches, Calendar API requests and
+    database queries.
+
+    Parameters:
+        profile (bool): Keep each turn's spans so print_turn_profile() can show a breakdown.
+        trace_path (str): Append finished spans to this file. No export when None.
+        trace_format (str): 'jsonl' for one span per line, or 'otlp' for one OTLP/JSON trace per line.
+    """
+
+    global turn_traces
+    exporter = None
+    if trace_path:
+        exporter = OtlpJsonExporter(trace_path) if trace_format == "otlp" else JsonlExporter(trace_path)
+    turn_traces = TraceCollector("turn") if profile else None
+    tracer.configure(exporter=exporter, listeners=[turn_traces] if turn_traces else [])
+
+
+def print_turn_profile():
+    """
+    Prints where the last turn spent its time: model calls, tools, API requests and queries.
+    """
+
+    if turn_traces is not None and turn_traces.last:
+        print(formatBreakdown(turn_traces.last))
+
+
+def build_server(client, credentials=get_user_credentials, host="127.0.0.1", port=8080, workers=16, tool_workers=16,
+                 max_sessions=1000, session_ttl=1800, per_user_concurrency=2, quiet=False, tool_output=False):
+    """
+    Creates the multi-user HTTP server. Every session gets its own Assistant and history, with
+    dates read in the time zone of the user's calendar, while
+    all of them share the GenAI client, one tool worker pool, the per-thread Calendar connection
+    pools and the Gemini scheduler. Calendar requests are scheduled per user.
+
+    Parameters:
+        client (google.genai.Client): The GenAI client shared by every session.
+        credentials (Callable[[str], Credentials]): Returns a user's credentials, raising PermissionError if there are none.
+        host (str): Interface to listen on.
+        port (int): Port to listen on; 0 picks a free one.
+        workers (int): Requests handled at once, across all users.
+        tool_workers (int): Tool calls run at once, across all sessions.
+        max_sessions (int): Sessions kept before the least recently used one is evicted.
+        session_ttl (float): Seconds of inactivity after which a session expires.
+        per_user_concurrency (int): Prompts a single user may have running at once.
+        quiet (bool): Do not log every request.
+        tool_output (bool): Let the tools print users' events to the server's stdout. Sets TOOL_OUTPUT.
+
+    Returns:
+        SessionServer: Call serve_forever() on it.
+    """
+
+    global TOOL_OUTPUT
+    TOOL_OUTPUT = tool_output
+
+    from modules.IntentRouter import IntentRouter
+    from modules.SessionServer import SessionManager, SessionServer
+
+    tool_executor = ThreadPoolExecutor(max_workers=tool_workers, thread_name_prefix="tool")
+    routers = {}  # user -> IntentRouter in the zone of the user's calendar
+
+    def user_credentials(user):
+        return register_user(credentials(user), user)
+
+    def create_assistant(user, creds):
+        tz = user_time_zone(creds)
+        with state_lock:
+            if LOCAL_INTENTS and user not in routers:
+                routers[user] = IntentRouter(tz=tz)
+            router = routers.get(user)
+        assistant = build_assistant(creds, client, executor=tool_executor, router=router, tz=tz)
+        assistant.echo = False
+        return assistant
+
+    def router_stats():
+        with state_lock:
+            stats = [router.stats() for router in routers.values()]
+        handled, fell_through, intents = 0, 0, {}
+        for entry in stats:
+            handled += entry["handled"]
+            fell_through += entry["fellThrough"]
+            for intent, count in entry["intents"].items():
+                intents[intent] = intents.get(intent, 0) + count
+        lookups = handled + fell_through
+        return {"handled": handled, "fellThrough": fell_through, "intents": intents,
+                "handledRate": handled / lookups if lookups else 0.0}
+
+    def extra_stats():
+        return {
+            "schedulers": {name: scheduler.stats() for name, scheduler in schedulers.items()},
+            "tool_cache": tool_cache.stats(),
+            "router": router_stats() if LOCAL_INTENTS else None,
+        }
+
+    manager = SessionManager(create_assistant, user_credentials, maxSessions=max_sessions, sessionTtl=session_ttl,
+                             perUserConcurrency=per_user_concurrency)
+    return SessionServer((host, port), manager, workers=workers, extraStats=extra_stats, quiet=quiet)
+
+
+def serve(host="127.0.0.1", port=8080, workers=16, max_sessions=1000, session_ttl=1800, per_user_concurrency=2):
+    """
+    Runs the assistant as an HTTP service for many users until interrupted.
+    """
+
+    load_dotenv()
+    import_client_libraries()
+    from google import genai
+
+    server = build_server(genai.Client(), host=host, port=port, workers=workers, max_sessions=max_sessions,
+                          session_ttl=session_ttl, per_user_concurrency=per_user_concurrency)
+    print(f"Serving on http://{host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def import_client_libraries():
+    """
+    Imports every heavy dependency listed in CLIENT_LIBRARIES.
+    """
+
+    import importlib
+
+    for name in CLIENT_LIBRARIES:
+        importlib.import_module(name)
+
+
+def start_session(sync_on_read=True):
+    """
+    Does the slow part of startup: imports the client libraries, loads or refreshes the
+    credentials and creates the GenAI client and the assistant. main() runs this on a
+    background thread while the first prompt is displayed. Warming the local calendar
+    mirror is started on a thread of its own and not waited for.
+
+    Parameters:
+        sync_on_read (bool): Sync the local mirror before building each prompt's context.
+
+    Returns:
+        tuple: The credentials and the Assistant.
+    """
+
+    import_client_libraries()
+    from google import genai
+
+    creds = get_credentials()
+    client = genai.Client()
+    assistant = build_assistant(creds, client, sync_on_read=sync_on_read)
+    threading.Thread(target=warm_mirror, args=(creds,), name="warm-mirror", daemon=True).start()
+    return creds, assistant
+
+
+def start_in_background(function, *args):
+    """
+    Runs function on a daemon thread and returns a Future of its result. Unlike an executor's
+    workers, the thread does not keep the process alive, so quitting never waits for it.
+    """
+
+    from concurrent.futures import Future
+
+    future = Future()
+
+    def run():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(function(*args))
+        except BaseException as error:
+            future.set_exception(error)
+
+    threading.Thread(target=run, name="startup", daemon=True).start()
+    return future
+
+
+def warm_mirror(creds):
+    """
+    Syncs the local mirror at background priority, so the first prompt's model and Calendar
+    requests, made while it runs, are admitted ahead of its pages.
+    """
+
+    try:
+        with priority(BACKGROUND):
+            get_calendar_sync(creds).sync(maxAge=SYNC_MAX_AGE)
+    except HttpError as error:
+        tool_print(f"An error occurred: {error}")
+
+
+def startup_report(top=15):
+    """
+    Prints an -X importtime breakdown of startup: the modules imported before the first
+    prompt is shown and the ones deferred to the background thread, slowest first.
+
+    Parameters:
+        top (int): Number of modules to list in each section.
+    """
+
+    marker = "-- deferred --"
+    code = f"import main, sys; sys.stderr.write('{marker}\\n'); main.import_client_libraries()"
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                            capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    before, _, deferred = result.stderr.partition(marker)
+
+    for title, output in (("before first prompt", before), ("deferred to background", deferred)):
+        rows = []
+        for line in output.splitlines():
+            if not line.startswith("import time:") or "cumulative" in line:
+                continue
+            _, cumulative, name = line[len("import time:"):].split("|")
+            rows.append((int(cumulative), name.rstrip()))
+        # Top-level imports are not indented, so their cumulative times add up to the total
+        total = sum(cumulative for cumulative, name in rows if not name.startswith("  "))
+        print(f"{title}: {total / 1000:.0f} ms")
+        for cumulative, name in sorted(rows, reverse=True)[:top]:
+            print(f"  {cumulative / 1000:8.1f} ms  {name.strip()}")
+
+
+def main(stream=False, timings=False, profile=False):
     """
     Handles authentication, initializes the GenAI client, and manages an interactive loop
     for user prompts. The function supports inserting and listing Google Calendar events
     via natural language through Gemini AI.
+
+    Parameters:
+        stream (bool): Print the model's reply as it is generated instead of all at once.
+        timings (bool): Print time-to-first-token and total time after every turn.
+        profile (bool): Print a per-turn breakdown of traced spans after every turn.
     """
     
     load_dotenv()  # reads .env by default (no need for Path module)
-    creds = None
 
-    if os.path.exists("token.json"):
-        creds = Credentials.from_authorized_user_file("token.json", SCOPES)
+    # Imports, credentials and the first sync happen in the background while the user types
+    session = start_in_background(start_session)
+    assistant = None
 
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-        else:
-            flow = InstalledAppFlow.from_client_secrets_file("credentials.json", SCOPES)
-            creds = flow.run_local_server(port=0)
+    while True:
+        user_input = input("Enter prompt (q to quit): ")
 
-        with open("token.json", "w") as token:
-            token.write(creds.to_json())
+        if user_input.lower() == 'q':
+            if timings and assistant is not None:
+                print_cache_stats(assistant)
+                print_router_stats(assistant)
+                print_scheduler_stats()
+            print("Goodbye")
+            return
 
-    event_data = list_calendar_event(creds=creds, quantity=10)
+        if assistant is None:
+            try:
+                creds, assistant = session.result()
+            except PermissionError:
+                # No usable token (an AuthorizationError): the browser flow may only run here, on the main thread
+                get_credentials(interactive=True)
+                creds, assistant = start_session()
 
-    # Config client and tools
-    client = genai.Client()
-    tools = types.Tool(function_declarations=[insert_calendar_event_function, list_calendar_event_function])
-    config = types.GenerateContentConfig(tools=[tools])
+        if stream:
+            assistant.runTurnStream(user_input)
+        else:
+            print(assistant.runTurn(user_input))
 
-    context = ""
-    for event in event_data:
-        context+=str(f"{event["start"]}->{event["end"]}:{event["summary"]}\n")
+        if timings:
+            print_turn_timings(assistant)
+        if profile:
+            print_turn_profile()
 
-    history = [
-        types.Content(
-            role="model",
-            parts=[types.Part(text=f"Here are the upcoming events on the user's calendar to take into account when creating new events and listing events:\n{context}")]
-    )]  # convo history
+
+async def amain(stream=False, timings=False, profile=False):
+    """
+    Asyncio version of main built on the async GenAI client. Startup runs on a worker thread
+    while the first prompt is shown, and each prompt starts a background refresh of the
+    local calendar mirror that overlaps with model inference.
+    """
+
+    load_dotenv()
+    # The mirror is refreshed in the background below, so reads never wait on a sync
+    session = asyncio.wrap_future(start_in_background(start_session, False))
+    assistant = calendar = None
 
     while True:
-        user_input = input("Enter prompt (q to quit): ")
+        user_input = await asyncio.to_thread(input, "Enter prompt (q to quit): ")
 
         if user_input.lower() == 'q':
+            if timings and assistant is not None:
+                print_cache_stats(assistant)
+                print_router_stats(assistant)
+                print_scheduler_stats()
             print("Goodbye")
             return
-        
-        history.append(types.Content(role="user", parts=[types.Part(text=user_input)]))
-
-        # Send request with function declarations
-        response = client.models.generate_content(
-            model="gemini-2.5-flash",
-            contents=history,
-            config=config,
-        )
 
-        # Check for function call
-        if response.candidates[0].content.parts[0].function_call:
-            function_call = response.candidates[0].content.parts[0].function_call
-            print(f"Calling {function_call.name}()")
-            # print(f"Arguments: {function_call.args}")
-            match function_call.name:
-                case 'list_calendar_event':
-                    result = list_calendar_event(**function_call.args, creds=creds)
-                    continue
-                case 'insert_calendar_event':
-                    result = insert_calendar_event(**function_call.args, creds=creds)
-                    continue
-
-            # print(f"result: {result}")
-            history.append(types.Content(role='model', parts=[types.Part(function_response=types.FunctionResponse(name=function_call.name, response=result))]))
-            #print(history)
+        if assistant is None:
+            from modules.AsyncCalendar import AsyncCalendar
+            from modules.CalendarService import CalendarService
+
+            try:
+                creds, assistant = await session
+            except PermissionError:
+                # No usable token (an AuthorizationError): the browser flow may only run here, on the main thread
+                get_credentials(interactive=True)
+                creds, assistant = await asyncio.to_thread(start_session, False)
+            calendar = AsyncCalendar(CalendarService(creds, user_of(creds)), mirror=get_calendar_sync(creds))
+
+        # The task copies the context, so the refresh's requests queue behind the turn's
+        with priority(BACKGROUND):
+            refresh = asyncio.create_task(calendar.sync(maxAge=SYNC_MAX_AGE))
+        if stream:
+            await assistant.runTurnStreamAsync(user_input)
         else:
-            model_text_response = response.candidates[0].content.parts[0].text
-            print(model_text_response)
-            history.append(
-                types.Content(
-                    role="model", parts=[types.Part(text=model_text_response)]
-                )
-            )
+            print(await assistant.runTurnAsync(user_input))
+
+        if timings:
+            print_turn_timings(assistant)
+        if profile:
+            print_turn_profile()
+        try:
+            await refresh
+        except HttpError as error:
+            print(f"An error occurred: {error}")
+
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="GenAI Calendar Assistant")
+    parser.add_argument("--async", dest="use_async", action="store_true", help="run the asyncio-based assistant loop")
+    parser.add_argument("--stream", action="store_true", help="print model output as it is generated")
+    parser.add_argument("--timings", action="store_true", help="print time-to-first-token and total time per turn")
+    parser.add_argument("--startup-report", action="store_true", help="print an import time breakdown of startup and exit")
+    parser.add_argument("--profile", action="store_true", help="print where each turn spent its time")
+    parser.add_argument("--trace", metavar="FILE", help="append trace spans of every turn to FILE")
+    parser.add_argument("--trace-format", choices=["jsonl", "otlp"], default="jsonl",
+                        help="one span per line (jsonl) or one OTLP/JSON trace per line (otlp)")
+    parser.add_argument("--serve", metavar="HOST:PORT", nargs="?", const="127.0.0.1:8080",
+                        help="serve many users over HTTP instead of the prompt loop (default 127.0.0.1:8080)")
+    parser.add_argument("--workers", type=int, default=16, help="requests the server handles at once")
+    parser.add_argument("--max-sessions", type=int, default=1000, help="sessions kept before the least recently used is evicted")
+    parser.add_argument("--session-ttl", type=float, default=1800, help="seconds an idle session is kept")
+    parser.add_argument("--per-user", type=int, default=2, help="prompts one user may have running at once")
+    parser.add_argument("--authorize", metavar="USER", help="authorize calendar access for a server user and exit")
+    parser.add_argument("--no-local-intents", action="store_true", help="send every prompt to the model")
+    args = parser.parse_args()
+
+    LOCAL_INTENTS = not args.no_local_intents
+
+    if args.profile or args.trace:
+        configure_tracing(profile=args.profile, trace_path=args.trace, trace_format=args.trace_format)
+
+    if args.startup_report:
+        startup_report()
+    elif args.authorize:
+        authorize_user(args.authorize)
+    elif args.serve:
+        host, _, port = args.serve.rpartition(":")
+        serve(host=host or "127.0.0.1", port=int(port), workers=args.workers, max_sessions=args.max_sessions,
+              session_ttl=args.session_ttl, per_user_concurrency=args.per_user)
+    elif args.use_async:
+        asyncio.run(amain(stream=args.stream, timings=args.timings, profile=args.profile))
+    else:
+        main(stream=args.stream, timings=args.timings, profile=args.profile)
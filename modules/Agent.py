@@ -1,4 +1,3 @@
-import pandas as pd
 from modules.GoogleAPI import GoogleAPI
 
 class Agent():
@@ -9,6 +8,9 @@ class Agent():
 
     def getAnswer(self, prompt, redoFlag=False):
         return self.gen.getResponse(prompt, context="")
+
+    async def getAnswerAsync(self, prompt, redoFlag=False):
+        return await self.gen.getResponseAsync(prompt, context="")
     
     def createEvent(self, start, end, name, description):
         newEvent = {
@@ -22,13 +24,12 @@ class Agent():
             }
         }
 
-        retry = 1
-        while retry <= 3:
-            response = self.gCal.createEvent(newEvent)
-            if response is None:
-                retry += 1
-                print(f"Trying Again... {retry}/3")
-            else:
-                return response
-            
-        return "Event Could Not be Created"
\ No newline at end of file
+        result = self.createEvents([newEvent])[0]
+        if result['status'] == 'created':
+            return result['event'].get('htmlLink')
+
+        return "Event Could Not be Created"
+
+    def createEvents(self, events):
+        # Batched insert; failed events are retried with exponential backoff by the inserter
+        return self.cal.createEvents(events)
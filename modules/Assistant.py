@@ -0,0 +1,364 @@
+import asyncio
+import sys
+import time
+
+from google.genai import types
+
+from modules.Tracer import tracer
+
+def usageAttributes(usage):
+    """
+    Token counts of a response's usage_metadata, as span attributes.
+    """
+
+    if usage is None:
+        return {}
+    return {
+        "tokens.prompt": usage.prompt_token_count,
+        "tokens.output": usage.candidates_token_count,
+        "tokens.thoughts": usage.thoughts_token_count,
+        "tokens.cached": usage.cached_content_token_count,
+    }
+
+class StreamBuffer():
+    """
+    Collects the chunks of a streamed response: text is written out as it arrives, while
+    function-call parts are held back until the stream ends so they can be dispatched together.
+    """
+
+    def __init__(self, out, started):
+        self.out = out
+        self.started = started
+        self.firstToken = None
+        self.text = []
+        self.callParts = []
+        self.usage = None
+
+    def add(self, chunk):
+        # The final chunk carries the usage totals of the whole response
+        self.usage = chunk.usage_metadata or self.usage
+        if not chunk.candidates or chunk.candidates[0].content is None:
+            return
+        for part in chunk.candidates[0].content.parts or []:
+            if part.function_call:
+                self.callParts.append(part)
+            elif part.text and not part.thought:
+                if self.firstToken is None:
+                    self.firstToken = time.perf_counter() - self.started
+                self.out.write(part.text)
+                self.out.flush()
+                self.text.append(part.text)
+
+    def content(self):
+        parts = [types.Part(text="".join(self.text))] if self.text else []
+        return types.Content(role="model", parts=parts + self.callParts)
+
+    def functionCalls(self):
+        return [part.function_call for part in self.callParts]
+
+class Assistant():
+    """
+    One conversation with Gemini: the history plus the function-calling loop of a turn.
+
+    The GenAI client and the tool dispatcher can be shared by many Assistant instances, so a
+    single process can hold many sessions. runTurnAsync uses client.aio so concurrent sessions
+    (and background calendar work) proceed while a turn waits on the model. The stream variants
+    print text as it arrives. With a HistoryManager the history is kept inside a token budget
+    before every turn, a contextProvider refreshes the calendar context for each prompt, and an
+    AnswerCache answers repeated read-only prompts without calling the model. An IntentRouter
+    answers routine commands with a single local tool call. Every turn appends its
+    time-to-first-token and total time, in seconds, to turnStats, and runs inside a 'turn'
+    trace span.
+    """
+
+    def __init__(self, client, config, dispatcher, history=None, model="gemini-2.5-flash", maxToolRounds=5, echo=True,
+                 historyManager=None, contextProvider=None, answerCache=None, scheduler=None, router=None):
+        self.client = client
+        self.config = config
+        self.dispatcher = dispatcher
+        self.history = history if history is not None else []
+        self.model = model
+        self.maxToolRounds = maxToolRounds
+        self.echo = echo
+        self.turnStats = []
+        self.historyManager = historyManager
+        # contextProvider(prompt) returns calendar context for the turn, sent as the system
+        # instruction so it reflects the prompt's time window and the latest calendar state
+        self.contextProvider = contextProvider
+        self.turnConfig = config
+        # Answers to read-only prompts; turns that called a write tool are never cached
+        self.answerCache = answerCache
+        self._cacheContext = ""
+        # ApiScheduler that rate limits and retries model calls; they are sent directly when None
+        self.scheduler = scheduler
+        # IntentRouter for commands that need no model call; everything goes to the model when None
+        self.router = router
+
+    def _startTurn(self, prompt):
+        self.history.append(types.Content(role="user", parts=[types.Part(text=prompt)]))
+        if self.historyManager is not None:
+            self.historyManager.compact(self.history)
+        if self.contextProvider is not None:
+            self.turnConfig = (self.config or types.GenerateContentConfig()).model_copy(
+                update={"system_instruction": self.contextProvider(prompt)})
+
+    def _priorTurn(self):
+        """
+        Text of the previous turn, which a follow-up prompt may refer to.
+        """
+
+        start = len(self.history) - 1
+        while start > 0 and not (self.history[start].role == "user" and any(part.text for part in self.history[start].parts or [])):
+            start -= 1
+        return "\n".join(f"{content.role}: {part.text}" for content in self.history[max(start, 0):]
+                         for part in content.parts or [] if part.text and not part.thought)
+
+    def _cachedTurn(self, prompt, started):
+        if self.answerCache is None:
+            return None
+        # Computed before the prompt joins the history, and reused to store the answer
+        self._cacheContext = self._priorTurn()
+        answer = self.answerCache.lookup(prompt, self._cacheContext)
+        if answer is None:
+            return None
+        self.history.append(types.Content(role="user", parts=[types.Part(text=prompt)]))
+        self.history.append(types.Content(role="model", parts=[types.Part(text=answer)]))
+        self._record("cached", started, None, 0)
+        return answer
+
+    def _route(self, prompt):
+        if self.router is None:
+            return None, None
+        route = self.router.route(prompt)
+        if route is None:
+            return None, None
+        call = types.FunctionCall(name=route.tool, args=route.args)
+        self._announce([call])
+        return route, call
+
+    def _routedTurn(self, prompt, route, result, started):
+        answer = self.router.reply(route, result)
+        self.history.append(types.Content(role="user", parts=[types.Part(text=prompt)]))
+        self.history.append(types.Content(role="model", parts=[types.Part(text=answer)]))
+        self._record("local", started, None, 0)
+        return answer
+
+    def _finishTurn(self, prompt, answer, wrote):
+        if self.answerCache is not None and not wrote and answer:
+            self.answerCache.store(prompt, answer, self._cacheContext)
+        return answer
+
+    def _wrote(self, functionCalls):
+        return any(functionCall.name in self.dispatcher.writeTools for functionCall in functionCalls)
+
+    def _announce(self, functionCalls):
+        if self.echo:
+            for functionCall in functionCalls:
+                print(f"Calling {functionCall.name}()")
+
+    def _stopMessage(self):
+        return f"Stopped after {self.maxToolRounds} rounds of function calls."
+
+    def _record(self, mode, started, firstToken, rounds):
+        total = time.perf_counter() - started
+        self.turnStats.append({
+            "mode": mode,
+            "ttft": firstToken if firstToken is not None else total,
+            "total": total,
+            "rounds": rounds,
+        })
+        tracer.current().set(mode=mode, rounds=rounds, ttftMs=self.turnStats[-1]["ttft"] * 1000)
+
+    def _modelSpan(self, method):
+        return tracer.span(f"model.{method}", kind="client", model=self.model, messages=len(self.history))
+
+    def _generate(self):
+        request = lambda: self.client.models.generate_content(model=self.model, contents=self.history, config=self.turnConfig)
+        return self.scheduler.call(request) if self.scheduler else request()
+
+    async def _generateAsync(self):
+        request = lambda: self.client.aio.models.generate_content(model=self.model, contents=self.history, config=self.turnConfig)
+        return await (self.scheduler.callAsync(request) if self.scheduler else request())
+
+    def _generateStream(self):
+        request = lambda: self.client.models.generate_content_stream(model=self.model, contents=self.history, config=self.turnConfig)
+        return self.scheduler.stream(request) if self.scheduler else request()
+
+    async def _generateStreamAsync(self):
+        request = lambda: self.client.aio.models.generate_content_stream(model=self.model, contents=self.history, config=self.turnConfig)
+        if self.scheduler:
+            async for chunk in self.scheduler.streamAsync(request):
+                yield chunk
+        else:
+            async for chunk in await request():
+                yield chunk
+
+    @tracer.traced("turn")
+    def runTurn(self, prompt):
+        """
+        Sends a user prompt and answers every function call the model makes, in one follow-up
+        turn per round, until it replies with text.
+
+        Parameters:
+            prompt (str): The user's input.
+
+        Returns:
+            str: The model's text reply.
+        """
+
+        started = time.perf_counter()
+        route, call = self._route(prompt)
+        if route is not None:
+            return self._routedTurn(prompt, route, self.dispatcher.run(call), started)
+        cached = self._cachedTurn(prompt, started)
+        if cached is not None:
+            return cached
+        wrote = False
+        self._startTurn(prompt)
+
+        for rounds in range(1, self.maxToolRounds + 1):
+            with self._modelSpan("generate_content") as span:
+                response = self._generate()
+                span.set(**usageAttributes(response.usage_metadata))
+            self.history.append(response.candidates[0].content)
+
+            functionCalls = self.dispatcher.functionCalls(response)
+            if not functionCalls:
+                self._record("blocking", started, None, rounds)
+                return self._finishTurn(prompt, response.text, wrote)
+
+            wrote = wrote or self._wrote(functionCalls)
+            self._announce(functionCalls)
+            self.history.append(types.Content(role="user", parts=self.dispatcher.dispatch(functionCalls)))
+
+        self._record("blocking", started, None, self.maxToolRounds)
+        return self._stopMessage()
+
+    @tracer.traced("turn")
+    async def runTurnAsync(self, prompt):
+        """
+        Async version of runTurn built on client.aio. Tool calls run on worker threads, so the
+        event loop stays free while they wait on the Calendar API.
+        """
+
+        started = time.perf_counter()
+        route, call = self._route(prompt)
+        if route is not None:
+            return self._routedTurn(prompt, route, await self.dispatcher.runAsync(call), started)
+        cached = self._cachedTurn(prompt, started)
+        if cached is not None:
+            return cached
+        wrote = False
+        await asyncio.to_thread(self._startTurn, prompt)
+
+        for rounds in range(1, self.maxToolRounds + 1):
+            with self._modelSpan("generate_content") as span:
+                response = await self._generateAsync()
+                span.set(**usageAttributes(response.usage_metadata))
+            self.history.append(response.candidates[0].content)
+
+            functionCalls = self.dispatcher.functionCalls(response)
+            if not functionCalls:
+                self._record("async", started, None, rounds)
+                return self._finishTurn(prompt, response.text, wrote)
+
+            wrote = wrote or self._wrote(functionCalls)
+            self._announce(functionCalls)
+            self.history.append(types.Content(role="user", parts=await self.dispatcher.dispatchAsync(functionCalls)))
+
+        self._record("async", started, None, self.maxToolRounds)
+        return self._stopMessage()
+
+    @tracer.traced("turn")
+    def runTurnStream(self, prompt, out=sys.stdout):
+        """
+        Streaming version of runTurn built on generate_content_stream. Text chunks are written
+        to out as they arrive; function calls are buffered and dispatched once the stream ends.
+
+        Returns:
+            str: The full text reply (already written to out).
+        """
+
+        started = time.perf_counter()
+        route, call = self._route(prompt)
+        if route is not None:
+            answer = self._routedTurn(prompt, route, self.dispatcher.run(call), started)
+            out.write(answer + "\n")
+            return answer
+        cached = self._cachedTurn(prompt, started)
+        if cached is not None:
+            out.write(cached + "\n")
+            return cached
+        wrote = False
+        firstToken = None
+        self._startTurn(prompt)
+
+        for rounds in range(1, self.maxToolRounds + 1):
+            buffer = StreamBuffer(out, started)
+            with self._modelSpan("generate_content_stream") as span:
+                for chunk in self._generateStream():
+                    buffer.add(chunk)
+                span.set(**usageAttributes(buffer.usage))
+            self.history.append(buffer.content())
+            firstToken = firstToken if firstToken is not None else buffer.firstToken
+
+            functionCalls = buffer.functionCalls()
+            if not functionCalls:
+                out.write("\n")
+                self._record("stream", started, firstToken, rounds)
+                return self._finishTurn(prompt, "".join(buffer.text), wrote)
+
+            if buffer.text:
+                out.write("\n")
+            wrote = wrote or self._wrote(functionCalls)
+            self._announce(functionCalls)
+            self.history.append(types.Content(role="user", parts=self.dispatcher.dispatch(functionCalls)))
+
+        self._record("stream", started, firstToken, self.maxToolRounds)
+        out.write(self._stopMessage() + "\n")
+        return self._stopMessage()
+
+    @tracer.traced("turn")
+    async def runTurnStreamAsync(self, prompt, out=sys.stdout):
+        """
+        Async version of runTurnStream built on client.aio.models.generate_content_stream.
+        """
+
+        started = time.perf_counter()
+        route, call = self._route(prompt)
+        if route is not None:
+            answer = self._routedTurn(prompt, route, await self.dispatcher.runAsync(call), started)
+            out.write(answer + "\n")
+            return answer
+        cached = self._cachedTurn(prompt, started)
+        if cached is not None:
+            out.write(cached + "\n")
+            return cached
+        wrote = False
+        firstToken = None
+        await asyncio.to_thread(self._startTurn, prompt)
+
+        for rounds in range(1, self.maxToolRounds + 1):
+            buffer = StreamBuffer(out, started)
+            with self._modelSpan("generate_content_stream") as span:
+                async for chunk in self._generateStreamAsync():
+                    buffer.add(chunk)
+                span.set(**usageAttributes(buffer.usage))
+            self.history.append(buffer.content())
+            firstToken = firstToken if firstToken is not None else buffer.firstToken
+
+            functionCalls = buffer.functionCalls()
+            if not functionCalls:
+                out.write("\n")
+                self._record("stream", started, firstToken, rounds)
+                return self._finishTurn(prompt, "".join(buffer.text), wrote)
+
+            if buffer.text:
+                out.write("\n")
+            wrote = wrote or self._wrote(functionCalls)
+            self._announce(functionCalls)
+            self.history.append(types.Content(role="user", parts=await self.dispatcher.dispatchAsync(functionCalls)))
+
+        self._record("stream", started, firstToken, self.maxToolRounds)
+        out.write(self._stopMessage() + "\n")
+        return self._stopMessage()
@@ -0,0 +1,23 @@
+import asyncio
+
+class AsyncCalendar():
+    """
+    asyncio wrappers around the blocking Calendar helpers.
+
+    Each call runs on a worker thread (which keeps its own pooled connection in
+    CalendarService), so awaiting a calendar request never blocks the event loop and can
+    overlap with model inference or other sessions.
+    """
+
+    def __init__(self, calendar, mirror=None):
+        self.calendar = calendar
+        self.mirror = mirror
+
+    async def sync(self, maxAge=None):
+        """
+        Refreshes the local mirror in the background; a no-op when no mirror is attached.
+        """
+
+        if self.mirror is None:
+            return None
+        return await asyncio.to_thread(self.mirror.sync, maxAge)
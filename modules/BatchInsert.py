@@ -0,0 +1,117 @@
+import time
+
+from googleapiclient.errors import HttpError
+
+from modules.RequestScheduler import THROTTLE_STATUSES, backoffDelay, classifyError
+from modules.Tracer import tracer
+
+MAX_BATCH_SIZE = 50  # the Calendar batch endpoint accepts at most 50 calls per request
+RETRYABLE_REASONS = {"rateLimitExceeded", "userRateLimitExceeded"}
+
+def isRetryable(error):
+    """
+    Returns True for an insert that was rejected by a rate limit, so it was never applied.
+    Server errors are not retried: the event may have been created, and sending it again
+    would duplicate it.
+    """
+
+    if not isinstance(error, HttpError):
+        return False
+    if error.resp.status in THROTTLE_STATUSES:
+        return True
+    return error.resp.status == 403 and any(detail.get("reason") in RETRYABLE_REASONS
+                                            for detail in (error.error_details or []) if isinstance(detail, dict))
+
+class BatchInserter():
+    """
+    Inserts many events with one HTTP round trip per 50 events using the Calendar batch
+    endpoint. Each event gets its own result, and only the parts the server rate limited are
+    sent again, after an exponential backoff with jitter that honours Retry-After.
+    Rate-limited parts are reported to the Calendar scheduler, so its adaptive limit also
+    slows other callers down.
+
+    There is one retry layer per failure: a batch request that fails as a whole has already
+    been retried by the scheduler, so its parts are not sent again here.
+    """
+
+    def __init__(self, calendar, maxRetries=4, baseDelay=0.5, maxDelay=16.0):
+        self.calendar = calendar
+        self.maxRetries = maxRetries
+        self.baseDelay = baseDelay
+        self.maxDelay = maxDelay
+
+    @tracer.traced("calendar.batch_insert")
+    def insertEvents(self, events, calendarId="primary"):
+        """
+        Inserts a list of events into a calendar.
+
+        Parameters:
+            events (list[dict]): Event resources to insert.
+            calendarId (str): The calendar to insert into. Defaults to 'primary'.
+
+        Returns:
+            list[dict]: One result per input event, in the same order, with its 'status'
+            ('created' or 'failed'), the created 'event' or the 'error', and 'attempts'.
+        """
+
+        results = [{"status": "failed", "event": None, "error": None, "attempts": 0} for _ in events]
+        pending = list(range(len(events)))
+
+        attempt = 0
+        while pending:
+            final = set()  # parts of batches the scheduler already retried as a whole
+            for offset in range(0, len(pending), MAX_BATCH_SIZE):
+                chunk = pending[offset:offset + MAX_BATCH_SIZE]
+                if not self._sendBatch(chunk, events, calendarId, results):
+                    final.update(chunk)
+
+            retry = [index for index in pending if index not in final and results[index]["status"] == "failed"
+                     and isRetryable(results[index]["error"])]
+            if not retry or attempt >= self.maxRetries:
+                break
+            # One throttling signal per round, however many parts were rejected
+            verdicts = [classifyError(results[index]["error"]) for index in retry]
+            retryAfter = max((delay for _, _, delay in verdicts if delay is not None), default=0.0)
+            throttled = any(status == 429 or reason in RETRYABLE_REASONS for status, reason, _ in verdicts)
+            if throttled:
+                self.calendar.scheduler.observe(throttled=True, retryAfter=retryAfter)
+            time.sleep(max(retryAfter, backoffDelay(attempt, self.baseDelay, self.maxDelay)))
+            attempt += 1
+            pending = retry
+
+        for result in results:
+            if result["error"] is not None:
+                result["error"] = str(result["error"])
+        tracer.current().set(events=len(events), retries=attempt,
+                             failed=sum(result["status"] == "failed" for result in results))
+        return results
+
+    def _sendBatch(self, indexes, events, calendarId, results):
+        """
+        Sends one batch and records each part's result. Returns False if the batch request
+        itself failed.
+        """
+
+        def callback(requestId, response, exception):
+            result = results[int(requestId)]
+            if exception is None:
+                result.update(status="created", event=response, error=None)
+            else:
+                result.update(status="failed", error=exception)
+
+        batch = self.calendar.new_batch_http_request(callback=callback)
+        for index in indexes:
+            request = self.calendar.events().insert(calendarId=calendarId, body=events[index])
+            # Let the batch authorize every part with the credentials of the http it runs on.
+            request.http = None
+            batch.add(request, request_id=str(index))
+            results[index]["attempts"] += 1
+
+        try:
+            self.calendar.execute(batch)
+        except HttpError as error:
+            # The batch request itself failed, so none of its parts were applied.
+            for index in indexes:
+                results[index].update(status="failed", error=error)
+            return False
+        return True
@@ -0,0 +1,189 @@
+import os
+import threading
+import time
+
+import httplib2
+import google_auth_httplib2
+from google.auth.exceptions import RefreshError
+from googleapiclient import discovery_cache
+from googleapiclient.discovery import build_from_document
+
+from modules.RequestScheduler import getScheduler
+from modules.TokenManager import AuthorizationError
+from modules.Tracer import tracer
+
+DISCOVERY_PATH = os.path.join(".cache", "calendar-v3-discovery.json")
+DISCOVERY_URL = "https://www.googleapis.com/discovery/v1/apis/calendar/v3/rest"
+
+class CalendarService():
+    """
+    Shared access point for the Google Calendar v3 API.
+
+    The discovery document is parsed once per process (and kept on disk between runs), and
+    every thread keeps its own keep-alive httplib2 connection pool. Instances are cheap
+    per-credential handles over that shared state, so every calendar call should go through
+    `CalendarService(creds, user).execute(...)` instead of calling `build()` again. Requests
+    are scheduled against the quota of the given user (the single local user when None).
+    """
+
+    _service = None
+    _resources = {}
+    _buildLock = threading.Lock()
+    _local = threading.local()
+    _statsLock = threading.Lock()
+    _stats = {
+        "builds": 0,
+        "connections": 0,
+        "reusedConnections": 0,
+        "calls": 0,
+        "errors": 0,
+        "totalLatency": 0.0,
+        "maxLatency": 0.0,
+        "lastLatency": 0.0,
+    }
+
+    discoveryPath = DISCOVERY_PATH
+    timeout = 30
+    # Connection class of the per-thread pools; benchmarks swap in a local stand-in transport
+    httpClass = httplib2.Http
+    def __init__(self, creds, user=None):
+        self.creds = creds
+        # Every request is admitted, rate limited and retried by the Calendar scheduler of the
+        # user whose quota it counts against, so one busy user never throttles another
+        self.scheduler = getScheduler("calendar", user)
+
+    @classmethod
+    def loadDocument(cls):
+        """
+        Returns the Calendar v3 discovery document, reading it from the on-disk cache when
+        present and otherwise from the copy bundled with googleapiclient (or the network).
+        """
+
+        if os.path.exists(cls.discoveryPath):
+            with open(cls.discoveryPath, "r") as f:
+                return f.read()
+
+        document = discovery_cache.get_static_doc("calendar", "v3")
+        if document is None:
+            response, content = httplib2.Http(timeout=cls.timeout).request(DISCOVERY_URL)
+            document = content.decode("utf-8")
+
+        os.makedirs(os.path.dirname(cls.discoveryPath) or ".", exist_ok=True)
+        tmpPath = f"{cls.discoveryPath}.{os.getpid()}.tmp"
+        with open(tmpPath, "w") as f:
+            f.write(document)
+        os.replace(tmpPath, cls.discoveryPath)
+        return document
+
+    @classmethod
+    def getService(cls):
+        if cls._service is None:
+            with cls._buildLock:
+                if cls._service is None:
+                    # Requests are always executed with a per-thread authorized http, so the
+                    # service itself is built credential-free and shared by every caller.
+                    cls._service = build_from_document(cls.loadDocument(), http=httplib2.Http(timeout=cls.timeout))
+                    with cls._statsLock:
+                        cls._stats["builds"] += 1
+        return cls._service
+
+    @property
+    def service(self):
+        return CalendarService.getService()
+
+    @classmethod
+    def _resource(cls, name):
+        # Building a resource object generates every one of its methods from the discovery
+        # document (about 9 ms for events), so each collection is built once and shared.
+        resource = cls._resources.get(name)
+        if resource is None:
+            resource = cls._resources.setdefault(name, getattr(cls.getService(), name)())
+        return resource
+
+    def events(self):
+        return CalendarService._resource("events")
+
+    def calendarList(self):
+        return CalendarService._resource("calendarList")
+
+    def new_batch_http_request(self, callback=None):
+        return self.service.new_batch_http_request(callback=callback)
+
+    def _http(self):
+        # httplib2.Http is not thread safe, so each thread owns one connection pool that is
+        # shared by every credential; AuthorizedHttp is only a thin wrapper around it.
+        local = CalendarService._local
+        if getattr(local, "http", None) is None:
+            local.http = CalendarService.httpClass(timeout=CalendarService.timeout)
+            with CalendarService._statsLock:
+                CalendarService._stats["connections"] += 1
+        return local.http
+
+    def execute(self, request, **kwargs):
+        """
+        Executes a prepared API request (or batch) on the calling thread's pooled connection,
+        through the Calendar scheduler: rate limited, and retried on throttling and transient
+        errors (server errors only for reads, since a failed write may have been applied).
+
+        Parameters:
+            request (googleapiclient.http.HttpRequest | BatchHttpRequest): The request to send.
+
+        Returns:
+            dict | None: The decoded API response.
+        """
+
+        pool = self._http()
+        reused = len(getattr(pool, "connections", ())) > 0
+        http = google_auth_httplib2.AuthorizedHttp(self.creds, http=pool)
+
+        start = time.perf_counter()
+        failed = False
+        with tracer.span(getattr(request, "methodId", "calendar.batch"), kind="client", reused=reused) as span:
+            if span.recording:
+                self._traceRequest(span, request)
+            try:
+                return self.scheduler.call(lambda: request.execute(http=http, **kwargs),
+                                           idempotent=getattr(request, "method", None) == "GET")
+            except RefreshError as error:
+                # The token expired and could not be renewed, so no retry would succeed
+                failed = True
+                raise AuthorizationError(f"Calendar access was revoked or has expired: {error}") from error
+            except Exception:
+                failed = True
+                raise
+            finally:
+                latency = time.perf_counter() - start
+                with CalendarService._statsLock:
+                    stats = CalendarService._stats
+                    stats["calls"] += 1
+                    stats["errors"] += failed
+                    stats["reusedConnections"] += reused
+                    stats["totalLatency"] += latency
+                    stats["maxLatency"] = max(stats["maxLatency"], latency)
+                    stats["lastLatency"] = latency
+
+    @staticmethod
+    def _traceRequest(span, request):
+        parts = getattr(request, "_order", None)
+        if parts is not None:
+            span.set(parts=len(parts))
+            return
+        span.set(method=request.method, requestBytes=len(request.body or ""))
+        # Record the size of the raw response body before it is decoded
+        postproc = request.postproc
+        def measured(response, content):
+            span.set(status=response.status, responseBytes=len(content or b""))
+            return postproc(response, content)
+        request.postproc = measured
+
+    @classmethod
+    def stats(cls):
+        """
+        Returns a snapshot of the service counters: builds, connections opened, reused
+        connections, calls, errors and per-call latency in seconds.
+        """
+
+        with cls._statsLock:
+            stats = dict(cls._stats)
+        stats["avgLatency"] = stats["totalLatency"] / stats["calls"] if stats["calls"] else 0.0
+        return stats
@@ -0,0 +1,160 @@
+import datetime
+import threading
+import time
+
+from googleapiclient.errors import HttpError
+
+from modules.EventIterator import iterPages, toUtc
+from modules.Recurrence import originalStartOf, seriesEnd
+from modules.Tracer import tracer
+
+# Everything eventToRow() stores, plus the paging and sync tokens.
+SYNC_FIELDS = "nextPageToken,nextSyncToken," \
+              "items(id,status,summary,description,location,start,end,updated,recurringEventId,htmlLink," \
+              "recurrence,originalStartTime)"
+
+def eventToRow(event, calendarId):
+    """
+    Converts a Calendar API event resource into a row for the events table.
+    """
+
+    start = event.get("start", {})
+    end = event.get("end", {})
+    row = {
+        "id": event["id"],
+        "calendarId": calendarId,
+        "summary": event.get("summary", "no title"),
+        "description": event.get("description"),
+        "location": event.get("location"),
+        "start": toUtc(start.get("dateTime", start.get("date")), start.get("timeZone")),
+        "end": toUtc(end.get("dateTime", end.get("date")), end.get("timeZone") or start.get("timeZone")),
+        "allDay": int("date" in start),
+        "status": event.get("status"),
+        "updated": event.get("updated"),
+        "recurringEventId": event.get("recurringEventId"),
+        "htmlLink": event.get("htmlLink"),
+        "recurrence": "\n".join(event["recurrence"]) if event.get("recurrence") else None,
+        "timeZone": start.get("timeZone"),
+        "originalStart": originalStartOf(event) if event.get("recurringEventId") else None,
+        "seriesEnd": None,
+    }
+    if row["recurrence"]:
+        row["seriesEnd"] = seriesEnd(row)
+    return row
+
+def cancelledInstanceRow(event, calendarId):
+    """
+    Row recording that one instance of a series was cancelled, or None when the event is not
+    an instance. It only hides that occurrence when the series is expanded.
+    """
+
+    originalStart = originalStartOf(event)
+    if originalStart is None:
+        return None
+    seriesId = event.get("recurringEventId") or event["id"].rsplit("_", 1)[0]
+    return {"id": event["id"], "calendarId": calendarId, "start": originalStart, "end": originalStart,
+            "allDay": int("date" in (event.get("originalStartTime") or {})), "status": "cancelled",
+            "updated": event.get("updated"), "recurringEventId": seriesId, "originalStart": originalStart}
+
+class CalendarSync():
+    """
+    Keeps the events table of a Database in step with one Google Calendar.
+
+    The first sync pulls every event and stores the returned syncToken; later syncs only ask
+    for what changed since then. Cancelled events are removed from the table, and an expired
+    token (HTTP 410) falls back to a fresh full pull.
+
+    Recurring events are not expanded by the API (singleEvents=False): each series arrives
+    once with its rule, and only the instances that differ from it come separately, as
+    exceptions. The Database expands series locally when they are read.
+    """
+
+    def __init__(self, calendar, database, calendarId="primary", pageSize=2500):
+        self.calendar = calendar
+        self.db = database
+        self.calendarId = calendarId
+        self.pageSize = pageSize
+        self.lastSync = None
+        self._lock = threading.Lock()
+
+    @tracer.traced("sync")
+    def sync(self, maxAge=None):
+        """
+        Brings the local mirror up to date.
+
+        Parameters:
+            maxAge (float): Skip the sync when the last one finished less than maxAge seconds ago.
+
+        Returns:
+            dict: The sync mode ('full', 'incremental' or 'skipped') with upserted/deleted counts.
+        """
+
+        with self._lock:
+            if maxAge is not None and self.lastSync is not None and time.monotonic() - self.lastSync < maxAge:
+                return {"mode": "skipped", "upserted": 0, "deleted": 0}
+
+            syncToken = self.db.getSyncToken(self.calendarId)
+            try:
+                result = self._pull(syncToken)
+            except HttpError as error:
+                if syncToken is None or error.resp.status != 410:
+                    raise
+                # The server invalidated our token, so start over from a full pull.
+                result = self._pull(None)
+
+            self.lastSync = time.monotonic()
+            tracer.current().set(**result)
+            return result
+
+    def _pull(self, syncToken):
+        full = syncToken is None
+        seen = set()
+        upserted = deleted = 0
+        params = {"calendarId": self.calendarId, "singleEvents": False, "maxResults": self.pageSize, "fields": SYNC_FIELDS}
+        if syncToken is not None:
+            params["syncToken"] = syncToken
+
+        # The next page downloads while this one is written to SQLite.
+        for page in iterPages(self.calendar, **params):
+            upserts, cancelled = self._rows(page.get("items", []))
+            seen.update(row["id"] for row in upserts)
+
+            upserted += self.db.upsertEvents(upserts)
+            deleted += self.db.deleteEvents(self.calendarId, cancelled)
+
+        if full:
+            deleted += self.db.pruneEvents(self.calendarId, seen)
+
+        now = datetime.datetime.now(tz=datetime.timezone.utc).isoformat()
+        self.db.setSyncToken(self.calendarId, page.get("nextSyncToken"), now)
+        return {"mode": "full" if full else "incremental", "upserted": upserted, "deleted": deleted}
+
+    def _rows(self, events):
+        """
+        Splits API events into rows to store and ids to delete. A cancelled instance of a
+        series is kept as a marker, so the series does not bring that occurrence back.
+        """
+
+        upserts, cancelled = [], []
+        for event in events:
+            if event.get("status") != "cancelled":
+                upserts.append(eventToRow(event, self.calendarId))
+                continue
+            marker = cancelledInstanceRow(event, self.calendarId)
+            if marker is not None:
+                upserts.append(marker)
+            else:
+                cancelled.append(event["id"])
+        return upserts, cancelled
+
+    def applyEvents(self, events):
+        """
+        Writes events the assistant created or changed straight into the mirror, so they are
+        visible before the next sync.
+        """
+
+        upserts, cancelled = self._rows(events)
+        return self.db.upsertEvents(upserts) + self.db.deleteEvents(self.calendarId, cancelled)
+
+    def getEvents(self, start=None, end=None, limit=None):
+        return self.db.getEvents(start=start, end=end, calendarId=self.calendarId, limit=limit)
@@ -0,0 +1,169 @@
+import datetime
+import re
+
+from dateutil import parser as dateparser
+from dateutil.relativedelta import relativedelta
+
+from modules.Tracer import tracer
+
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+MONTHS = ["january", "february", "march", "april", "may", "june", "july", "august",
+          "september", "october", "november", "december"]
+EXPLICIT_DATE = re.compile(r"\b(\d{4}-\d{1,2}-\d{1,2}|\d{1,2}/\d{1,2}(/\d{2,4})?|(" +
+                           "|".join(month[:3] for month in MONTHS) + r")[a-z]*\.? \d{1,2}(st|nd|rd|th)?)\b")
+
+def parseUtc(value):
+    return datetime.datetime.strptime(value, "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=datetime.timezone.utc)
+
+def promptWindow(prompt, now, defaultDays=7):
+    """
+    Guesses the time window a prompt is about.
+
+    Parameters:
+        prompt (str): The user's input.
+        now (datetime.datetime): The current time in the user's timezone.
+        defaultDays (int): Length of the window starting at the current hour when nothing matches.
+
+    Returns:
+        tuple[datetime.datetime, datetime.datetime]: The [start, end) window.
+    """
+
+    text = prompt.lower()
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    startOfWeek = today - datetime.timedelta(days=today.weekday())
+
+    if "tomorrow" in text:
+        return today + datetime.timedelta(days=1), today + datetime.timedelta(days=2)
+    if "yesterday" in text:
+        return today - datetime.timedelta(days=1), today
+    if "today" in text or "tonight" in text:
+        return today, today + datetime.timedelta(days=1)
+    if "next weekend" in text:
+        return startOfWeek + datetime.timedelta(days=12), startOfWeek + datetime.timedelta(days=14)
+    if "weekend" in text:
+        return startOfWeek + datetime.timedelta(days=5), startOfWeek + datetime.timedelta(days=7)
+    if "next week" in text:
+        return startOfWeek + datetime.timedelta(days=7), startOfWeek + datetime.timedelta(days=14)
+    if "this week" in text:
+        return today, startOfWeek + datetime.timedelta(days=7)
+    if "next month" in text:
+        first = today.replace(day=1) + relativedelta(months=1)
+        return first, first + relativedelta(months=1)
+    if "this month" in text:
+        return today, today.replace(day=1) + relativedelta(months=1)
+
+    for index, weekday in enumerate(WEEKDAYS):
+        if re.search(rf"\b{weekday}\b", text):
+            offset = (index - today.weekday()) % 7
+            if f"next {weekday}" in text and offset == 0:
+                offset = 7
+            day = today + datetime.timedelta(days=offset)
+            return day, day + datetime.timedelta(days=1)
+
+    match = EXPLICIT_DATE.search(text)
+    if match:
+        try:
+            day = dateparser.parse(match.group(0), default=today.replace(tzinfo=None)).replace(tzinfo=today.tzinfo)
+        except (ValueError, OverflowError):
+            day = None
+        if day is not None:
+            if day < today - datetime.timedelta(days=180):
+                day += relativedelta(years=1)
+            return day, day + datetime.timedelta(days=1)
+
+    for index, month in enumerate(MONTHS):
+        # A bare "may" is far more often the verb than the month
+        if month != "may" and re.search(rf"\b{month}\b", text):
+            first = today.replace(day=1, month=index + 1)
+            if first < today.replace(day=1):
+                first += relativedelta(years=1)
+            return first, first + relativedelta(months=1)
+
+    # Rounded to the hour so repeated prompts map to the same cached window
+    hour = now.replace(minute=0, second=0, microsecond=0)
+    return hour, hour + datetime.timedelta(days=defaultDays)
+
+class ContextBuilder():
+    """
+    Builds the calendar context sent to the model for each prompt.
+
+    Only the events in the window the prompt is about are included, in a dense one-line-per-
+    event format with day offsets relative to today, and occurrences of the same recurring
+    series are collapsed into one line. Results are cached per window and reused until the
+    calendar version changes (e.g. after a sync or an insert).
+    """
+
+    def __init__(self, fetch, version=lambda: 0, tz=None, maxEvents=40, cacheSize=16):
+        # fetch(startUtc, endUtc) returns events with UTC 'start'/'end' strings, a 'summary',
+        # and optionally 'allDay' and 'recurringEventId', ordered by start.
+        self.fetch = fetch
+        self.version = version
+        self.tz = tz
+        self.maxEvents = maxEvents
+        self.cacheSize = cacheSize
+        self._cache = {}
+        self.builds = 0
+        self.hits = 0
+
+    def now(self):
+        return datetime.datetime.now(tz=self.tz).astimezone(self.tz)
+
+    @tracer.traced("context.build")
+    def build(self, prompt, now=None):
+        """
+        Returns the context text for a prompt.
+        """
+
+        now = now or self.now()
+        start, end = promptWindow(prompt, now)
+        key = (start.isoformat(), end.isoformat(), now.date().isoformat(), self.version())
+        if key in self._cache:
+            self.hits += 1
+            tracer.current().set(cached=True)
+            return self._cache[key]
+
+        toApi = lambda value: value.astimezone(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+        events = self.fetch(toApi(start), toApi(end))
+        text = self.encode(events, now, start, end)
+
+        if len(self._cache) >= self.cacheSize:
+            self._cache.pop(next(iter(self._cache)))
+        self._cache[key] = text
+        self.builds += 1
+        tracer.current().set(cached=False, events=len(events), chars=len(text))
+        return text
+
+    def encode(self, events, now, start, end):
+        today = now.date()
+        header = (f"Calendar events {start:%a %Y-%m-%d %H:%M} to {end:%a %Y-%m-%d %H:%M} {now:%Z}. "
+                  f"Today is d+0 = {now:%a %Y-%m-%d}, now {now:%H:%M}. "
+                  f"Format: day offsets start-end summary; '*' marks a recurring series.")
+
+        lines = {}
+        for event in events:
+            eventStart = parseUtc(event["start"])
+            if event.get("allDay"):
+                # All-day events are stored as midnight UTC of their calendar date
+                offset = (eventStart.date() - today).days
+                span = "all-day"
+            else:
+                eventStart = eventStart.astimezone(now.tzinfo)
+                eventEnd = parseUtc(event["end"]).astimezone(now.tzinfo)
+                offset = (eventStart.date() - today).days
+                span = f"{eventStart:%H:%M}-{eventEnd:%H:%M}"
+            series = event.get("recurringEventId")
+            key = (series, span, event["summary"]) if series else (event.get("id") or id(event),)
+            if key not in lines:
+                lines[key] = {"offsets": [], "span": span, "summary": event["summary"], "series": bool(series)}
+            lines[key]["offsets"].append(offset)
+
+        body = []
+        for line in list(lines.values())[:self.maxEvents]:
+            offsets = ",".join(f"{offset:+d}" for offset in line["offsets"])
+            body.append(f"d{offsets} {line['span']} {line['summary']}{' *' if line['series'] else ''}")
+        if len(lines) > self.maxEvents:
+            body.append(f"... {len(lines) - self.maxEvents} more")
+        if not body:
+            body.append("(no events)")
+
+        return header + "\n" + "\n".join(body)
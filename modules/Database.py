@@ -1,24 +1,290 @@
+import heapq
+import itertools
+import threading
+
 import sqlalchemy as db
-import pandas as pd
+
+from modules import Recurrence
+from modules.Tracer import tracer
+
+EVENT_COLUMNS = ["id", "calendarId", "summary", "description", "location", "start", "end",
+                 "allDay", "status", "updated", "recurringEventId", "htmlLink",
+                 "recurrence", "timeZone", "originalStart", "seriesEnd"]
+
+# Columns added after the first release, migrated onto existing tables
+SERIES_COLUMNS = {"recurrence": "TEXT", "timeZone": "TEXT", "originalStart": "TEXT", "seriesEnd": "TEXT"}
 
 class Database():
+    """
+    The local events mirror.
+
+    A recurring series is stored once, as a row whose 'recurrence' holds its rule lines and
+    whose start and end are those of its first instance. Instances the user changed or
+    cancelled are stored as rows of their own with recurringEventId and the originalStart they
+    replace (cancelled ones only to hide that occurrence). Reads expand each series lazily
+    within the requested window and merge its instances with the stored events, so callers
+    see one row per occurrence as before.
+    """
+
     def __init__(self, path=None, load=None):
         self.path = path
         self.engine = db.create_engine(self.path)
+        # Bumped on every write so callers can tell when cached views of the table are stale.
+        self.version = 0
+        self._versionLock = threading.Lock()
 
-        with self.engine.connect() as connection:
+        with self.engine.begin() as connection:
             if load is None:
-                connection.execute(db.text("CREATE TABLE IF NOT EXISTS events (id INTEGER PRIMARY KEY, " \
-                                                                              "eventName TEXT, " \
-                                                                              "eventStartTime TEXT, " \
-                                                                              "eventEnd Time TEXT, " \
-                                                                              "eventDescription TEXT);"))
+                self._createTables(connection)
             else:
                 load.to_sql('events', con=self.engine, if_exists='replace', index=False)
 
+    def _createTables(self, connection):
+        columns = [row[1] for row in connection.execute(db.text("PRAGMA table_info(events);"))]
+        if columns and "calendarId" not in columns:
+            # The original placeholder table was never populated, so it is safe to replace.
+            connection.execute(db.text("DROP TABLE events;"))
+            columns = []
+
+        connection.execute(db.text("CREATE TABLE IF NOT EXISTS events (id TEXT NOT NULL, " \
+                                                                      "calendarId TEXT NOT NULL, " \
+                                                                      "summary TEXT, " \
+                                                                      "description TEXT, " \
+                                                                      "location TEXT, " \
+                                                                      "start TEXT NOT NULL, " \
+                                                                      "end TEXT NOT NULL, " \
+                                                                      "allDay INTEGER NOT NULL DEFAULT 0, " \
+                                                                      "status TEXT, " \
+                                                                      "updated TEXT, " \
+                                                                      "recurringEventId TEXT, " \
+                                                                      "htmlLink TEXT, " \
+                                                                      "recurrence TEXT, " \
+                                                                      "timeZone TEXT, " \
+                                                                      "originalStart TEXT, " \
+                                                                      "seriesEnd TEXT, " \
+                                                                      "PRIMARY KEY (calendarId, id));"))
+        connection.execute(db.text("CREATE TABLE IF NOT EXISTS sync_state (calendarId TEXT PRIMARY KEY, " \
+                                                                          "syncToken TEXT, " \
+                                                                          "lastSync TEXT);"))
+
+        missing = [column for column in SERIES_COLUMNS if columns and column not in columns]
+        for column in missing:
+            connection.execute(db.text(f"ALTER TABLE events ADD COLUMN {column} {SERIES_COLUMNS[column]};"))
+        if missing:
+            # Mirrors from before series were stored hold every instance separately, and their
+            # sync tokens belong to that query: start over with a full pull, which prunes them
+            connection.execute(db.text("DELETE FROM sync_state;"))
+
+        connection.execute(db.text("CREATE INDEX IF NOT EXISTS idx_events_start ON events (calendarId, start);"))
+        connection.execute(db.text("CREATE INDEX IF NOT EXISTS idx_events_end ON events (calendarId, end);"))
+        connection.execute(db.text("CREATE INDEX IF NOT EXISTS idx_events_series ON events (calendarId, recurringEventId);"))
+
+    def _bump(self):
+        with self._versionLock:
+            self.version += 1
+
+    @tracer.traced("db.upsertEvents")
+    def upsertEvents(self, rows):
+        """
+        Inserts or replaces event rows (dicts keyed by EVENT_COLUMNS) in one transaction.
+        """
+
+        if not rows:
+            return 0
+
+        placeholders = ", ".join(f":{column}" for column in EVENT_COLUMNS)
+        statement = db.text(f"INSERT OR REPLACE INTO events ({', '.join(EVENT_COLUMNS)}) VALUES ({placeholders});")
+        tracer.current().set(rows=len(rows))
+        with self.engine.begin() as connection:
+            connection.execute(statement, [{column: row.get(column) for column in EVENT_COLUMNS} for row in rows])
+        self._bump()
+        return len(rows)
+
+    @tracer.traced("db.deleteEvents")
+    def deleteEvents(self, calendarId, ids):
+        """
+        Deletes events by id, along with the stored exceptions of any that are series.
+        """
+
+        if not ids:
+            return 0
+
+        with self.engine.begin() as connection:
+            connection.execute(db.text("DELETE FROM events WHERE calendarId = :calendarId " \
+                                       "AND (id = :id OR recurringEventId = :id);"),
+                               [{"calendarId": calendarId, "id": eventId} for eventId in ids])
+        self._bump()
+        return len(ids)
+
+    @tracer.traced("db.pruneEvents")
+    def pruneEvents(self, calendarId, keepIds):
+        """
+        Deletes every event of a calendar whose id is not in keepIds. Used after a full sync.
+        """
+
+        with self.engine.connect() as connection:
+            stored = connection.execute(db.text("SELECT id FROM events WHERE calendarId = :calendarId;"),
+                                        {"calendarId": calendarId}).scalars().all()
+        return self.deleteEvents(calendarId, [eventId for eventId in stored if eventId not in keepIds])
+
+    @staticmethod
+    def _filters(start, end, calendarId):
+        """
+        WHERE clauses and parameters selecting the stored single events and exceptions
+        overlapping [start, end); series and cancelled instances are left out.
+        """
+
+        clauses, params = ["recurrence IS NULL", "(status IS NULL OR status != 'cancelled')"], {}
+        if calendarId is not None:
+            clauses.append("calendarId = :calendarId")
+            params["calendarId"] = calendarId
+        if start is not None:
+            clauses.append("end > :start")
+            params["start"] = start
+        if end is not None:
+            clauses.append("start < :end")
+            params["end"] = end
+        return clauses, params
+
+    def _instances(self, connection, start, end, calendarId, includeAllDay=True):
+        """
+        One lazy, start-ordered iterator of instance rows per series overlapping [start, end).
+        """
+
+        clauses, params = ["recurrence IS NOT NULL"], {}
+        if calendarId is not None:
+            clauses.append("calendarId = :calendarId")
+            params["calendarId"] = calendarId
+        if start is not None:
+            clauses.append("(seriesEnd IS NULL OR seriesEnd > :start)")
+            params["start"] = start
+        if end is not None:
+            clauses.append("start < :end")
+            params["end"] = end
+        if not includeAllDay:
+            clauses.append("allDay = 0")
+
+        series = [dict(row) for row in connection.execute(
+            db.text(f"SELECT {', '.join(EVENT_COLUMNS)} FROM events WHERE {' AND '.join(clauses)};"), params).mappings()]
+        if not series:
+            return []
+
+        # Original starts of the instances that were changed or cancelled, per series
+        exceptions = {}
+        query = "SELECT calendarId, recurringEventId, originalStart FROM events WHERE originalStart IS NOT NULL"
+        if calendarId is not None:
+            query += " AND calendarId = :calendarId"
+        for row in connection.execute(db.text(query), {"calendarId": calendarId} if calendarId is not None else {}):
+            exceptions.setdefault((row[0], row[1]), set()).add(row[2])
+
+        return [Recurrence.occurrences(row, start, end, exceptions.get((row["calendarId"], row["id"]), frozenset()))
+                for row in series]
+
+    @tracer.traced("db.getEvents")
+    def getEvents(self, start=None, end=None, calendarId=None, limit=None):
+        """
+        Returns the events overlapping [start, end) ordered by start time, with the instances
+        of recurring series expanded.
+
+        Parameters:
+            start (str): Lower bound as a UTC ISO timestamp. Open when None.
+            end (str): Upper bound as a UTC ISO timestamp. Open when None.
+            calendarId (str): Restrict to one calendar. All calendars when None.
+            limit (int): Maximum number of rows to return.
+
+        Returns:
+            list[dict]: One dict per event, keyed by EVENT_COLUMNS.
+        """
+
+        clauses, params = self._filters(start, end, calendarId)
+        query = f"SELECT {', '.join(EVENT_COLUMNS)} FROM events WHERE {' AND '.join(clauses)} ORDER BY start"
+        if limit is not None:
+            query += " LIMIT :limit"
+            params["limit"] = int(limit)
+
+        with self.engine.connect() as connection:
+            rows = [dict(row) for row in connection.execute(db.text(query), params).mappings()]
+            # Series that never end are expanded up to a horizon unless a limit stops them first
+            instances = self._instances(connection, start, end if end is not None or limit is not None else Recurrence.horizon(),
+                                        calendarId)
+        if instances:
+            merged = heapq.merge(rows, *instances, key=lambda row: row["start"])
+            rows = list(itertools.islice(merged, int(limit)) if limit is not None else merged)
+        tracer.current().set(rows=len(rows), series=len(instances))
+        return rows
+
+    @tracer.traced("db.getSyncToken")
+    def getSyncToken(self, calendarId):
+        with self.engine.connect() as connection:
+            return connection.execute(db.text("SELECT syncToken FROM sync_state WHERE calendarId = :calendarId;"),
+                                      {"calendarId": calendarId}).scalar()
+
+    @tracer.traced("db.setSyncToken")
+    def setSyncToken(self, calendarId, syncToken, lastSync=None):
+        with self.engine.begin() as connection:
+            connection.execute(db.text("INSERT OR REPLACE INTO sync_state (calendarId, syncToken, lastSync) " \
+                                       "VALUES (:calendarId, :syncToken, :lastSync);"),
+                               {"calendarId": calendarId, "syncToken": syncToken, "lastSync": lastSync})
+
+    @tracer.traced("db.queryEvents")
+    def queryEvents(self, start=None, end=None, calendarId=None, columns=None, includeAllDay=True):
+        """
+        Reads the events overlapping [start, end) into a DataFrame, with the filters applied by
+        SQLite and only the requested columns read. Series are expanded into their instances,
+        up to the expansion horizon when end is None. 'start' and 'end' are returned as UTC
+        datetime64 columns and 'allDay' as bool.
+
+        Parameters:
+            start (str): Lower bound as a UTC ISO timestamp. Open when None.
+            end (str): Upper bound as a UTC ISO timestamp. Open when None.
+            calendarId (str): Restrict to one calendar. All calendars when None.
+            columns (list[str]): Columns to read, from EVENT_COLUMNS. All of them when None.
+            includeAllDay (bool): Include all-day events.
+
+        Returns:
+            pandas.DataFrame: One row per event ordered by start time.
+        """
+
+        import pandas as pd  # only needed here, and slow to import
+
+        columns = list(columns or EVENT_COLUMNS)
+        unknown = set(columns) - set(EVENT_COLUMNS)
+        if unknown:
+            raise ValueError(f"Unknown event columns: {', '.join(sorted(unknown))}")
+
+        clauses, params = self._filters(start, end, calendarId)
+        if not includeAllDay:
+            clauses.append("allDay = 0")
+        query = f"SELECT {', '.join(columns)} FROM events WHERE {' AND '.join(clauses)} ORDER BY start"
+
+        with self.engine.connect() as connection:
+            instances = self._instances(connection, start, end if end is not None else Recurrence.horizon(),
+                                        calendarId, includeAllDay)
+            if instances and "start" not in columns:
+                # Needed to put the expanded instances in order, dropped afterwards
+                query = query.replace("SELECT ", "SELECT start, ", 1)
+            frame = pd.read_sql(db.text(query), connection, params=params)
+        if instances:
+            expanded = pd.DataFrame([{column: row[column] for column in frame.columns} for row in heapq.merge(
+                *instances, key=lambda row: row["start"])], columns=frame.columns)
+            frame = pd.concat([frame, expanded], ignore_index=True) if len(frame) else expanded
+            frame = frame.sort_values("start", kind="stable", ignore_index=True)[columns]
+        for column in ("start", "end"):
+            if column in frame:
+                # Stored as YYYY-MM-DDTHH:MM:SSZ strings, which SQLite compares as text
+                frame[column] = pd.to_datetime(frame[column], utc=True, format="ISO8601")
+        if "allDay" in frame:
+            frame["allDay"] = frame["allDay"].astype(bool)
+        tracer.current().set(rows=len(frame))
+        return frame
+
     def returnDatabase(self, options=None):
-        df = pd.read_sql("SELECT * FROM events", con=self.engine)
-        return df
-    
+        """
+        Returns the events table as a DataFrame. options holds queryEvents() keyword arguments
+        (start, end, calendarId, columns, includeAllDay); the whole table when None.
+        """
+
+        return self.queryEvents(**(options or {}))
+
     def __str__(self):
-        return str(self.returnDatabase())
\ No newline at end of file
+        return str(self.returnDatabase())
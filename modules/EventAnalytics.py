@@ -0,0 +1,152 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+
+WEEKDAYS = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+
+def localZone(tz=None):
+    return tz or datetime.datetime.now().astimezone().tzinfo
+
+def toTimestamp(value):
+    """
+    Converts an RFC 3339 string or a datetime to a UTC pandas Timestamp. Naive values are UTC.
+    """
+
+    timestamp = pd.Timestamp(value)
+    return timestamp.tz_localize("UTC") if timestamp.tzinfo is None else timestamp.tz_convert("UTC")
+
+def toEpochs(values):
+    """
+    Converts a UTC datetime64 Series or DatetimeIndex to int64 epoch seconds.
+    """
+
+    return np.asarray(values.astype("datetime64[ns, UTC]").astype("int64")) // 10**9
+
+def coveredSeconds(starts, ends, edges):
+    """
+    Returns, for each pair of consecutive edges, the total seconds the events spend between them.
+
+    Uses the running total F(t) = sum(clip(t - start, 0, end - start)), evaluated at every edge
+    from sorted prefix sums, so the cost is O((events + edges) log events) and memory stays
+    linear however many bins there are. Overlapping events are counted once each.
+    """
+
+    def elapsed(points):
+        # sum(t - point) over the points before each edge t
+        points = np.sort(points)
+        prefix = np.concatenate(([0], np.cumsum(points)))
+        before = np.searchsorted(points, edges, side="left")
+        return before * edges - prefix[before]
+
+    return np.diff(elapsed(starts) - elapsed(ends))
+
+class EventAnalytics():
+    """
+    Vectorized workload statistics over the events of a window.
+
+    Events are read once through Database.queryEvents() as epoch arrays, and every statistic
+    is one vectorized pass over a set of local-time bins (days, weeks or hours), so an event
+    crossing midnight is split between the days it touches. All-day
+    events are left out: they mark days rather than book time.
+    """
+
+    def __init__(self, frame, windowStart, windowEnd, tz=None):
+        self.tz = localZone(tz)
+        self.windowStart = toTimestamp(windowStart)
+        self.windowEnd = toTimestamp(windowEnd)
+        if self.windowEnd <= self.windowStart:
+            raise ValueError("The window must end after it starts")
+
+        frame = frame[~frame["allDay"]] if "allDay" in frame else frame
+        self.count = len(frame)
+        lo, hi = self._epoch(self.windowStart), self._epoch(self.windowEnd)
+        self.starts = np.clip(toEpochs(frame["start"]), lo, hi)
+        self.ends = np.clip(toEpochs(frame["end"]), lo, hi)
+
+    @classmethod
+    def fromDatabase(cls, database, windowStart, windowEnd, calendarId=None, tz=None):
+        frame = database.queryEvents(start=windowStart, end=windowEnd, calendarId=calendarId,
+                                     columns=["start", "end", "allDay"])
+        return cls(frame, windowStart, windowEnd, tz=tz)
+
+    @staticmethod
+    def _epoch(timestamp):
+        return int(timestamp.value // 10**9)
+
+    def _bins(self, freq):
+        # Bin edges fall on local midnights (or hours), then are converted back to UTC
+        # (calendar offsets, so a day across a DST change is still one day)
+        localStart = self.windowStart.tz_convert(self.tz)
+        localEnd = self.windowEnd.tz_convert(self.tz)
+        if freq == "week":
+            first, step = localStart.normalize() - pd.Timedelta(days=localStart.weekday()), pd.DateOffset(weeks=1)
+        elif freq == "day":
+            first, step = localStart.normalize(), pd.DateOffset(days=1)
+        elif freq == "hour":
+            first, step = localStart.floor("h", ambiguous=False, nonexistent="shift_backward"), pd.Timedelta(hours=1)
+        else:
+            raise ValueError(f"Unknown period: {freq}")
+
+        labels = pd.date_range(first, localEnd, freq=step, inclusive="left")
+        edges = toEpochs(labels.append(pd.DatetimeIndex([labels[-1] + step])).tz_convert("UTC"))
+        return labels, edges
+
+    def hoursBooked(self, freq="day"):
+        """
+        Returns the hours booked in each day or week of the window.
+
+        Parameters:
+            freq (str): 'day' or 'week'. Weeks start on Monday.
+
+        Returns:
+            pandas.Series: Booked hours indexed by the local start of each period.
+        """
+
+        labels, edges = self._bins(freq)
+        seconds = coveredSeconds(self.starts, self.ends, edges)
+        return pd.Series(seconds / 3600.0, index=labels)
+
+    def heatmap(self):
+        """
+        Returns the booked hours per weekday and hour of day, summed over the window.
+
+        Returns:
+            pandas.DataFrame: 7 rows (Mon..Sun) by 24 columns (hour of day).
+        """
+
+        labels, edges = self._bins("hour")
+        seconds = coveredSeconds(self.starts, self.ends, edges)
+        grid = np.zeros((7, 24))
+        np.add.at(grid, (labels.weekday, labels.hour), seconds / 3600.0)
+        return pd.DataFrame(grid, index=WEEKDAYS, columns=range(24))
+
+    def busiestSlots(self, top=3):
+        """
+        Returns the weekday/hour slots with the most booked time.
+
+        Returns:
+            list[dict]: Up to top slots with their weekday, hour and booked hours, busiest first.
+        """
+
+        grid = self.heatmap().to_numpy()
+        order = np.argsort(grid, axis=None, kind="stable")[::-1][:top]
+        return [{"weekday": WEEKDAYS[index // 24], "hour": int(index % 24), "hours": round(float(grid.flat[index]), 2)}
+                for index in order if grid.flat[index] > 0]
+
+    def summary(self, freq="day", top=3):
+        """
+        Returns the total and per-period booked hours, the busiest period and the busiest slots.
+        """
+
+        booked = self.hoursBooked(freq)
+        periods = [{"start": label.strftime("%Y-%m-%d"), "hours": round(float(hours), 2)} for label, hours in booked.items()]
+        busiest = max(periods, key=lambda period: period["hours"]) if periods and booked.max() > 0 else None
+        return {
+            "events": self.count,
+            "total_hours": round(float(booked.sum()), 2),
+            "average_hours": round(float(booked.mean()), 2) if len(booked) else 0.0,
+            f"hours_per_{freq}": periods,
+            f"busiest_{freq}": busiest,
+            "busiest_slots": self.busiestSlots(top),
+        }
@@ -0,0 +1,114 @@
+import contextvars
+import datetime
+import zoneinfo
+from concurrent.futures import ThreadPoolExecutor
+
+def toUtc(value, timeZone=None):
+    """
+    Normalizes an RFC 3339 timestamp or a YYYY-MM-DD date to a sortable UTC string. A
+    timestamp without an offset is read in timeZone (an IANA name), or as UTC when None.
+    """
+
+    if len(value) == 10:
+        return f"{value}T00:00:00Z"
+    parsed = datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        try:
+            zone = zoneinfo.ZoneInfo(timeZone) if timeZone else datetime.timezone.utc
+        except (zoneinfo.ZoneInfoNotFoundError, ValueError):
+            zone = datetime.timezone.utc
+        parsed = parsed.replace(tzinfo=zone)
+    return parsed.astimezone(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+# Fetches the next page of every iterPages() call. Its threads live as long as the process,
+# so each keeps its CalendarService connection pool instead of opening one per iteration.
+prefetcher = ThreadPoolExecutor(max_workers=8, thread_name_prefix="prefetch")
+
+# Partial response projection: only the fields compactEvent() reads are sent over the wire.
+EVENT_FIELDS = "nextPageToken,nextSyncToken,items(id,status,summary,start,end,recurringEventId)"
+
+def compactEvent(event):
+    """
+    Reduces a Calendar API event resource to the few fields the assistant works with.
+    """
+
+    start = event.get("start", {})
+    end = event.get("end", {})
+    return {
+        "id": event["id"],
+        "summary": event.get("summary", "no title"),
+        "start": toUtc(start.get("dateTime", start.get("date"))),
+        "end": toUtc(end.get("dateTime", end.get("date"))),
+        "allDay": "date" in start,
+        "recurringEventId": event.get("recurringEventId"),
+    }
+
+def iterPages(calendar, prefetch=True, resource=None, **params):
+    """
+    Lazily follows nextPageToken through a list query (events().list by default), one page
+    at a time.
+
+    Parameters:
+        calendar (CalendarService): Service handle used to execute each page request.
+        prefetch (bool): Fetch the next page on a background thread while the caller
+            processes the current one. At most two pages are held in memory.
+        resource: The collection to page through. Defaults to calendar.events().
+        **params: Arguments for events().list (calendarId, timeMin, syncToken, fields...).
+
+    Yields:
+        dict: Each raw page of the events().list response.
+    """
+
+    def fetch(pageToken):
+        pageParams = dict(params)
+        if pageToken is not None:
+            pageParams["pageToken"] = pageToken
+        collection = resource if resource is not None else calendar.events()
+        return calendar.execute(collection.list(**pageParams))
+
+    future = None
+    try:
+        page = fetch(None)
+        while True:
+            pageToken = page.get("nextPageToken")
+            future = prefetcher.submit(contextvars.copy_context().run, fetch, pageToken) if prefetch and pageToken else None
+            yield page
+            if pageToken is None:
+                return
+            page = future.result() if future else fetch(pageToken)
+            future = None
+    finally:
+        # A caller that stops early does not need the page being prefetched
+        if future is not None:
+            future.cancel()
+
+def iterEvents(calendar, calendarId="primary", timeMin=None, timeMax=None, pageSize=250,
+               fields=EVENT_FIELDS, prefetch=True, **params):
+    """
+    Streams every event in a time window as compact records, in start-time order.
+
+    Parameters:
+        calendar (CalendarService): Service handle used to execute the requests.
+        calendarId (str): The calendar to read. Defaults to 'primary'.
+        timeMin (str): RFC 3339 lower bound on event end time.
+        timeMax (str): RFC 3339 upper bound on event start time.
+        pageSize (int): Events requested per page (the API caps this at 2500).
+        fields (str): Partial response projection. None requests full resources.
+        prefetch (bool): Overlap fetching the next page with consuming the current one.
+
+    Yields:
+        dict: One compactEvent() record per event.
+    """
+
+    params.update(calendarId=calendarId, maxResults=pageSize, singleEvents=True, orderBy="startTime")
+    if timeMin is not None:
+        params["timeMin"] = timeMin
+    if timeMax is not None:
+        params["timeMax"] = timeMax
+    if fields is not None:
+        params["fields"] = fields
+
+    for page in iterPages(calendar, prefetch=prefetch, **params):
+        for event in page.get("items", []):
+            if event.get("status") != "cancelled":
+                yield compactEvent(event)
@@ -2,6 +2,8 @@ from google import genai
 from google.genai import types
 import os
 
+from modules.RequestScheduler import getScheduler
+
 class GoogleAPI():
     def __init__(self, apiKey=None, model="gemini-2.5-flash"):
         self.key = apiKey
@@ -9,18 +11,31 @@ class GoogleAPI():
 
         genai.api_key = self.key
         self.client = genai.Client(api_key=self.key)
+        # Shared with every other Gemini caller in the process
+        self.scheduler = getScheduler("gemini")
 
     def getResponse(self, input=None, context=None):
-        response = self.client.models.generate_content(
+        response = self.scheduler.call(lambda: self.client.models.generate_content(
             model="gemini-2.5-flash",
             config=types.GenerateContentConfig(
             system_instruction=context
             ),
             contents=input,
-        )
+        ))
 
         # print(response.text)
 
         return response
 
-    
\ No newline at end of file
+    async def getResponseAsync(self, input=None, context=None):
+        # Same request as getResponse but through the async client, so callers can await it
+        # alongside calendar work or other sessions
+        response = await self.scheduler.callAsync(lambda: self.client.aio.models.generate_content(
+            model=self.model,
+            config=types.GenerateContentConfig(
+            system_instruction=context
+            ),
+            contents=input,
+        ))
+
+        return response
@@ -1,64 +1,43 @@
 import datetime
-import os.path
+import itertools
 
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 
+from modules.BatchInsert import BatchInserter
+from modules.CalendarService import CalendarService
+from modules.EventIterator import iterEvents
+from modules.TokenManager import TokenManager
+
 SCOPES = ["https://www.googleapis.com/auth/calendar"]
 
 class GoogleCalAPI():
-    def __init__(self, pathCred = "credentials.json", pathToken = None):
-        self.creds = None
-        # The file token.json stores the user's access and refresh tokens, and is
-        # created automatically when the authorization flow completes for the first
-        # time.
-        if os.path.exists(pathToken):
-            self.creds = Credentials.from_authorized_user_file(pathToken, SCOPES)
-        # If there are no (valid) credentials available, let the user log in.
-        if not self.creds or not self.creds.valid:
-            if self.creds and self.creds.expired and self.creds.refresh_token:
-                self.creds.refresh(Request())
-            else:
-                self.flow = InstalledAppFlow.from_client_secrets_file(
-                    pathCred, SCOPES
-                )
-                self.creds = self.flow.run_local_server(port=0)
-            # Save the credentials for the next run
-            with open("token.json", "w") as token:
-                token.write(self.creds.to_json())
+    def __init__(self, pathCred = "credentials.json", pathToken = "token.json"):
+        # The token file stores the user's access and refresh tokens, and is created
+        # automatically when the authorization flow completes for the first time. The
+        # manager is shared by everything using the same file and refreshes it ahead of expiry.
+        self.tokens = TokenManager.forPath(pathToken, pathCred, SCOPES)
+        self.creds = self.tokens.credentials(interactive=True)
+        self.tokens.start()
 
-        self.service = build("calendar", "v3", credentials=self.creds)
+        self.calendar = CalendarService(self.creds)
 
-    def getEvents(self, dayStart=datetime.datetime.now(tz=datetime.timezone.utc).isoformat()):
+    def getEvents(self, dayStart=datetime.datetime.now(tz=datetime.timezone.utc).isoformat(), dayEnd=None, quantity=10):
         try:
-            # Call the Calendar API
-            now = datetime.datetime.now(tz=datetime.timezone.utc).isoformat()
-            print("Getting the upcoming 10 events")
-            events_result = (
-                self.service.events()
-                .list(
-                    calendarId="primary",
-                    timeMin=dayStart,
-                    maxResults=10,
-                    singleEvents=True,
-                    orderBy="startTime",
-                )
-                .execute()
-            )
-            events = events_result.get("items", [])
+            # Call the Calendar API, following pages until quantity events (or the whole
+            # window when quantity is None) have been printed
+            print(f"Getting the upcoming {quantity if quantity is not None else 'all'} events")
+            pageSize = min(quantity, 250) if quantity is not None else 250
+            events = itertools.islice(iterEvents(self.calendar, timeMin=dayStart, timeMax=dayEnd, pageSize=pageSize), quantity)
+
+            found = False
+            for event in events:
+                found = True
+                print(event["start"], event["summary"])
 
-            if not events:
+            if not found:
                 print("No upcoming events found.")
                 return
 
-            # Prints the start and name of the next 10 events
-            for event in events:
-                start = event["start"].get("dateTime", event["start"].get("date"))
-                print(start, event["summary"])
-
         except Exception as error:
             print(f"An error occurred: {error}")
 
@@ -97,10 +76,13 @@ class GoogleCalAPI():
         # }
 
         try:
-            event = self.service.events().insert(calendarId='primary', body=event).execute()
+            event = self.calendar.execute(self.calendar.events().insert(calendarId='primary', body=eventDict))
             return event.get('htmlLink')
         except Exception as error:
             print(f"An error occurred: {error}")
             return None
 
-        
+    def createEvents(self, eventDicts, calendarId='primary'):
+        # Sends the events through the batch endpoint, 50 per HTTP request, and returns one
+        # result dict per event (see BatchInserter.insertEvents)
+        return BatchInserter(self.calendar).insertEvents(eventDicts, calendarId=calendarId)
@@ -0,0 +1,144 @@
+import json
+
+from google.genai import types
+
+from modules.Tracer import tracer
+
+def estimateTokens(content):
+    """
+    Cheap local token estimate for a Content (about four characters per token).
+    """
+
+    chars = 0
+    for part in content.parts or []:
+        if part.text:
+            chars += len(part.text)
+        if part.function_call:
+            chars += len(part.function_call.name or "") + len(json.dumps(part.function_call.args or {}, default=str))
+        if part.function_response:
+            chars += len(part.function_response.name or "") + len(json.dumps(part.function_response.response or {}, default=str))
+    # Every message carries a few tokens of role and framing overhead
+    return chars // 4 + 4
+
+def describe(content, limit=160):
+    """
+    One short line per part of a Content, used to build the rolling summary.
+    """
+
+    lines = []
+    for part in content.parts or []:
+        if part.text and not part.thought:
+            text = " ".join(part.text.split())
+            lines.append(f"{content.role}: {text[:limit]}{'...' if len(text) > limit else ''}")
+        elif part.function_call:
+            args = json.dumps(part.function_call.args or {}, default=str)
+            lines.append(f"called {part.function_call.name}({args[:limit]})")
+        elif part.function_response:
+            response = json.dumps(part.function_response.response or {}, default=str)
+            lines.append(f"{part.function_response.name} returned {response[:limit]}")
+    return lines
+
+class HistoryManager():
+    """
+    Keeps a conversation history inside a token budget.
+
+    The history is treated as [pinned messages, rolling summary, turns], where a turn starts
+    at a user text message and includes every function call and function response that
+    follows it, so a call is never separated from its response. The most recent turns are
+    kept word for word; when the budget is exceeded the oldest turns are folded into the
+    summary instead of being resent in full.
+    """
+
+    def __init__(self, budget=8000, keepRecent=4, pinned=1, maxSummaryTokens=600, client=None, model="gemini-2.5-flash"):
+        self.budget = budget
+        self.keepRecent = keepRecent
+        self.pinned = pinned
+        self.maxSummaryTokens = maxSummaryTokens
+        # With a client, token counts come from count_tokens (cached per message); otherwise
+        # they are estimated locally.
+        self.client = client
+        self.model = model
+        self.summaryLines = []
+        self.summaryContent = None
+        self._counts = {}
+
+    def countTokens(self, content):
+        key = id(content)
+        cached = self._counts.get(key)
+        if cached is not None and cached[0] is content:
+            return cached[1]
+
+        if self.client is not None:
+            count = self.client.models.count_tokens(model=self.model, contents=[content]).total_tokens
+        else:
+            count = estimateTokens(content)
+        self._counts[key] = (content, count)
+        return count
+
+    def totalTokens(self, history):
+        return sum(self.countTokens(content) for content in history)
+
+    @staticmethod
+    def isTurnStart(content):
+        return content.role == "user" and any(part.text for part in content.parts or [])
+
+    def splitTurns(self, messages):
+        turns = []
+        for content in messages:
+            if not turns or self.isTurnStart(content):
+                turns.append([])
+            turns[-1].append(content)
+        return turns
+
+    def _summary(self):
+        # Drop the oldest summary lines once the summary itself outgrows its budget
+        chars = sum(len(line) for line in self.summaryLines)
+        drop = 0
+        while len(self.summaryLines) - drop > 1 and chars // 4 > self.maxSummaryTokens:
+            chars -= len(self.summaryLines[drop])
+            drop += 1
+        del self.summaryLines[:drop]
+        text = "Summary of the earlier conversation:\n" + "\n".join(self.summaryLines)
+        self.summaryContent = types.Content(role="model", parts=[types.Part(text=text)])
+        return self.summaryContent
+
+    @tracer.traced("history.compact")
+    def compact(self, history):
+        """
+        Folds the oldest turns into the rolling summary until the history fits the budget.
+        The list is updated in place and also returned.
+
+        Parameters:
+            history (list[google.genai.types.Content]): The conversation to compact.
+
+        Returns:
+            list[google.genai.types.Content]: The same list.
+        """
+
+        if self.totalTokens(history) <= self.budget:
+            return history
+
+        pinned = history[:self.pinned]
+        rest = history[self.pinned:]
+        if rest and self.summaryContent is not None and rest[0] is self.summaryContent:
+            rest = rest[1:]
+
+        turns = self.splitTurns(rest)
+        # Tokens of the pinned messages and the turns still kept, less each turn as it is folded
+        total = self.totalTokens(pinned) + sum(self.totalTokens(turn) for turn in turns)
+        folded = 0
+        while len(turns) - folded > self.keepRecent:
+            if total + self.maxSummaryTokens <= self.budget:
+                break
+            for content in turns[folded]:
+                self.summaryLines.extend(describe(content))
+            total -= self.totalTokens(turns[folded])
+            folded += 1
+
+        tracer.current().set(folded=folded)
+        if folded:
+            kept = [content for turn in turns[folded:] for content in turn]
+            history[:] = pinned + [self._summary()] + kept
+            # Forget counts of folded messages so their ids cannot be mistaken for new ones
+            self._counts = {id(content): self._counts[id(content)] for content in history if id(content) in self._counts}
+        return history
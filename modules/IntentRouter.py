@@ -0,0 +1,316 @@
+import datetime
+import os
+import re
+import threading
+import zoneinfo
+
+from modules.ContextBuilder import EXPLICIT_DATE, parseUtc, promptWindow
+from modules.Tracer import tracer
+
+NUMBERS = {"a": 1, "an": 1, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7,
+           "eight": 8, "nine": 9, "ten": 10, "eleven": 11, "twelve": 12, "fifteen": 15, "twenty": 20}
+PARTS_OF_DAY = {"morning": (8, 12), "afternoon": (12, 17), "evening": (17, 21)}
+WORKDAY = (9, 18)  # hours searched for free slots when the prompt names no part of the day
+DEFAULT_QUANTITY = 10
+DEFAULT_SLOT_MINUTES = 30
+DEFAULT_EVENT_MINUTES = 60
+
+NUMBER = rf"(?:\d+|{'|'.join(NUMBERS)})"
+WEEKDAY = r"(?:mon|tues|wednes|thurs|fri|satur|sun)day"
+DAY = rf"(?:today|tonight|tomorrow|(?:on |for )?(?:this |next )?{WEEKDAY}|(?:on |for )?{EXPLICIT_DATE.pattern})"
+TIME = r"(?:noon|midnight|\d{1,2}(?::\d{2})? ?(?:am|pm|a\.m\.?|p\.m\.?)?)"
+DURATION = rf"for (?:(?P<half>half an hour)|(?P<amount>{NUMBER}|\d+\.\d+) (?P<unit>minutes?|mins?|hours?|hrs?))"
+EVENTS = r"(?:events?|meetings?|appointments?)"
+
+LIST_NEXT = re.compile(
+    rf"(?:(?:list|show|get|give)(?: me)?|what are)(?: all)?(?: of)?(?: my| the)*(?: (?P<count>{NUMBER}))?"
+    rf"(?: (?:next|upcoming|coming))?(?: (?P<count2>{NUMBER}))?(?: upcoming| calendar)? {EVENTS}(?: on my calendar)?"
+    r"|what(?:'s| is) (?:on my calendar|next|coming up)")
+LIST_WINDOW = re.compile(
+    rf"(?:what(?:'s| is)(?: on)?(?: my calendar| my schedule)?|what do i have(?: on)?|what {EVENTS} do i have"
+    rf"|(?:list|show)(?: me)?(?: my| the)? (?:{EVENTS}|schedule|calendar)(?: for| on)?)"
+    rf" (?P<when>{DAY}|this week|next week)")
+FREE = re.compile(
+    r"(?:when am i free|when(?:'s| is) my free time|do i have (?:any )?free time"
+    rf"|find (?:me )?(?:an? |some )?(?:free )?(?:time|slots?|(?P<length>\d+)[- ]?(?P<lengthUnit>minute|min|hour) slot))"
+    rf"(?: (?P<duration>{DURATION.replace('?P<', '?P<first')}))?(?: (?P<when>{DAY}))?"
+    rf"(?: (?:in the )?(?P<part>morning|afternoon|evening))?(?: (?P<duration2>{DURATION}))?")
+INSERT = re.compile(
+    r"(?:add|schedule|create|book|put|set up)(?: an?)?(?: new)?(?: (?:event|meeting|appointment) (?:called|named))?"
+    rf" (?P<title>.+?)(?: (?P<firstDuration>{DURATION.replace('?P<', '?P<first')}))?(?: (?P<when>{DAY}))?"
+    rf" (?:at (?P<at>{TIME})|from (?P<start>{TIME}) (?:to|until|-) (?P<end>{TIME}))"
+    rf"(?: (?P<when2>{DAY}))?(?: (?P<duration>{DURATION}))?(?: (?:on|to|in) my calendar)?")
+# A title that still holds a day, time or duration means the prompt did not split cleanly
+TITLE_REJECT = re.compile(rf"^(?:at|on|from|for|to)\b|\b(?:today|tonight|tomorrow|{WEEKDAY}|noon|midnight|\d{{1,2}}(?::\d{{2}})? ?(?:am|pm)\b|\d{{1,2}}:\d{{2}})|{EXPLICIT_DATE.pattern}"
+                          rf"|\bfor (?:half an hour|(?:{NUMBER}|\d+\.\d+) (?:minutes?|mins?|hours?|hrs?|days?|nights?|weeks?))\b")
+
+class Route():
+    """
+    A prompt the router understood: the tool call that answers it, plus what reply() needs.
+    """
+
+    __slots__ = ("intent", "tool", "args", "details")
+
+    def __init__(self, intent, tool, args, details=None):
+        self.intent = intent
+        self.tool = tool
+        self.args = args
+        self.details = details or {}
+
+def number(text):
+    return float(text) if "." in text else int(text) if text.isdigit() else NUMBERS[text]
+
+def minutesOf(match, prefix=""):
+    """
+    Minutes of a DURATION match, or None when the group did not match.
+    """
+
+    if match.group(f"{prefix}half"):
+        return 30
+    amount = match.group(f"{prefix}amount")
+    if amount is None:
+        return None
+    return round(number(amount) * (60 if match.group(f"{prefix}unit").startswith("h") else 1))
+
+def parseTime(text):
+    """
+    Returns (hour, minute) for a TIME match, or None when it is ambiguous: a bare hour such as
+    'at 3' could be morning or afternoon, so 12-hour times need am/pm unless written as 24-hour
+    ('15:30', '09:00').
+    """
+
+    if text == "noon":
+        return 12, 0
+    if text == "midnight":
+        return 0, 0
+    match = re.fullmatch(r"(\d{1,2})(?::(\d{2}))? ?(am|pm|a\.m\.?|p\.m\.?)?", text)
+    hour, minute, meridiem = int(match.group(1)), int(match.group(2) or 0), match.group(3)
+    if minute > 59:
+        return None
+    if meridiem:
+        if not 1 <= hour <= 12:
+            return None
+        return hour % 12 + (12 if meridiem.startswith("p") else 0), minute
+    if match.group(2) and (hour >= 13 or match.group(1).startswith("0")) and hour <= 23:
+        return hour, minute
+    return None
+
+def clean(prompt):
+    text = " ".join(prompt.strip().split())
+    text = re.sub(r"^(?:please |can you |could you |would you )+", "", text, flags=re.IGNORECASE)
+    return re.sub(r"(?:,? please)?[.?!]*$", "", text, flags=re.IGNORECASE).replace("’", "'")
+
+def localZone():
+    """
+    The machine's IANA time zone, from $TZ or /etc/localtime, so dates are localized with
+    their own DST offset. Falls back to the current fixed offset when no name is found.
+    """
+
+    names = [os.environ.get("TZ", "").lstrip(":")]
+    try:
+        names.append(os.path.realpath("/etc/localtime").split("/zoneinfo/", 1)[1])
+    except (IndexError, OSError):
+        pass
+    for name in filter(None, names):
+        try:
+            return zoneinfo.ZoneInfo(name)
+        except (zoneinfo.ZoneInfoNotFoundError, ValueError):
+            continue
+    return datetime.datetime.now().astimezone().tzinfo
+
+def zoneName(tz):
+    """
+    IANA name of a zone for an event's timeZone, or None for a fixed offset.
+    """
+
+    return getattr(tz, "key", None) or ("UTC" if tz is datetime.timezone.utc else None)
+
+def formatTime(moment):
+    return f"{moment:%H:%M}"
+
+def formatDay(moment):
+    return f"{moment:%a %b} {moment.day}"
+
+class IntentRouter():
+    """
+    Answers routine commands without calling the model.
+
+    A prompt is handled locally only when the whole of it matches one of a few fixed phrasings
+    (list upcoming events, list a day or week, find free time, add an event at an explicit
+    day and time) and every slot parses without guessing; anything else, including a bare
+    'at 3' or a title that still contains a date, falls through to the model. Dates are read
+    with the same rules as the context builder. A routed prompt becomes a single tool call, so
+    it is run, traced and cached exactly like the model's calls.
+    """
+
+    def __init__(self, tz=None):
+        # A real zone rather than today's offset, so a day across a DST change gets its own
+        self.tz = tz or localZone()
+        self._lock = threading.Lock()
+        self._stats = {"handled": 0, "fellThrough": 0, "intents": {}}
+
+    def now(self):
+        return datetime.datetime.now(tz=self.tz)
+
+    def route(self, prompt, now=None):
+        """
+        Parses a prompt into a tool call.
+
+        Parameters:
+            prompt (str): The user's input.
+            now (datetime.datetime): The current time in the user's timezone. Defaults to now().
+
+        Returns:
+            Route | None: The call that answers the prompt, or None to hand it to the model.
+        """
+
+        with tracer.span("router") as span:
+            now = now.astimezone(self.tz) if now else self.now()
+            text = clean(prompt)
+            lowered = text.lower()
+            route = None
+            for parse in (self._listNext, self._listWindow, self._freeSlots, self._insert):
+                route = parse(text, lowered, now)
+                if route is not None:
+                    break
+
+            with self._lock:
+                if route is None:
+                    self._stats["fellThrough"] += 1
+                else:
+                    self._stats["handled"] += 1
+                    self._stats["intents"][route.intent] = self._stats["intents"].get(route.intent, 0) + 1
+            span.set(intent=route.intent if route else None, handled=route is not None)
+            return route
+
+    def _listNext(self, text, lowered, now):
+        match = LIST_NEXT.fullmatch(lowered)
+        if match is None:
+            return None
+        count = match.group("count") or match.group("count2")
+        if match.group("count") and match.group("count2"):
+            return None
+        quantity = number(count) if count else DEFAULT_QUANTITY
+        if not isinstance(quantity, int) or not 1 <= quantity <= 100:
+            return None
+        return Route("list_next", "list_calendar_event", {"quantity": quantity})
+
+    def _listWindow(self, text, lowered, now):
+        match = LIST_WINDOW.fullmatch(lowered)
+        if match is None:
+            return None
+        start, end = promptWindow(match.group("when"), now)
+        return Route("list_window", "list_calendar_event",
+                     {"quantity": None, "time_min": start.isoformat(), "time_max": end.isoformat()},
+                     {"when": match.group("when"), "start": start, "end": end})
+
+    def _freeSlots(self, text, lowered, now):
+        match = FREE.fullmatch(lowered)
+        if match is None:
+            return None
+        durations = [minutes for minutes in (minutesOf(match, "first"), minutesOf(match)) if minutes]
+        if match.group("length"):
+            durations.append(int(match.group("length")) * (60 if match.group("lengthUnit") == "hour" else 1))
+        if len(durations) > 1 or any(minutes < 5 or minutes > 12 * 60 for minutes in durations):
+            return None
+        minutes = durations[0] if durations else DEFAULT_SLOT_MINUTES
+
+        when = match.group("when") or "today"
+        day, _ = promptWindow(when, now)
+        first, last = PARTS_OF_DAY.get(match.group("part"), WORKDAY)
+        start = max(day.replace(hour=first), now.replace(second=0, microsecond=0))
+        end = day.replace(hour=last)
+        if end - start < datetime.timedelta(minutes=minutes):
+            return None
+        return Route("free_slots", "free_slots",
+                     {"window_start": start.isoformat(), "window_end": end.isoformat(), "duration_minutes": minutes},
+                     {"day": day, "part": match.group("part"), "minutes": minutes})
+
+    def _insert(self, text, lowered, now):
+        match = INSERT.fullmatch(lowered)
+        if match is None:
+            return None
+        days = [when for when in (match.group("when"), match.group("when2")) if when]
+        title = text[match.start("title"):match.end("title")].strip(" ,")
+        if len(days) != 1 or not title or TITLE_REJECT.search(title.lower()):
+            return None
+        # "next friday" may mean this week's or the following one; a write should not guess
+        if re.search(rf"\bnext {WEEKDAY}", days[0]):
+            return None
+
+        day, _ = promptWindow(days[0], now)
+        if day < now.replace(hour=0, minute=0, second=0, microsecond=0):
+            return None
+        startTime = parseTime(match.group("at") or match.group("start"))
+        if startTime is None:
+            return None
+        durations = [minutes for minutes in (minutesOf(match, "first"), minutesOf(match)) if minutes]
+        if len(durations) > 1 or any(minutes < 5 or minutes > 24 * 60 for minutes in durations):
+            return None
+        # Wall-clock replace on a ZoneInfo day: the offset is that of the event's own date
+        start = day.replace(hour=startTime[0], minute=startTime[1])
+        if match.group("end"):
+            endTime = parseTime(match.group("end"))
+            if endTime is None or durations:
+                return None
+            end = day.replace(hour=endTime[0], minute=endTime[1])
+        else:
+            end = start + datetime.timedelta(minutes=durations[0] if durations else DEFAULT_EVENT_MINUTES)
+        if start < now or end <= start:
+            return None
+
+        summary = title[0].upper() + title[1:]
+        event = {"summary": summary, "start": {"dateTime": start.isoformat()}, "end": {"dateTime": end.isoformat()}}
+        if zoneName(self.tz):
+            event["start"]["timeZone"] = event["end"]["timeZone"] = zoneName(self.tz)
+        return Route("insert", "insert_calendar_event", {"event_data": event}, {"start": start, "end": end})
+
+    def _local(self, value):
+        moment = parseUtc(value) if value.endswith("Z") else datetime.datetime.fromisoformat(value)
+        return moment.astimezone(self.tz)
+
+    def reply(self, route, result):
+        """
+        Turns the tool result of a routed prompt into the text the user sees.
+        """
+
+        if "error" in result:
+            return f"Sorry, I couldn't reach your calendar: {result['error']}"
+
+        if route.tool == "list_calendar_event":
+            events = result.get("output", [])
+            if route.intent == "list_next":
+                header = f"Your next {len(events)} event(s):" if events else "You have no upcoming events."
+            else:
+                start, end = route.details["start"], route.details["end"]
+                when = f"on {formatDay(start)}" if end - start <= datetime.timedelta(days=1) else route.details["when"]
+                header = f"Your events {when}:" if events else f"You have nothing scheduled {when}."
+            lines = []
+            for event in events:
+                start, end = self._local(event["start"]), self._local(event["end"])
+                lines.append(f"- {formatDay(start)}, {formatTime(start)}-{formatTime(end)}: {event['summary']}")
+            return "\n".join([header] + lines)
+
+        if route.tool == "free_slots":
+            slots = result.get("free_slots", [])
+            day = formatDay(route.details["day"])
+            if not slots:
+                return f"You have no free {route.details['minutes']}-minute slot on {day}."
+            spans = [f"{formatTime(self._local(slot['start']))}-{formatTime(self._local(slot['end']))}" for slot in slots]
+            return f"You're free on {day} " + ", ".join(spans) + "."
+
+        summary = route.args["event_data"]["summary"]
+        when = f"{formatDay(route.details['start'])}, {formatTime(route.details['start'])}-{formatTime(route.details['end'])}"
+        if result.get("status") == "created":
+            return f"Added \"{summary}\" on {when}."
+        if result.get("status") == "conflict":
+            conflicts = ", ".join(f"{conflict['summary']} ({formatTime(self._local(conflict['start']))}-"
+                                  f"{formatTime(self._local(conflict['end']))})" for conflict in result["conflicts"])
+            return f"\"{summary}\" on {when} conflicts with {conflicts}. Should I add it anyway?"
+        return f"Sorry, I couldn't add \"{summary}\": {result.get('error', 'unknown error')}"
+
+    def stats(self):
+        with self._lock:
+            lookups = self._stats["handled"] + self._stats["fellThrough"]
+            return dict(self._stats, intents=dict(self._stats["intents"]),
+                        handledRate=self._stats["handled"] / lookups if lookups else 0.0)
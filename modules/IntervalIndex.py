@@ -0,0 +1,83 @@
+import datetime
+
+import numpy as np
+
+from modules.EventIterator import toUtc
+
+def toEpoch(value):
+    """
+    Converts an RFC 3339 string, a YYYY-MM-DD date, a datetime or epoch seconds to epoch seconds.
+    """
+
+    if isinstance(value, (int, float, np.integer)):
+        return int(value)
+    if isinstance(value, datetime.datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=datetime.timezone.utc)
+        return int(value.timestamp())
+    return int(np.datetime64(toUtc(value)[:-1], "s").astype(np.int64))
+
+def fromEpoch(value):
+    return datetime.datetime.fromtimestamp(int(value), tz=datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+class IntervalIndex():
+    """
+    Sorted-array interval index over event start/end times for free/busy questions.
+
+    Events are sorted by start, and a running maximum of their end times lets a conflict
+    query find its candidate range with two binary searches before a vectorized filter, so
+    queries stay well under a millisecond for thousands of events.
+    """
+
+    def __init__(self, events, includeAllDay=False):
+        # All-day events (birthdays, holidays) do not block time unless asked to
+        events = [event for event in events if includeAllDay or not event.get("allDay")]
+        starts = np.array([event["start"][:-1] for event in events], dtype="datetime64[s]").astype(np.int64)
+        ends = np.array([event["end"][:-1] for event in events], dtype="datetime64[s]").astype(np.int64)
+
+        order = np.argsort(starts, kind="stable")
+        self.events = [events[index] for index in order]
+        self.starts = starts[order]
+        self.ends = ends[order]
+        self.maxEnds = np.maximum.accumulate(self.ends) if len(self.ends) else self.ends
+
+    def __len__(self):
+        return len(self.events)
+
+    def _overlapping(self, start, end):
+        # Events with start < end are a prefix of the sorted array; within it, those whose
+        # running max end is <= start cannot overlap, and they form a prefix as well
+        hi = np.searchsorted(self.starts, end, side="left")
+        lo = np.searchsorted(self.maxEnds[:hi], start, side="right")
+        return lo + np.nonzero(self.ends[lo:hi] > start)[0]
+
+    def findConflicts(self, start, end):
+        """
+        Returns the events overlapping [start, end).
+
+        Parameters:
+            start, end (str | datetime.datetime | int): Bounds of the proposed event.
+
+        Returns:
+            list[dict]: The overlapping events ordered by start.
+        """
+
+        return [self.events[index] for index in self._overlapping(toEpoch(start), toEpoch(end))]
+
+    def freeSlots(self, windowStart, windowEnd, duration):
+        """
+        Returns the gaps of at least duration seconds in [windowStart, windowEnd).
+
+        Returns:
+            list[tuple[str, str]]: (start, end) pairs as UTC timestamps.
+        """
+
+        windowStart, windowEnd = toEpoch(windowStart), toEpoch(windowEnd)
+        indexes = self._overlapping(windowStart, windowEnd)
+        busyStarts = np.clip(self.starts[indexes], windowStart, windowEnd)
+        busyEnds = np.maximum.accumulate(np.clip(self.ends[indexes], windowStart, windowEnd)) if len(indexes) else busyStarts
+
+        gapStarts = np.concatenate(([windowStart], busyEnds))
+        gapEnds = np.concatenate((busyStarts, [windowEnd]))
+        keep = (gapEnds > gapStarts) & (gapEnds - gapStarts >= duration)
+        return [(fromEpoch(start), fromEpoch(end)) for start, end in zip(gapStarts[keep], gapEnds[keep])]
@@ -0,0 +1,236 @@
+import bisect
+import datetime
+import functools
+import itertools
+import logging
+import re
+import threading
+import zoneinfo
+
+from dateutil.rrule import rrulestr
+
+# How far ahead an open-ended read without a limit expands series that never end.
+HORIZON_DAYS = 730
+
+logger = logging.getLogger(__name__)
+
+# UNTIL of an RRULE/EXRULE line, and the values of an EXDATE/RDATE line
+UNTIL = re.compile(r"UNTIL=(?P<date>\d{8})(?:T(?P<time>\d{6})(?P<utc>Z?))?")
+DATE_LIST = re.compile(r"^(?P<name>EXDATE|RDATE)(?P<params>[^:]*):(?P<values>.*)$")
+
+# Instance ids are '<series id>_<original start>', e.g. abc_20260112T140000Z or abc_20260112.
+INSTANCE_ID = re.compile(r"^(?P<series>.+)_(?P<date>\d{8})(?:T(?P<time>\d{6})Z)?$")
+
+def parseUtc(value):
+    return datetime.datetime.strptime(value, "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=datetime.timezone.utc)
+
+def formatUtc(moment):
+    return moment.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+def horizon():
+    """
+    The upper bound used for series that never end when a read gives none.
+    """
+
+    return formatUtc(datetime.datetime.now(tz=datetime.timezone.utc) + datetime.timedelta(days=HORIZON_DAYS))
+
+def instanceId(seriesId, start, allDay):
+    """
+    Id of one instance of a series, in the form the Calendar API uses, so instances expanded
+    here and exceptions synced from the API name the same occurrence.
+    """
+
+    return f"{seriesId}_{start[:10].replace('-', '')}" if allDay else f"{seriesId}_{start.replace('-', '').replace(':', '')}"
+
+def originalStartOf(event):
+    """
+    The UTC start an exception instance replaces, from its originalStartTime or, for the
+    bare cancelled instances a sync returns, from its id. None for other events.
+    """
+
+    original = event.get("originalStartTime")
+    if original:
+        value = original.get("dateTime", original.get("date"))
+        if len(value) == 10:
+            return f"{value}T00:00:00Z"
+        parsed = datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=zoneinfo.ZoneInfo(original.get("timeZone") or "UTC"))
+        return formatUtc(parsed.astimezone(datetime.timezone.utc))
+
+    match = INSTANCE_ID.match(event.get("id", ""))
+    if match is None:
+        return None
+    date, time = match["date"], match["time"] or "000000"
+    return f"{date[:4]}-{date[4:6]}-{date[6:]}T{time[:2]}:{time[2:4]}:{time[4:]}Z"
+
+def seriesZone(timeZone):
+    try:
+        return zoneinfo.ZoneInfo(timeZone or "UTC")
+    except (zoneinfo.ZoneInfoNotFoundError, ValueError):
+        return datetime.timezone.utc
+
+def normalizeRules(recurrence, dtstart, allDay):
+    """
+    Rewrites the date forms RFC 5545 allows but dateutil rejects against the series' start:
+    a timed series needs a UTC UNTIL and dated EXDATE/RDATE values, an all-day series plain
+    dates. A date-only UNTIL of a timed series means the end of that day in its time zone.
+    """
+
+    def until(match):
+        date, time = match["date"], match["time"]
+        if allDay:
+            return f"UNTIL={date}"
+        if time is not None and match["utc"]:
+            return match[0]
+        moment = datetime.datetime.strptime(date + (time or "235959"), "%Y%m%d%H%M%S").replace(tzinfo=dtstart.tzinfo)
+        return f"UNTIL={moment.astimezone(datetime.timezone.utc):%Y%m%dT%H%M%SZ}"
+
+    lines = []
+    for line in recurrence.splitlines():
+        if line.startswith(("RRULE", "EXRULE")):
+            line = UNTIL.sub(until, line)
+        match = DATE_LIST.match(line)
+        if match and allDay and "VALUE=DATE" not in match["params"]:
+            # Keep the calendar date of each value
+            line = f"{match['name']};VALUE=DATE:{','.join(value[:8] for value in match['values'].split(','))}"
+        elif match and not allDay and "VALUE=DATE" in match["params"]:
+            # A date stands for the instance starting on that day
+            values = ",".join(f"{value[:8]}T{dtstart:%H%M%S}" for value in match["values"].split(","))
+            line = f"{match['name']};TZID={dtstart.tzinfo}:{values}"
+        lines.append(line)
+    return "\n".join(lines)
+
+def ruleSet(recurrence, start, timeZone, allDay):
+    """
+    Parses a series' RRULE/EXRULE/RDATE/EXDATE lines into a dateutil rruleset anchored at its
+    first start. Timed series are expanded in their own time zone, so a 9:00 meeting stays at
+    9:00 across DST changes; all-day series are expanded on naive dates.
+
+    Raises:
+        ValueError: The lines are not a rule dateutil can read.
+    """
+
+    if allDay:
+        dtstart = parseUtc(start).replace(tzinfo=None)
+    else:
+        dtstart = parseUtc(start).astimezone(seriesZone(timeZone))
+    return rrulestr(normalizeRules(recurrence, dtstart, allDay), dtstart=dtstart, forceset=True)
+
+class Expansion():
+    """
+    The instances of one version of a series as (start, end) UTC strings. They are generated
+    from the rule only as far as a read needs them and kept, so later reads of any window up
+    to there cost a bisect and a slice.
+    """
+
+    def __init__(self, recurrence, start, end, timeZone, allDay, chunk=64):
+        self.allDay = allDay
+        self.chunk = chunk
+        self.starts = []
+        self.ends = []
+        self.valid = True
+        self._lock = threading.Lock()
+        first = parseUtc(start)
+        self.duration = parseUtc(end) - first
+        try:
+            self._moments = iter(ruleSet(recurrence, start, timeZone, allDay))
+        except (ValueError, TypeError) as error:
+            # Rather than failing every read of the calendar, show the first instance; the
+            # series is stored with no end, so it is not mistaken for one that finished
+            logger.warning("Cannot expand recurrence %r starting %s: %s", recurrence, start, error)
+            self.valid = False
+            self._moments = iter([first.replace(tzinfo=None) if allDay else first])
+
+    def _extend(self):
+        """
+        Generates the next chunk of instances. Returns False once the series has ended.
+        """
+
+        with self._lock:
+            if self._moments is None:
+                return False
+            added = 0
+            try:
+                for moment in itertools.islice(self._moments, self.chunk):
+                    moment = moment if self.allDay else moment.astimezone(datetime.timezone.utc)
+                    # Readers do not take the lock: an instance is visible once its start is
+                    self.ends.append(formatUtc(moment + self.duration))
+                    self.starts.append(formatUtc(moment))
+                    added += 1
+            except (ValueError, TypeError) as error:
+                logger.warning("Stopped expanding a recurrence after %d instances: %s", len(self.starts), error)
+                self.valid = False
+                added = 0
+            if added < self.chunk:
+                self._moments = None
+            return added > 0
+
+    def between(self, start=None, end=None):
+        """
+        Yields the (start, end) of the instances overlapping [start, end), in order.
+        """
+
+        # Instances all last as long, so ends are ordered like starts
+        index = 0
+        if start is not None:
+            while (not self.ends or self.ends[-1] <= start) and self._extend():
+                pass
+            index = bisect.bisect_right(self.ends, start)
+        while True:
+            if index >= len(self.starts) and not self._extend():
+                return
+            if index >= len(self.starts):
+                continue
+            if end is not None and self.starts[index] >= end:
+                return
+            yield self.starts[index], self.ends[index]
+            index += 1
+
+@functools.lru_cache(maxsize=1024)
+def expansion(recurrence, start, end, timeZone, allDay):
+    """
+    The shared Expansion of a series version; a changed rule, start or end is a new key.
+    """
+
+    return Expansion(recurrence, start, end, timeZone, allDay)
+
+def occurrences(series, start=None, end=None, skip=frozenset()):
+    """
+    Lazily yields the instances of a series overlapping [start, end) as event rows, in start
+    order. Nothing is generated past what the caller consumes, so an open-ended read with a
+    limit only expands as many occurrences as it returns.
+
+    Parameters:
+        series (dict): The series row, with 'recurrence' holding its rule lines.
+        start (str): Lower bound as a UTC ISO timestamp. Open when None.
+        end (str): Upper bound as a UTC ISO timestamp. Open when None.
+        skip (set[str]): Original starts (UTC) of instances replaced by stored exceptions.
+
+    Returns:
+        Iterator[dict]: Instance rows with the series fields, their own id, start and end,
+        and recurringEventId set to the series id.
+    """
+
+    allDay = bool(series["allDay"])
+    instances = expansion(series["recurrence"], series["start"], series["end"], series.get("timeZone"), allDay)
+    for instanceStart, instanceEnd in instances.between(start, end):
+        if instanceStart in skip:
+            continue
+        yield dict(series, id=instanceId(series["id"], instanceStart, allDay), start=instanceStart, end=instanceEnd,
+                   recurringEventId=series["id"], recurrence=None, seriesEnd=None)
+
+def seriesEnd(series):
+    """
+    The UTC end of the last instance of a series, or None when the series never ends.
+    Stored with the series so reads can skip the ones that finished before their window.
+    """
+
+    lines = series["recurrence"].splitlines()
+    if any(line.startswith("RRULE") and "COUNT=" not in line and "UNTIL=" not in line for line in lines):
+        return None
+    instances = expansion(series["recurrence"], series["start"], series["end"], series.get("timeZone"), bool(series["allDay"]))
+    last = None
+    for _, last in instances.between():
+        pass
+    return (last or series["end"]) if instances.valid else None
@@ -0,0 +1,415 @@
+import asyncio
+import contextlib
+import contextvars
+import heapq
+import itertools
+import random
+import threading
+import time
+
+from modules.Tracer import tracer
+
+INTERACTIVE = 0  # a user is waiting on the result
+BACKGROUND = 1   # syncs, prefetches and refreshes that can yield to interactive calls
+
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+THROTTLE_STATUSES = {429}
+RATE_LIMIT_REASONS = {"rateLimitExceeded", "userRateLimitExceeded", "RESOURCE_EXHAUSTED"}
+
+_priority = contextvars.ContextVar("priority", default=INTERACTIVE)
+
+@contextlib.contextmanager
+def priority(level):
+    """
+    Runs the enclosed calls at the given priority. Work started from inside (threads given a
+    copied context, asyncio tasks) inherits it.
+    """
+
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+def backoffDelay(attempt, baseDelay=0.5, maxDelay=16.0):
+    """
+    Exponential backoff with full jitter: a random delay in [0, min(maxDelay, baseDelay * 2^attempt)].
+    """
+
+    return random.uniform(0, min(maxDelay, baseDelay * 2 ** attempt))
+
+def parseDelay(value):
+    """
+    Seconds from a Retry-After header value or an RPC retryDelay such as '37s' or '1.5s'.
+    """
+
+    if value is None:
+        return None
+    try:
+        return max(float(str(value).strip().rstrip("s")), 0.0)
+    except ValueError:
+        # Retry-After may also be an HTTP date
+        from email.utils import parsedate_to_datetime
+        try:
+            return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+        except (TypeError, ValueError):
+            return None
+
+def classifyError(error):
+    """
+    Maps an error from either API to (status, reason, retryAfter seconds).
+
+    Understands googleapiclient HttpError (Calendar) and google.genai APIError (Gemini);
+    anything else has status None.
+    """
+
+    resp = getattr(error, "resp", None)
+    if resp is not None and hasattr(error, "error_details"):
+        reasons = [detail.get("reason") for detail in (error.error_details or []) if isinstance(detail, dict)]
+        return resp.status, next((reason for reason in reasons if reason), None), parseDelay(resp.get("retry-after"))
+
+    code = getattr(error, "code", None)
+    if isinstance(code, int):
+        retryAfter = None
+        response = getattr(error, "response", None)
+        headers = getattr(response, "headers", None)
+        if headers is not None:
+            retryAfter = parseDelay(headers.get("retry-after"))
+        body = getattr(error, "details", None)
+        details = body.get("error", {}).get("details", []) if isinstance(body, dict) else []
+        for detail in details:
+            if isinstance(detail, dict) and "retryDelay" in detail:
+                retryAfter = retryAfter if retryAfter is not None else parseDelay(detail["retryDelay"])
+        return code, getattr(error, "status", None), retryAfter
+
+    return None, None, None
+
+class TokenBucket():
+    """
+    Allows `rate` requests per second on average with bursts of up to `burst`.
+    Not thread safe on its own; ApiScheduler guards it with its lock.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait(self, now):
+        """
+        Seconds until a token is available (0 when one is available now).
+        """
+
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now):
+        self._refill(now)
+        self.tokens -= 1
+
+class ApiScheduler():
+    """
+    Admission control and retries for one API.
+
+    A request waits for a rate-limit token and a concurrency slot, with interactive requests
+    always admitted ahead of queued background ones. The concurrency limit adapts AIMD-style:
+    it grows by about one slot per window of successful requests and halves on throttling,
+    within [minConcurrency, maxConcurrency]. It halves at most once per congestion window:
+    requests admitted before a cut were sent under the old limit, so their throttling
+    responses (one burst can return many) do not cut it again. Throttled and server errors
+    are retried with jittered exponential backoff, never sooner than the server's Retry-After,
+    which also pauses every other request to the API until it has passed.
+    """
+
+    def __init__(self, name, rate=10.0, burst=10, concurrency=4, minConcurrency=1, maxConcurrency=16,
+                 maxRetries=4, baseDelay=0.5, maxDelay=16.0):
+        self.name = name
+        self.bucket = TokenBucket(rate, burst)
+        self.limit = float(concurrency)
+        self.minConcurrency = minConcurrency
+        self.maxConcurrency = maxConcurrency
+        self.maxRetries = maxRetries
+        self.baseDelay = baseDelay
+        self.maxDelay = maxDelay
+
+        self.inFlight = 0
+        self.pausedUntil = 0.0
+        self._admitted = 0   # requests admitted so far; a request's number identifies its window
+        self._windowEnd = 0  # requests numbered up to here were admitted before the last cut
+        self._waiting = []  # heap of (priority, ticket)
+        self._tickets = itertools.count()
+        self._condition = threading.Condition()
+        self._stats = {"calls": 0, "retries": 0, "throttled": 0, "failed": 0, "waitSeconds": 0.0}
+
+    # --- admission ---------------------------------------------------------------------
+
+    def acquire(self, level=None):
+        """
+        Blocks until the request may start.
+
+        Returns:
+            int: The request's admission number, to pass back to release().
+        """
+
+        level = _priority.get() if level is None else level
+        started = time.monotonic()
+        with self._condition:
+            ticket = (level, next(self._tickets))
+            heapq.heappush(self._waiting, ticket)
+            try:
+                while True:
+                    now = time.monotonic()
+                    delay = 0.0
+                    if self._waiting[0] != ticket or self.inFlight >= int(self.limit):
+                        delay = None
+                    else:
+                        delay = max(self.pausedUntil - now, self.bucket.wait(now))
+                    if delay == 0.0:
+                        break
+                    self._condition.wait(delay)
+                heapq.heappop(self._waiting)
+                self.bucket.take(now)
+                self.inFlight += 1
+                self._admitted += 1
+                admission = self._admitted
+                # The next waiter may be admissible too (e.g. the limit just grew)
+                self._condition.notify_all()
+            except BaseException:
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+                self._condition.notify_all()
+                raise
+            self._stats["waitSeconds"] += time.monotonic() - started
+            return admission
+
+    async def acquireAsync(self, level=None):
+        """
+        Async version of acquire(). Waiting happens on a worker thread that cannot be
+        interrupted, so if the awaiting task is cancelled the slot the thread goes on to take
+        is handed straight back instead of being held forever.
+        """
+
+        future = asyncio.ensure_future(asyncio.to_thread(self.acquire, level))
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            future.add_done_callback(self._abandon)
+            raise
+
+    def _abandon(self, future):
+        if not future.cancelled() and future.exception() is None:
+            self._free()
+
+    def _free(self):
+        """
+        Frees a slot whose request never got a response, so it says nothing about congestion.
+        """
+
+        with self._condition:
+            self.inFlight -= 1
+            self._condition.notify_all()
+
+    def release(self, throttled=False, retryAfter=None, admission=None):
+        """
+        Frees the slot of a finished request. admission is what acquire() returned; a
+        throttled request admitted before the last cut does not cut the limit again.
+        """
+
+        with self._condition:
+            self.inFlight -= 1
+            self._observe(throttled, retryAfter, admission)
+            self._condition.notify_all()
+
+    def observe(self, throttled=False, retryAfter=None):
+        """
+        Feeds a response that did not go through call() (e.g. one part of a batch) into the
+        adaptive limit and the Retry-After pause.
+        """
+
+        with self._condition:
+            self._observe(throttled, retryAfter)
+            self._condition.notify_all()
+
+    def _observe(self, throttled, retryAfter, admission=None):
+        if throttled:
+            self._stats["throttled"] += 1
+            if admission is None or admission > self._windowEnd:
+                self.limit = max(self.minConcurrency, self.limit / 2)
+                self._windowEnd = self._admitted
+        else:
+            self.limit = min(self.maxConcurrency, self.limit + 1 / max(self.limit, 1))
+        if retryAfter:
+            self.pausedUntil = max(self.pausedUntil, time.monotonic() + retryAfter)
+
+    # --- retries -----------------------------------------------------------------------
+
+    def _verdict(self, error, attempt, idempotent):
+        """
+        Returns (throttled, retryAfter, delay before the next attempt or None to give up).
+        """
+
+        status, reason, retryAfter = classifyError(error)
+        throttled = status in THROTTLE_STATUSES or (status == 403 and reason in RATE_LIMIT_REASONS)
+        # A throttled request was never processed, so it is safe to resend even if it writes;
+        # other server errors are only retried for idempotent requests (or 503, which is
+        # returned before the request is applied)
+        retryable = throttled or (status in RETRYABLE_STATUSES and (idempotent or status == 503))
+        if not retryable or attempt >= self.maxRetries:
+            return throttled, retryAfter, None
+        return throttled, retryAfter, max(retryAfter or 0.0, backoffDelay(attempt, self.baseDelay, self.maxDelay))
+
+    def call(self, function, idempotent=True, level=None):
+        """
+        Runs function() under the rate limit and concurrency limit, retrying throttled and
+        transient failures.
+
+        Parameters:
+            function (Callable[[], T]): The outbound call.
+            idempotent (bool): Whether a request that may have been applied can be resent.
+            level (int): INTERACTIVE or BACKGROUND. Defaults to the current priority().
+
+        Returns:
+            T: What function returned.
+        """
+
+        for attempt in itertools.count():
+            admission = self.acquire(level)
+            try:
+                result = function()
+            except Exception as error:
+                throttled, retryAfter, delay = self._verdict(error, attempt, idempotent)
+                self.release(throttled, retryAfter, admission)
+                if delay is None:
+                    self._count("failed")
+                    raise
+                self._count("retries")
+                tracer.current().set(retries=attempt + 1)
+                time.sleep(delay)
+                continue
+            self.release()
+            self._count("calls")
+            return result
+
+    async def callAsync(self, function, idempotent=True, level=None):
+        """
+        Async version of call(): function() returns an awaitable. Waiting for admission and
+        backing off never block the event loop.
+        """
+
+        level = _priority.get() if level is None else level
+        for attempt in itertools.count():
+            admission = await self.acquireAsync(level)
+            try:
+                result = await function()
+            except Exception as error:
+                throttled, retryAfter, delay = self._verdict(error, attempt, idempotent)
+                self.release(throttled, retryAfter, admission)
+                if delay is None:
+                    self._count("failed")
+                    raise
+                self._count("retries")
+                tracer.current().set(retries=attempt + 1)
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                # Cancelled mid-request: free the slot without judging a response never seen
+                self._free()
+                raise
+            self.release()
+            self._count("calls")
+            return result
+
+    def stream(self, function, level=None):
+        """
+        Yields the chunks of function(), a streaming call, holding one slot for the whole
+        stream. Failures before the first chunk are retried like call(); once output has
+        been yielded an error is raised, since the caller has already consumed part of it.
+        """
+
+        for attempt in itertools.count():
+            admission = self.acquire(level)
+            received = False
+            try:
+                for chunk in function():
+                    received = True
+                    yield chunk
+            except Exception as error:
+                throttled, retryAfter, delay = self._verdict(error, attempt, True)
+                self.release(throttled, retryAfter, admission)
+                if received or delay is None:
+                    self._count("failed")
+                    raise
+                self._count("retries")
+                time.sleep(delay)
+                continue
+            except BaseException:
+                self.release()
+                raise
+            self.release()
+            self._count("calls")
+            return
+
+    async def streamAsync(self, function, level=None):
+        """
+        Async version of stream(): function() returns an awaitable of an async iterator.
+        """
+
+        level = _priority.get() if level is None else level
+        for attempt in itertools.count():
+            admission = await self.acquireAsync(level)
+            received = False
+            try:
+                async for chunk in await function():
+                    received = True
+                    yield chunk
+            except Exception as error:
+                throttled, retryAfter, delay = self._verdict(error, attempt, True)
+                self.release(throttled, retryAfter, admission)
+                if received or delay is None:
+                    self._count("failed")
+                    raise
+                self._count("retries")
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                self.release()
+                raise
+            self.release()
+            self._count("calls")
+            return
+
+    def _count(self, key):
+        with self._condition:
+            self._stats[key] += 1
+
+    def stats(self):
+        with self._condition:
+            return dict(self._stats, limit=round(self.limit, 2), inFlight=self.inFlight, queued=len(self._waiting))
+
+# Settings of each API's schedulers. The Calendar API allows about 10 requests per second
+# per user by default, so every user gets a scheduler of their own; Gemini limits depend on
+# the tier and apply to the whole project, so its scheduler is shared by every caller.
+SETTINGS = {
+    "calendar": {"rate": 10.0, "burst": 10, "concurrency": 4, "maxConcurrency": 16},
+    "gemini": {"rate": 2.0, "burst": 5, "concurrency": 2, "maxConcurrency": 8, "baseDelay": 1.0, "maxDelay": 32.0},
+}
+
+schedulers = {}  # 'api' or 'api:user' -> ApiScheduler
+_schedulersLock = threading.Lock()
+
+def getScheduler(name, key=None):
+    """
+    Returns the scheduler of an API, created on first use. Callers passing the same key share
+    it: pass the user for quotas counted per user, and no key for per-project ones.
+    """
+
+    ident = name if key is None else f"{name}:{key}"
+    with _schedulersLock:
+        if ident not in schedulers:
+            schedulers[ident] = ApiScheduler(ident, **SETTINGS[name])
+        return schedulers[ident]
@@ -0,0 +1,130 @@
+import datetime
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+
+class TTLCache():
+    """
+    Thread-safe LRU cache whose entries also expire after ttl seconds.
+
+    Keeps hit, miss, eviction and invalidation counters, and supports dropping every entry
+    whose key matches a predicate.
+    """
+
+    def __init__(self, maxSize=256, ttl=60.0):
+        self.maxSize = maxSize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                    self.evictions += 1
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxSize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, predicate=None):
+        """
+        Drops every entry whose key satisfies predicate (all entries when it is None).
+        """
+
+        with self._lock:
+            keys = [key for key in self._entries if predicate is None or predicate(key)]
+            for key in keys:
+                del self._entries[key]
+            self.invalidations += len(keys)
+            return len(keys)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+class ToolResultCache(TTLCache):
+    """
+    Caches read-only calendar tool results under (calendar, window, quantity) keys, where the
+    window is a (startUtc, endUtc) pair and endUtc may be None for an open-ended window.
+    """
+
+    @staticmethod
+    def key(calendarId, windowStart, windowEnd, quantity):
+        return (calendarId, windowStart, windowEnd, quantity)
+
+    def invalidateEvent(self, calendarId, start, end):
+        """
+        Drops the entries of a calendar whose window overlaps an event that was just written.
+        """
+
+        return self.invalidate(lambda key: key[0] == calendarId and end > key[1] and (key[2] is None or start < key[2]))
+
+class AnswerCache(TTLCache):
+    """
+    Caches the model's answers to read-only prompts, keyed by the normalized prompt, a digest
+    of the turn before it, the calendar state version and the current date. A follow-up such
+    as "and the day after that" only matches answers given after the same exchange. A new
+    calendar version makes the old answers unreachable, and they are purged the next time an
+    answer is stored.
+    """
+
+    def __init__(self, version, maxSize=128, ttl=300.0, minWords=3):
+        super().__init__(maxSize=maxSize, ttl=ttl)
+        self.version = version
+        # Short prompts ("yes", "do it") depend on the conversation, not just the calendar
+        self.minWords = minWords
+
+    @staticmethod
+    def normalize(prompt):
+        return " ".join(re.sub(r"[^\w\s:/-]", " ", prompt.lower()).split())
+
+    def key(self, prompt, context=""):
+        """
+        Cache key of a prompt, or None when it is too short to cache. context is the text of
+        the conversation the prompt follows; only its digest is kept.
+        """
+
+        normalized = self.normalize(prompt)
+        if len(normalized.split()) < self.minWords:
+            return None
+        digest = hashlib.sha256(context.encode()).hexdigest()[:16]
+        return (normalized, digest, self.version(), datetime.date.today().isoformat())
+
+    def lookup(self, prompt, context=""):
+        key = self.key(prompt, context)
+        return None if key is None else self.get(key)
+
+    def store(self, prompt, answer, context=""):
+        key = self.key(prompt, context)
+        if key is None:
+            return
+        self.invalidate(lambda cached: cached[2:] != key[2:])
+        self.set(key, answer)
@@ -0,0 +1,289 @@
+import collections
+import http.server
+import json
+import re
+import secrets
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from modules.TokenManager import AuthorizationError
+
+USER_PATTERN = re.compile(r"[A-Za-z0-9_.@-]{1,64}")
+
+class UserBusyError(RuntimeError):
+    """
+    Raised when a user already has as many turns running as they are allowed.
+    """
+
+class UnknownSessionError(KeyError):
+    """
+    Raised for a session id that does not exist, expired, or belongs to another user.
+    """
+
+class Session():
+    """
+    One user's conversation: its Assistant and the lock that keeps its turns in order.
+    """
+
+    def __init__(self, sessionId, user, assistant):
+        self.id = sessionId
+        self.user = user
+        self.assistant = assistant
+        self.lock = threading.Lock()
+        self.created = time.monotonic()
+        self.lastUsed = self.created
+        self.turns = 0
+
+class SessionManager():
+    """
+    Hosts the conversations of many users in one process.
+
+    Every session owns its Assistant (and so its history, kept within the HistoryManager
+    budget), while whatever createAssistant closes over, such as the GenAI client and the tool
+    pool, is shared. Sessions idle for longer than sessionTtl expire, and once there are
+    maxSessions (or a user has maxSessionsPerUser) the least recently used one is evicted.
+    A user runs at most perUserConcurrency turns at a time, so one busy user cannot occupy
+    every worker; a turn that cannot start within queueTimeout seconds is rejected.
+    """
+
+    def __init__(self, createAssistant, credentials, maxSessions=1000, maxSessionsPerUser=20, sessionTtl=1800.0,
+                 perUserConcurrency=2, queueTimeout=2.0):
+        # createAssistant(user, creds) -> Assistant; credentials(user) -> creds, or raises PermissionError
+        self.createAssistant = createAssistant
+        self.credentials = credentials
+        self.maxSessions = maxSessions
+        self.maxSessionsPerUser = maxSessionsPerUser
+        self.sessionTtl = sessionTtl
+        self.perUserConcurrency = perUserConcurrency
+        self.queueTimeout = queueTimeout
+
+        self._sessions = collections.OrderedDict()  # id -> Session, least recently used first
+        self._userSlots = {}
+        self._lock = threading.Lock()
+        self._stats = {"created": 0, "closed": 0, "expired": 0, "evicted": 0, "turns": 0, "failed": 0, "rejected": 0}
+
+    @staticmethod
+    def checkUser(user):
+        if not user or not USER_PATTERN.fullmatch(user):
+            raise PermissionError("A user name of letters, digits and _.@- is required")
+        return user
+
+    def _expire(self, now):
+        while self._sessions:
+            session = next(iter(self._sessions.values()))
+            if now - session.lastUsed < self.sessionTtl:
+                break
+            del self._sessions[session.id]
+            self._stats["expired"] += 1
+
+    def create(self, user):
+        """
+        Opens a new session for a user.
+
+        Returns:
+            Session: The new session; its id is what clients send back.
+        """
+
+        self.checkUser(user)
+        creds = self.credentials(user)
+        # Built outside the lock: creating an Assistant may open the user's mirror
+        session = Session(secrets.token_urlsafe(16), user, self.createAssistant(user, creds))
+
+        with self._lock:
+            self._expire(time.monotonic())
+            owned = [other for other in self._sessions.values() if other.user == user]
+            if len(owned) >= self.maxSessionsPerUser:
+                del self._sessions[owned[0].id]
+                self._stats["evicted"] += 1
+            while len(self._sessions) >= self.maxSessions:
+                self._sessions.popitem(last=False)
+                self._stats["evicted"] += 1
+            self._sessions[session.id] = session
+            self._stats["created"] += 1
+        return session
+
+    def get(self, user, sessionId):
+        """
+        Returns a session of the user, raising UnknownSessionError if it does not exist,
+        expired or belongs to someone else.
+        """
+
+        with self._lock:
+            self._expire(time.monotonic())
+            session = self._sessions.get(sessionId)
+            if session is None or session.user != user:
+                raise UnknownSessionError(sessionId)
+            self._sessions.move_to_end(sessionId)
+            return session
+
+    def close(self, user, sessionId):
+        session = self.get(user, sessionId)
+        with self._lock:
+            self._sessions.pop(session.id, None)
+            self._stats["closed"] += 1
+
+    def _slots(self, user):
+        with self._lock:
+            if user not in self._userSlots:
+                self._userSlots[user] = threading.BoundedSemaphore(self.perUserConcurrency)
+            return self._userSlots[user]
+
+    def runTurn(self, user, sessionId, prompt):
+        """
+        Runs one prompt in a session. Turns of a session run one after another, and turns of
+        one user at most perUserConcurrency at a time.
+
+        Returns:
+            dict: The answer with the turn's mode, time-to-first-token, total time and model calls.
+        """
+
+        session = self.get(user, sessionId)
+        slots = self._slots(user)
+        started = time.monotonic()
+        if not session.lock.acquire(timeout=self.queueTimeout):
+            self._count("rejected")
+            raise UserBusyError("This session is still answering an earlier prompt")
+        try:
+            if not slots.acquire(timeout=max(self.queueTimeout - (time.monotonic() - started), 0)):
+                self._count("rejected")
+                raise UserBusyError(f"{user} already has {self.perUserConcurrency} prompts running")
+            try:
+                answer = session.assistant.runTurn(prompt)
+            except Exception:
+                self._count("failed")
+                raise
+            finally:
+                slots.release()
+            session.turns += 1
+            session.lastUsed = time.monotonic()
+            stats = session.assistant.turnStats[-1]
+        finally:
+            session.lock.release()
+
+        self._count("turns")
+        return {"answer": answer, "mode": stats["mode"], "ttft": stats["ttft"], "total": stats["total"], "rounds": stats["rounds"]}
+
+    def _count(self, key):
+        with self._lock:
+            self._stats[key] += 1
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, sessions=len(self._sessions), users=len({session.user for session in self._sessions.values()}))
+
+class SessionRequestHandler(http.server.BaseHTTPRequestHandler):
+    """
+    JSON API over a SessionManager. The user is taken from the X-User header, which an
+    authenticating proxy in front of the server is expected to set.
+
+        POST   /sessions                 -> 201 {"session": id}
+        POST   /sessions/<id>/turns      {"prompt": ...} -> 200 {"answer": ..., "ttft": ..., "total": ...}
+        DELETE /sessions/<id>            -> 204
+        GET    /stats, GET /health
+    """
+
+    server_version = "CalendarAssistant/1.0"
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+    def _send(self, status, body=None, headers=None):
+        payload = b"" if body is None else json.dumps(body, default=str).encode()
+        self.send_response(status)
+        if body is not None:
+            self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > self.server.maxBodyBytes:
+            raise ValueError("Request body too large")
+        try:
+            return json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError as error:
+            raise ValueError(f"Invalid JSON: {error}")
+
+    def _route(self, method):
+        manager = self.server.manager
+        parts = [part for part in self.path.split("?", 1)[0].split("/") if part]
+
+        if method == "GET" and parts == ["health"]:
+            return 200, {"status": "ok"}
+        if method == "GET" and parts == ["stats"]:
+            return 200, dict(manager.stats(), **self.server.extraStats())
+
+        user = manager.checkUser(self.headers.get("X-User"))
+        if method == "POST" and parts == ["sessions"]:
+            return 201, {"session": manager.create(user).id}
+        if method == "POST" and len(parts) == 3 and parts[0] == "sessions" and parts[2] == "turns":
+            prompt = self._body().get("prompt")
+            if not isinstance(prompt, str) or not prompt.strip():
+                raise ValueError("'prompt' must be a non-empty string")
+            return 200, manager.runTurn(user, parts[1], prompt)
+        if method == "DELETE" and len(parts) == 2 and parts[0] == "sessions":
+            manager.close(user, parts[1])
+            return 204, None
+        return 404, {"error": f"No route for {method} {self.path}"}
+
+    def _handle(self, method):
+        try:
+            status, body = self._route(method)
+            self._send(status, body)
+        except UserBusyError as error:
+            self._send(429, {"error": str(error)}, {"Retry-After": "1"})
+        except AuthorizationError as error:
+            self._send(401, {"error": str(error)})
+        except PermissionError as error:
+            self._send(403, {"error": str(error)})
+        except UnknownSessionError as error:
+            self._send(404, {"error": f"Unknown session {error.args[0]}"})
+        except ValueError as error:
+            self._send(400, {"error": str(error)})
+        except Exception as error:
+            self.log_error("%s failed: %r", self.path, error)
+            self._send(500, {"error": str(error)})
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def do_DELETE(self):
+        self._handle("DELETE")
+
+class SessionServer(http.server.HTTPServer):
+    """
+    HTTP server whose requests run on one bounded worker pool instead of a thread per
+    connection, so the number of concurrent turns (and of per-thread Calendar connection
+    pools) stays fixed however many clients connect.
+    """
+
+    def __init__(self, address, manager, workers=16, extraStats=dict, quiet=False, maxBodyBytes=64 * 1024):
+        super().__init__(address, SessionRequestHandler)
+        self.manager = manager
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="http")
+        self.extraStats = extraStats
+        self.quiet = quiet
+        self.maxBodyBytes = maxBodyBytes
+
+    def process_request(self, request, client_address):
+        self.executor.submit(self._work, request, client_address)
+
+    def _work(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,149 @@
+import datetime
+import os
+import tempfile
+import threading
+
+from google.auth.exceptions import RefreshError
+from google.auth.transport.requests import Request
+from google.oauth2.credentials import Credentials
+from google_auth_oauthlib.flow import InstalledAppFlow
+
+from modules.Tracer import tracer
+
+SCOPES = ["https://www.googleapis.com/auth/calendar"]
+
+class AuthorizationError(PermissionError):
+    """
+    Raised when a token file holds no usable credentials (missing, revoked or no longer
+    refreshable) and the OAuth flow may not run to replace them.
+    """
+
+class TokenManager():
+    """
+    Owns the OAuth credentials stored in one token file.
+
+    The credentials are refreshed ahead of expiry, either on a background thread (start()) or
+    lazily when credentials() sees them close to expiring, and always under a lock so many
+    workers sharing one credential trigger a single refresh. The token file is rewritten
+    atomically, so a crash mid-write never leaves it truncated.
+    """
+
+    _managers = {}
+    _managersLock = threading.Lock()
+
+    def __init__(self, pathToken="token.json", pathCred="credentials.json", scopes=SCOPES, refreshMargin=300):
+        self.pathToken = pathToken
+        self.pathCred = pathCred
+        self.scopes = scopes
+        self.refreshMargin = refreshMargin
+        self.creds = None
+        self.refreshes = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @classmethod
+    def forPath(cls, pathToken="token.json", pathCred="credentials.json", scopes=SCOPES):
+        """
+        Returns the process-wide manager of a token file, so every user of it shares one
+        credential and one refresh schedule.
+        """
+
+        key = os.path.abspath(pathToken)
+        with cls._managersLock:
+            if key not in cls._managers:
+                cls._managers[key] = cls(pathToken, pathCred, scopes)
+            return cls._managers[key]
+
+    def secondsLeft(self):
+        if self.creds is None or self.creds.expiry is None:
+            return 0.0 if self.creds is None or not self.creds.token else float("inf")
+        now = datetime.datetime.now(tz=datetime.timezone.utc).replace(tzinfo=None)
+        return (self.creds.expiry - now).total_seconds()
+
+    def credentials(self, interactive=False):
+        """
+        Returns valid credentials, loading them from the token file and refreshing them if they
+        expire within refreshMargin seconds. When there are none it can use, it runs the OAuth
+        flow in the browser, but only if asked to and on the main thread: background refreshes
+        and server requests must never wait on a user.
+
+        Parameters:
+            interactive (bool): Allow the OAuth flow. Ignored off the main thread.
+
+        Returns:
+            google.oauth2.credentials.Credentials: Credentials shared by every caller.
+
+        Raises:
+            AuthorizationError: The credentials are missing or cannot be refreshed, and the flow may not run.
+        """
+
+        if self.creds is not None and self.secondsLeft() > self.refreshMargin:
+            return self.creds
+
+        with self._lock:
+            # Another thread may have refreshed while this one waited for the lock
+            if self.creds is not None and self.secondsLeft() > self.refreshMargin:
+                return self.creds
+
+            if self.creds is None and os.path.exists(self.pathToken):
+                self.creds = Credentials.from_authorized_user_file(self.pathToken, self.scopes)
+                if self.secondsLeft() > self.refreshMargin:
+                    return self.creds
+
+            mayPrompt = interactive and threading.current_thread() is threading.main_thread()
+            if self.creds and self.creds.refresh_token:
+                try:
+                    with tracer.span("auth.refresh", kind="client", secondsLeft=round(self.secondsLeft())):
+                        self.creds.refresh(Request())
+                    self.refreshes += 1
+                except RefreshError as error:
+                    # The refresh token was revoked or expired; only a new authorization helps
+                    if not mayPrompt:
+                        raise AuthorizationError(f"Cannot refresh the credentials in {self.pathToken}: {error}") from error
+                    self.creds = None
+            if not self.creds or not self.creds.valid:
+                if not mayPrompt:
+                    raise AuthorizationError(f"{self.pathToken} holds no usable credentials; authorize calendar access again")
+                with tracer.span("auth.flow"):
+                    flow = InstalledAppFlow.from_client_secrets_file(self.pathCred, self.scopes)
+                    self.creds = flow.run_local_server(port=0)
+            self._save()
+            return self.creds
+
+    def _save(self):
+        directory = os.path.dirname(os.path.abspath(self.pathToken))
+        descriptor, tmpPath = tempfile.mkstemp(dir=directory, prefix=".token-", suffix=".tmp")
+        try:
+            with os.fdopen(descriptor, "w") as token:
+                token.write(self.creds.to_json())
+            os.replace(tmpPath, self.pathToken)
+        except BaseException:
+            os.unlink(tmpPath)
+            raise
+
+    def start(self):
+        """
+        Starts the background thread that refreshes the credentials refreshMargin seconds
+        before they expire. Safe to call more than once.
+        """
+
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name="token-refresh", daemon=True)
+                self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.credentials()
+                wait = max(self.secondsLeft() - self.refreshMargin, 1.0)
+            except Exception as error:
+                print(f"Token refresh failed: {error}")
+                wait = 30.0
+            self._stop.wait(min(wait, 3600.0))
@@ -0,0 +1,103 @@
+import asyncio
+import contextvars
+import inspect
+from concurrent.futures import ThreadPoolExecutor
+
+from google.genai import types
+
+from modules.Tracer import payloadSize, tracer
+
+class ToolDispatcher():
+    """
+    Runs every function call of a model turn and packs the results into FunctionResponse parts.
+
+    Calls are independent unless they write: write tools run first (concurrently with each
+    other), then the read tools run concurrently so they observe what was just written. All
+    calls share one bounded thread pool, which many dispatchers (one per session) may share.
+    """
+
+    def __init__(self, handlers, writeTools=(), maxWorkers=4, executor=None):
+        self.handlers = handlers
+        self.writeTools = set(writeTools)
+        self.executor = executor or ThreadPoolExecutor(max_workers=maxWorkers, thread_name_prefix="tool")
+
+    @staticmethod
+    def functionCalls(response):
+        """
+        Returns every function_call part of the first candidate, not only the first one.
+        """
+
+        if not response.candidates or response.candidates[0].content is None:
+            return []
+        return [part.function_call for part in response.candidates[0].content.parts or [] if part.function_call]
+
+    @staticmethod
+    def _traceResult(span, call, result):
+        if span.recording:
+            span.set(argsBytes=payloadSize(call.args or {}), resultBytes=payloadSize(result), failed="error" in result)
+        return result
+
+    def run(self, call):
+        handler = self.handlers.get(call.name)
+        if handler is None:
+            return {"error": f"Unknown function {call.name}"}
+        with tracer.span(f"tool.{call.name}") as span:
+            try:
+                result = handler(**(call.args or {}))
+            except Exception as error:
+                return self._traceResult(span, call, {"error": str(error)})
+            # FunctionResponse.response must be a dict
+            return self._traceResult(span, call, result if isinstance(result, dict) else {"output": result})
+
+    async def runAsync(self, call):
+        handler = self.handlers.get(call.name)
+        if inspect.iscoroutinefunction(handler):
+            with tracer.span(f"tool.{call.name}") as span:
+                try:
+                    result = await handler(**(call.args or {}))
+                except Exception as error:
+                    return self._traceResult(span, call, {"error": str(error)})
+                return self._traceResult(span, call, result if isinstance(result, dict) else {"output": result})
+        # Blocking handlers run on the shared pool so the event loop is never stalled
+        return await asyncio.get_running_loop().run_in_executor(self.executor, contextvars.copy_context().run, self.run, call)
+
+    def dispatch(self, calls):
+        """
+        Executes function calls and returns one FunctionResponse part per call, in call order.
+
+        Parameters:
+            calls (list[google.genai.types.FunctionCall]): The calls returned by the model.
+
+        Returns:
+            list[google.genai.types.Part]: Parts to send back to the model in a single turn.
+        """
+
+        results = [None] * len(calls)
+        writes = [index for index, call in enumerate(calls) if call.name in self.writeTools]
+        reads = [index for index, call in enumerate(calls) if call.name not in self.writeTools]
+
+        for phase in (writes, reads):
+            # Each call runs in a copy of this context so its trace spans nest under the turn
+            futures = {index: self.executor.submit(contextvars.copy_context().run, self.run, calls[index]) for index in phase}
+            for index, future in futures.items():
+                results[index] = future.result()
+
+        return [types.Part(function_response=types.FunctionResponse(id=call.id, name=call.name, response=result))
+                for call, result in zip(calls, results)]
+
+    async def dispatchAsync(self, calls):
+        """
+        Async version of dispatch. Handlers may be coroutine functions or blocking callables.
+        """
+
+        results = [None] * len(calls)
+        writes = [index for index, call in enumerate(calls) if call.name in self.writeTools]
+        reads = [index for index, call in enumerate(calls) if call.name not in self.writeTools]
+
+        for phase in (writes, reads):
+            phaseResults = await asyncio.gather(*(self.runAsync(calls[index]) for index in phase))
+            for index, result in zip(phase, phaseResults):
+                results[index] = result
+
+        return [types.Part(function_response=types.FunctionResponse(id=call.id, name=call.name, response=result))
+                for call, result in zip(calls, results)]
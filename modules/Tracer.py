@@ -0,0 +1,299 @@
+import contextvars
+import functools
+import inspect
+import json
+import random
+import threading
+import time
+
+_current = contextvars.ContextVar("span", default=None)
+
+class Span():
+    """
+    One timed operation. Attributes are plain JSON values (timings, token counts, sizes).
+    """
+
+    __slots__ = ("name", "traceId", "spanId", "parentId", "kind", "start", "duration", "attributes", "error", "_clock", "_token")
+    recording = True
+
+    def __init__(self, name, parent, kind, attributes):
+        self.name = name
+        self.traceId = parent.traceId if parent else f"{random.getrandbits(128):032x}"
+        self.spanId = f"{random.getrandbits(64):016x}"
+        self.parentId = parent.spanId if parent else None
+        self.kind = kind
+        self.attributes = attributes
+        self.error = None
+        self.duration = None
+        self.start = time.time_ns()
+        self._clock = time.perf_counter_ns()
+
+    def set(self, **attributes):
+        self.attributes.update({key: value for key, value in attributes.items() if value is not None})
+        return self
+
+    def toDict(self):
+        return {
+            "traceId": self.traceId,
+            "spanId": self.spanId,
+            "parentId": self.parentId,
+            "name": self.name,
+            "kind": self.kind,
+            "start": self.start,
+            "durationMs": self.duration / 1e6,
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+class _NoopSpan():
+    recording = False
+
+    def set(self, **attributes):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+NOOP_SPAN = _NoopSpan()
+
+class _ActiveSpan():
+    def __init__(self, tracer, span):
+        self.tracer = tracer
+        self.span = span
+
+    def __enter__(self):
+        self.span._token = _current.set(self.span)
+        return self.span
+
+    def __exit__(self, excType, exc, tb):
+        span = self.span
+        span.duration = time.perf_counter_ns() - span._clock
+        if exc is not None:
+            span.error = f"{excType.__name__}: {exc}"
+        _current.reset(span._token)
+        self.tracer._finish(span)
+        return False
+
+class JsonlExporter():
+    """
+    Appends one JSON object per finished span to a file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, spans):
+        lines = "".join(json.dumps(span.toDict(), default=str) + "\n" for span in spans)
+        with self._lock, open(self.path, "a") as f:
+            f.write(lines)
+
+class OtlpJsonExporter(JsonlExporter):
+    """
+    Appends each finished trace as one OTLP/JSON ExportTraceServiceRequest line, the format
+    read by the OpenTelemetry Collector's file receiver and accepted by OTLP/HTTP endpoints.
+    """
+
+    KINDS = {"internal": 1, "server": 2, "client": 3}
+
+    def __init__(self, path, serviceName="calendar-assistant"):
+        super().__init__(path)
+        self.serviceName = serviceName
+
+    @staticmethod
+    def value(value):
+        if isinstance(value, bool):
+            return {"boolValue": value}
+        if isinstance(value, int):
+            return {"intValue": str(value)}
+        if isinstance(value, float):
+            return {"doubleValue": value}
+        return {"stringValue": str(value)}
+
+    def otlpSpan(self, span):
+        return {
+            "traceId": span.traceId,
+            "spanId": span.spanId,
+            "parentSpanId": span.parentId or "",
+            "name": span.name,
+            "kind": self.KINDS.get(span.kind, 1),
+            "startTimeUnixNano": str(span.start),
+            "endTimeUnixNano": str(span.start + span.duration),
+            "attributes": [{"key": key, "value": self.value(value)} for key, value in span.attributes.items()],
+            "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+        }
+
+    def export(self, spans):
+        request = {"resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": self.serviceName}}]},
+            "scopeSpans": [{"scope": {"name": "modules.Tracer"}, "spans": [self.otlpSpan(span) for span in spans]}],
+        }]}
+        with self._lock, open(self.path, "a") as f:
+            f.write(json.dumps(request) + "\n")
+
+class Tracer():
+    """
+    Minimal span tracer for finding where a turn spends its time.
+
+    Spans nest through a context variable, so they follow asyncio tasks, and threads that
+    run work with contextvars.copy_context() stay attached to the span that submitted it.
+    The spans of a trace are buffered until its root span ends, then handed to the exporter
+    and to every listener at once. While nothing is configured, span() returns a shared
+    no-op span, so instrumented code pays almost nothing.
+    """
+
+    def __init__(self):
+        self.exporter = None
+        self.listeners = []
+        self._traces = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.exporter is not None or bool(self.listeners)
+
+    def configure(self, exporter=None, listeners=()):
+        self.exporter = exporter
+        self.listeners = list(listeners)
+        return self
+
+    def span(self, name, kind="internal", **attributes):
+        """
+        Returns a context manager that times the enclosed block as a child of the current span.
+
+        Parameters:
+            name (str): Dotted operation name, e.g. 'model.generate_content' or 'db.getEvents'.
+            kind (str): 'internal', or 'client' for calls that leave the process.
+            **attributes: Initial attributes; more can be added with span.set().
+        """
+
+        if not self.enabled:
+            return NOOP_SPAN
+        parent = _current.get()
+        span = Span(name, parent, kind, {key: value for key, value in attributes.items() if value is not None})
+        if parent is None:
+            with self._lock:
+                self._traces[span.traceId] = []
+        return _ActiveSpan(self, span)
+
+    def current(self):
+        """
+        Returns the innermost active span, or a no-op span outside of any.
+        """
+
+        return _current.get() or NOOP_SPAN
+
+    def traced(self, name, kind="internal"):
+        """
+        Decorator that runs a function (or coroutine function) inside a span.
+        """
+
+        def decorate(function):
+            if inspect.iscoroutinefunction(function):
+                @functools.wraps(function)
+                async def wrapper(*args, **kwargs):
+                    with self.span(name, kind):
+                        return await function(*args, **kwargs)
+            else:
+                @functools.wraps(function)
+                def wrapper(*args, **kwargs):
+                    with self.span(name, kind):
+                        return function(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def _finish(self, span):
+        with self._lock:
+            if span.parentId is None:
+                spans = self._traces.pop(span.traceId, [])
+                spans.append(span)
+            elif span.traceId in self._traces:
+                self._traces[span.traceId].append(span)
+                return
+            else:
+                # Finished after its root (e.g. an abandoned prefetch): export it on its own
+                spans = [span]
+
+        if self.exporter is not None:
+            self.exporter.export(spans)
+        for listener in self.listeners:
+            listener(spans)
+
+class TraceCollector():
+    """
+    Tracer listener that keeps the most recent traces whose root span has a given name.
+    """
+
+    def __init__(self, rootName="turn", keep=16):
+        self.rootName = rootName
+        self.keep = keep
+        self.traces = []
+
+    def __call__(self, spans):
+        if spans[-1].name == self.rootName:
+            self.traces = (self.traces + [spans])[-self.keep:]
+
+    @property
+    def last(self):
+        return self.traces[-1] if self.traces else []
+
+def formatBreakdown(spans, minMs=0.05):
+    """
+    Renders a finished trace as an indented tree with one line per span name and level:
+    the call count, total time, share of the root, and token counts where present.
+
+    Returns:
+        str: The breakdown, root first.
+    """
+
+    if not spans:
+        return ""
+    # The root ends last; a lone span that outlived its trace is its own root
+    root = spans[-1]
+    children = {}
+    for span in spans:
+        children.setdefault(span.parentId, []).append(span)
+
+    total = root.duration or 1
+    lines = []
+
+    def render(group, depth):
+        duration = sum(span.duration for span in group)
+        if depth and duration / 1e6 < minMs:
+            return
+        label = f"{'  ' * depth}{group[0].name}"
+        details = []
+        prompt = sum(span.attributes.get("tokens.prompt", 0) for span in group)
+        output = sum(span.attributes.get("tokens.output", 0) for span in group)
+        if prompt or output:
+            details.append(f"tokens {prompt} in / {output} out")
+        retries = sum(span.attributes.get("retries", 0) for span in group)
+        if retries:
+            details.append(f"{retries} retries")
+        errors = sum(1 for span in group if span.error)
+        if errors:
+            details.append(f"{errors} failed")
+        lines.append(f"{label:<44} {len(group):>4} x {duration / 1e6:>9.1f} ms {duration / total:>5.0%}  {', '.join(details)}".rstrip())
+
+        grouped = {}
+        for span in group:
+            for child in children.get(span.spanId, []):
+                grouped.setdefault(child.name, []).append(child)
+        for childGroup in sorted(grouped.values(), key=lambda members: min(member.start for member in members)):
+            render(childGroup, depth + 1)
+
+    render([root], 0)
+    return "\n".join(lines)
+
+def payloadSize(value):
+    """
+    Size in bytes of a value's JSON encoding, used for payload-size attributes.
+    """
+
+    return len(json.dumps(value, default=str))
+
+# Process-wide tracer shared by every instrumented module
+tracer = Tracer()
@@ -1,12 +1,10 @@
 import datetime
-import os.path
 
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 
+from modules.CalendarService import CalendarService
+from modules.TokenManager import TokenManager
+
 # If modifying these scopes, delete the file token.json.
 SCOPES = ["https://www.googleapis.com/auth/calendar.readonly"]
 
@@ -15,41 +13,25 @@ def main():
   """Shows basic usage of the Google Calendar API.
   Prints the start and name of the next 10 events on the user's calendar.
   """
-  creds = None
   # The file token.json stores the user's access and refresh tokens, and is
   # created automatically when the authorization flow completes for the first
-  # time.
-  if os.path.exists("token.json"):
-    creds = Credentials.from_authorized_user_file("token.json", SCOPES)
-  # If there are no (valid) credentials available, let the user log in.
-  if not creds or not creds.valid:
-    if creds and creds.expired and creds.refresh_token:
-      creds.refresh(Request())
-    else:
-      flow = InstalledAppFlow.from_client_secrets_file(
-          "credentials.json", SCOPES
-      )
-      creds = flow.run_local_server(port=0)
-    # Save the credentials for the next run
-    with open("token.json", "w") as token:
-      token.write(creds.to_json())
+  # time. The token manager refreshes it and saves it atomically.
+  creds = TokenManager.forPath("token.json", "credentials.json", SCOPES).credentials(interactive=True)
 
   try:
-    service = build("calendar", "v3", credentials=creds)
+    calendar = CalendarService(creds)
 
     # Call the Calendar API
     now = datetime.datetime.now(tz=datetime.timezone.utc).isoformat()
     print("Getting the upcoming 10 events")
-    events_result = (
-        service.events()
-        .list(
+    events_result = calendar.execute(
+        calendar.events().list(
             calendarId="primary",
             timeMin=now,
             maxResults=10,
             singleEvents=True,
             orderBy="startTime",
         )
-        .execute()
     )
     events = events_result.get("items", [])
 
@@ -0,0 +1,50 @@
+import time
+
+from google.genai import types
+
+from modules.Assistant import Assistant
+from modules.ResponseCache import AnswerCache
+
+def exchange(prompt, answer):
+    return [types.Content(role="user", parts=[types.Part(text=prompt)]),
+            types.Content(role="model", parts=[types.Part(text=answer)])]
+
+def assistant(cache, history):
+    return Assistant(client=None, config=None, dispatcher=None, history=history, echo=False, answerCache=cache)
+
+def test_follow_up_is_not_answered_from_another_conversation():
+    cache = AnswerCache(version=lambda: 1)
+    dentist = assistant(cache, exchange("when is my dentist appointment", "Tuesday at 9."))
+    dentist._cachedTurn("what about the next one", time.perf_counter())
+    dentist._finishTurn("what about the next one", "The one after is on the 20th.", wrote=False)
+
+    gym = assistant(cache, exchange("when is my next gym class", "Thursday at 6pm."))
+
+    assert gym._cachedTurn("what about the next one", time.perf_counter()) is None
+
+def test_repeated_exchange_is_answered_from_the_cache():
+    cache = AnswerCache(version=lambda: 1)
+    first = assistant(cache, exchange("when is my dentist appointment", "Tuesday at 9."))
+    first._cachedTurn("what about the next one", time.perf_counter())
+    first._finishTurn("what about the next one", "The one after is on the 20th.", wrote=False)
+
+    second = assistant(cache, exchange("when is my dentist appointment", "Tuesday at 9."))
+
+    assert second._cachedTurn("what about the next one", time.perf_counter()) == "The one after is on the 20th."
+
+def test_answers_for_other_contexts_survive_a_store():
+    cache = AnswerCache(version=lambda: 1)
+    cache.store("what is on my calendar today", "Nothing.", context="")
+    cache.store("what is on my calendar today", "Standup at 9.", context="user: hello")
+
+    assert cache.lookup("what is on my calendar today", context="") == "Nothing."
+    assert cache.lookup("What is on my calendar today?", context="user: hello") == "Standup at 9."
+
+def test_new_calendar_version_purges_old_answers():
+    version = [1]
+    cache = AnswerCache(version=lambda: version[0])
+    cache.store("what is on my calendar today", "Nothing.")
+    version[0] = 2
+    cache.store("what do I have tomorrow", "Standup at 9.")
+
+    assert len(cache) == 1 and cache.lookup("what is on my calendar today") is None
@@ -0,0 +1,93 @@
+import httplib2
+import pytest
+from googleapiclient.errors import HttpError
+
+from modules.CalendarSync import CalendarSync
+from modules.Database import Database
+
+def event(eventId, day, summary="Meeting", **fields):
+    return dict({"id": eventId, "status": "confirmed", "summary": summary, "updated": "2026-07-01T00:00:00Z",
+                 "start": {"dateTime": f"2026-07-{day:02d}T09:00:00Z"}, "end": {"dateTime": f"2026-07-{day:02d}T10:00:00Z"}},
+                **fields)
+
+class FakeCalendar():
+    """
+    Answers events().list from a table of responses keyed by the request's syncToken.
+    """
+
+    def __init__(self, responses):
+        self.responses = responses
+        self.requests = []
+
+    def events(self):
+        return self
+
+    def list(self, **params):
+        return params
+
+    def execute(self, request):
+        self.requests.append(request)
+        response = self.responses[request.get("syncToken")]
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+@pytest.fixture
+def database(tmp_path):
+    return Database(f"sqlite:///{tmp_path / 'events.db'}")
+
+def stored(database):
+    return {row["id"]: row["summary"] for row in database.getEvents()}
+
+def test_incremental_sync_sends_the_stored_token_and_applies_changes(database):
+    calendar = FakeCalendar({
+        None: {"items": [event("a", 1), event("b", 2), event("c", 3)], "nextSyncToken": "t1"},
+        "t1": {"items": [event("a", 1, summary="Renamed"), {"id": "b", "status": "cancelled"}, event("d", 4)],
+               "nextSyncToken": "t2"},
+    })
+    mirror = CalendarSync(calendar, database)
+
+    assert mirror.sync()["mode"] == "full"
+    result = mirror.sync()
+
+    assert (result["mode"], result["upserted"], result["deleted"]) == ("incremental", 2, 1)
+    assert calendar.requests[-1]["syncToken"] == "t1"
+    assert stored(database) == {"a": "Renamed", "c": "Meeting", "d": "Meeting"}
+    assert database.getSyncToken("primary") == "t2"
+
+def test_cancelled_instance_hides_only_that_occurrence(database):
+    weekly = event("weekly", 6, recurrence=["RRULE:FREQ=WEEKLY;COUNT=3"])
+    cancelled = {"id": "weekly_20260713T090000Z", "status": "cancelled", "recurringEventId": "weekly",
+                 "originalStartTime": {"dateTime": "2026-07-13T09:00:00Z"}}
+    calendar = FakeCalendar({None: {"items": [weekly], "nextSyncToken": "t1"},
+                             "t1": {"items": [cancelled], "nextSyncToken": "t2"}})
+    mirror = CalendarSync(calendar, database)
+
+    mirror.sync()
+    mirror.sync()
+
+    assert [row["id"] for row in database.getEvents()] == ["weekly_20260706T090000Z", "weekly_20260720T090000Z"]
+
+def test_expired_token_falls_back_to_a_full_sync_that_prunes(database):
+    gone = HttpError(httplib2.Response({"status": 410}), b'{"error": {"code": 410, "message": "Sync token expired"}}')
+    calendar = FakeCalendar({None: {"items": [event("a", 1), event("b", 2)], "nextSyncToken": "t1"}})
+    mirror = CalendarSync(calendar, database)
+    mirror.sync()
+    calendar.responses = {"t1": gone, None: {"items": [event("b", 2)], "nextSyncToken": "t2"}}
+
+    result = mirror.sync()
+
+    assert (result["mode"], result["deleted"]) == ("full", 1)
+    assert [request.get("syncToken") for request in calendar.requests[1:]] == ["t1", None]
+    assert stored(database) == {"b": "Meeting"}
+    assert database.getSyncToken("primary") == "t2"
+
+def test_other_errors_are_not_resynced(database):
+    calendar = FakeCalendar({None: {"items": [], "nextSyncToken": "t1"}})
+    mirror = CalendarSync(calendar, database)
+    mirror.sync()
+    calendar.responses = {"t1": HttpError(httplib2.Response({"status": 403}), b"{}")}
+
+    with pytest.raises(HttpError):
+        mirror.sync()
+    assert database.getSyncToken("primary") == "t1"
@@ -0,0 +1,44 @@
+import pytest
+
+import main
+from modules.IntervalIndex import IntervalIndex
+
+CALL = {"summary": "Call", "start": "2026-07-10T14:00:00Z", "end": "2026-07-10T15:00:00Z", "allDay": 0}
+HOLIDAY = {"summary": "Holiday", "start": "2026-07-10T00:00:00Z", "end": "2026-07-11T00:00:00Z", "allDay": 1}
+
+@pytest.fixture
+def calendar(monkeypatch):
+    monkeypatch.setattr(main, "get_interval_index", lambda creds, calendar_id="primary": IntervalIndex([CALL, HOLIDAY]))
+    monkeypatch.setattr(main, "calendar_time_zone", lambda creds, calendar_id="primary": "Europe/Berlin")
+
+def test_all_day_proposal_never_conflicts(calendar):
+    birthday = {"summary": "Birthday", "start": {"date": "2026-07-10"}, "end": {"date": "2026-07-11"}}
+
+    assert main.event_conflicts(birthday, creds=None) == []
+
+def test_timed_proposal_ignores_all_day_events(calendar):
+    lunch = {"summary": "Lunch", "start": {"dateTime": "2026-07-10T12:00:00Z"}, "end": {"dateTime": "2026-07-10T13:00:00Z"}}
+
+    assert main.event_conflicts(lunch, creds=None) == []
+
+def test_naive_date_time_is_read_in_the_event_time_zone(calendar):
+    # 07:30 in Los Angeles is 14:30 UTC, during the call
+    breakfast = {"summary": "Breakfast", "start": {"dateTime": "2026-07-10T07:30:00", "timeZone": "America/Los_Angeles"},
+                 "end": {"dateTime": "2026-07-10T08:30:00", "timeZone": "America/Los_Angeles"}}
+
+    assert [conflict["summary"] for conflict in main.event_conflicts(breakfast, creds=None)] == ["Call"]
+
+def test_naive_date_time_without_time_zone_uses_the_calendar_zone(calendar):
+    # 16:00 in Berlin is 14:00 UTC; read as UTC it would miss the call
+    review = {"summary": "Review", "start": {"dateTime": "2026-07-10T16:00:00"}, "end": {"dateTime": "2026-07-10T16:30:00"}}
+
+    assert [conflict["summary"] for conflict in main.event_conflicts(review, creds=None)] == ["Call"]
+
+def test_naive_recurring_proposal_is_read_in_its_time_zone(calendar):
+    standup = {"summary": "Standup", "start": {"dateTime": "2026-07-08T07:45:00", "timeZone": "America/Los_Angeles"},
+               "end": {"dateTime": "2026-07-08T08:15:00", "timeZone": "America/Los_Angeles"},
+               "recurrence": ["RRULE:FREQ=DAILY;COUNT=5"]}
+
+    conflicts = main.event_conflicts(standup, creds=None)
+
+    assert [(conflict["summary"], conflict["start"]) for conflict in conflicts] == [("Call", "2026-07-10T14:00:00Z")]
@@ -0,0 +1,79 @@
+from google.genai import types
+
+from modules.HistoryManager import HistoryManager
+
+def turn(index):
+    return [
+        types.Content(role="user", parts=[types.Part(text=f"What is on my calendar on day {index}?")]),
+        types.Content(role="model", parts=[types.Part(function_call=types.FunctionCall(
+            name="list_calendar_event", args={"quantity": 10}))]),
+        types.Content(role="user", parts=[types.Part(function_response=types.FunctionResponse(
+            name="list_calendar_event", response={"output": [{"summary": "Standup"}] * 10}))]),
+        types.Content(role="model", parts=[types.Part(text="You have ten standups. " * 5)]),
+    ]
+
+def conversation(turns):
+    return [content for index in range(turns) for content in turn(index)]
+
+def isCall(content):
+    return any(part.function_call for part in content.parts or [])
+
+def isResponse(content):
+    return any(part.function_response for part in content.parts or [])
+
+def test_compaction_keeps_calls_with_their_responses():
+    manager = HistoryManager(budget=1500, keepRecent=2, pinned=0, maxSummaryTokens=200)
+    history = conversation(40)
+
+    manager.compact(history)
+
+    assert history[0] is manager.summaryContent
+    kept = history[1:]
+    # Whole turns only: the kept part starts at a prompt and every call is answered next
+    assert manager.isTurnStart(kept[0])
+    for index, content in enumerate(kept):
+        if isCall(content):
+            assert isResponse(kept[index + 1])
+        if isResponse(content):
+            assert isCall(kept[index - 1])
+
+def test_compaction_folds_only_as_many_turns_as_the_budget_needs():
+    manager = HistoryManager(budget=1500, keepRecent=2, pinned=0, maxSummaryTokens=200)
+    history = conversation(40)
+    original = list(history)
+
+    manager.compact(history)
+
+    kept = len(manager.splitTurns(history[1:]))
+    assert manager.totalTokens(history[1:]) + manager.maxSummaryTokens <= manager.budget
+    # Keeping one more turn would not have fitted
+    unfolded = original[-4 * (kept + 1):]
+    assert manager.totalTokens(unfolded) + manager.maxSummaryTokens > manager.budget
+
+def test_history_within_budget_is_left_alone():
+    manager = HistoryManager(budget=8000, pinned=0)
+    history = conversation(3)
+    original = list(history)
+
+    assert manager.compact(history) == original and manager.summaryContent is None
+
+def test_each_message_is_counted_once():
+    calls = []
+
+    class Models():
+        def count_tokens(self, model, contents):
+            calls.append(contents[0])
+            return types.CountTokensResponse(total_tokens=50)
+
+    class Client():
+        models = Models()
+
+    manager = HistoryManager(budget=1000, keepRecent=2, pinned=0, maxSummaryTokens=200, client=Client())
+    history = conversation(20)
+    messages = len(history)
+
+    manager.compact(history)
+    manager.compact(history)
+
+    # The second compaction only counts the new summary message
+    assert len(calls) == messages + 1
@@ -0,0 +1,76 @@
+import datetime
+import zoneinfo
+
+import pytest
+
+from modules.IntentRouter import IntentRouter
+
+NEW_YORK = zoneinfo.ZoneInfo("America/New_York")
+# A Friday, two days before the switch back to standard time
+NOW = datetime.datetime(2026, 10, 30, 10, 0, tzinfo=NEW_YORK)
+
+@pytest.fixture
+def router():
+    return IntentRouter(tz=NEW_YORK)
+
+@pytest.mark.parametrize("prompt, summary, start, end", [
+    ("add dentist on monday at 9am", "Dentist", "2026-11-02T09:00:00-05:00", "2026-11-02T10:00:00-05:00"),
+    ("Add lunch with Sam on Friday at noon", "Lunch with Sam", "2026-10-30T12:00:00-04:00", "2026-10-30T13:00:00-04:00"),
+    ("book dentist tomorrow from 3pm to 4:30pm", "Dentist", "2026-10-31T15:00:00-04:00", "2026-10-31T16:30:00-04:00"),
+    ("schedule team sync for 30 minutes tomorrow at 3pm", "Team sync", "2026-10-31T15:00:00-04:00", "2026-10-31T15:30:00-04:00"),
+    ("schedule team sync tomorrow at 3pm for 2 hours", "Team sync", "2026-10-31T15:00:00-04:00", "2026-10-31T17:00:00-04:00"),
+    ("create a meeting called planning on sunday at 10:30 a.m.", "Planning", "2026-11-01T10:30:00-05:00", "2026-11-01T11:30:00-05:00"),
+    ("put gym tomorrow at 18:00 for half an hour", "Gym", "2026-10-31T18:00:00-04:00", "2026-10-31T18:30:00-04:00"),
+])
+def test_insert_accepted(router, prompt, summary, start, end):
+    route = router.route(prompt, NOW)
+
+    assert route is not None and route.tool == "insert_calendar_event"
+    event = route.args["event_data"]
+    assert (event["summary"], event["start"]["dateTime"], event["end"]["dateTime"]) == (summary, start, end)
+    assert event["start"]["timeZone"] == event["end"]["timeZone"] == "America/New_York"
+
+@pytest.mark.parametrize("prompt", [
+    "add standup tomorrow at 9",                                # am or pm?
+    "add dentist next monday at 9am",                           # this week's Monday or the next?
+    "add lunch for 30 minutes tomorrow at noon for 1 hour",     # two durations
+    "book dentist tomorrow from 3pm to 4pm for 2 hours",        # end time and duration
+    "add review on friday at 9am tomorrow",                     # two days
+    "add call with Sam at 3pm tomorrow at 5pm",                 # time left in the title
+    "schedule sync for 2 days tomorrow at 3pm",                 # duration the router does not read
+    "add standup yesterday at 9am",                             # in the past
+    "add standup today at 8am",                                 # earlier today
+    "move my standup to 10",
+    "delete my dentist appointment",
+])
+def test_insert_rejected(router, prompt):
+    route = router.route(prompt, NOW)
+
+    assert route is None or route.tool != "insert_calendar_event"
+
+@pytest.mark.parametrize("prompt, intent", [
+    ("list my next 5 events", "list_next"),
+    ("What's on my calendar?", "list_next"),
+    ("what do I have tomorrow?", "list_window"),
+    ("show my schedule for next week", "list_window"),
+    ("When am I free tomorrow afternoon for an hour?", "free_slots"),
+    ("find me a 45-minute slot on thursday", "free_slots"),
+])
+def test_reads_accepted(router, prompt, intent):
+    route = router.route(prompt, NOW)
+
+    assert route is not None and route.intent == intent
+
+@pytest.mark.parametrize("prompt", [
+    "How busy am I next month?",
+    "what should I prepare for my 1:1?",
+    "list my next 500 events",
+])
+def test_reads_rejected(router, prompt):
+    assert router.route(prompt, NOW) is None
+
+def test_free_slots_window_uses_the_days_own_offset(router):
+    route = router.route("when am I free on monday morning", NOW)
+
+    assert route.args["window_start"] == "2026-11-02T08:00:00-05:00"
+    assert route.args["window_end"] == "2026-11-02T12:00:00-05:00"
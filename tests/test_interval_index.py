@@ -0,0 +1,43 @@
+import pytest
+
+from modules.IntervalIndex import IntervalIndex
+
+EVENTS = [
+    {"summary": "Standup", "start": "2026-07-10T09:00:00Z", "end": "2026-07-10T09:30:00Z"},
+    {"summary": "Review", "start": "2026-07-10T10:00:00Z", "end": "2026-07-10T11:00:00Z"},
+    {"summary": "Offsite", "start": "2026-07-10T08:00:00Z", "end": "2026-07-10T17:00:00Z", "allDay": 0},
+    {"summary": "Holiday", "start": "2026-07-10T00:00:00Z", "end": "2026-07-11T00:00:00Z", "allDay": 1},
+]
+
+@pytest.fixture
+def index():
+    # Without the offsite, whose long span hides the gaps between the others
+    return IntervalIndex([event for event in EVENTS if event["summary"] != "Offsite"])
+
+@pytest.mark.parametrize("start, end, expected", [
+    ("2026-07-10T09:30:00Z", "2026-07-10T10:00:00Z", []),                       # between two events
+    ("2026-07-10T08:00:00Z", "2026-07-10T09:00:00Z", []),                       # ends as one starts
+    ("2026-07-10T11:00:00Z", "2026-07-10T12:00:00Z", []),                       # starts as one ends
+    ("2026-07-10T09:29:59Z", "2026-07-10T09:30:00Z", ["Standup"]),              # last second
+    ("2026-07-10T10:00:00Z", "2026-07-10T10:00:01Z", ["Review"]),               # first second
+    ("2026-07-10T10:15:00Z", "2026-07-10T10:45:00Z", ["Review"]),               # inside
+    ("2026-07-10T08:00:00Z", "2026-07-10T12:00:00Z", ["Standup", "Review"]),    # around both
+])
+def test_conflicts_at_the_boundaries(index, start, end, expected):
+    assert [event["summary"] for event in index.findConflicts(start, end)] == expected
+
+def test_all_day_events_are_left_out_unless_asked_for():
+    assert "Holiday" not in [event["summary"] for event in IntervalIndex(EVENTS).events]
+    assert "Holiday" in [event["summary"] for event in IntervalIndex(EVENTS, includeAllDay=True).events]
+
+def test_long_event_is_found_after_shorter_ones_that_end_first():
+    index = IntervalIndex(EVENTS)
+
+    assert [event["summary"] for event in index.findConflicts("2026-07-10T15:00:00Z", "2026-07-10T16:00:00Z")] == ["Offsite"]
+
+def test_free_slots_keep_gaps_of_exactly_the_duration(index):
+    slots = index.freeSlots("2026-07-10T09:00:00Z", "2026-07-10T12:00:00Z", 30 * 60)
+
+    assert slots == [("2026-07-10T09:30:00Z", "2026-07-10T10:00:00Z"), ("2026-07-10T11:00:00Z", "2026-07-10T12:00:00Z")]
+    assert index.freeSlots("2026-07-10T09:00:00Z", "2026-07-10T12:00:00Z", 30 * 60 + 1) == [
+        ("2026-07-10T11:00:00Z", "2026-07-10T12:00:00Z")]
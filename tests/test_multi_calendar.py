@@ -0,0 +1,31 @@
+from modules.MultiCalendar import MultiCalendar
+from modules.RequestScheduler import BACKGROUND, _priority, priority
+from modules.Tracer import tracer
+
+class RecordingCalendar():
+    """
+    Answers events().list with one event per calendar and records the context of each request.
+    """
+
+    def __init__(self):
+        self.seen = {}
+
+    def events(self):
+        return self
+
+    def list(self, **params):
+        return params
+
+    def execute(self, request):
+        self.seen[request["calendarId"]] = (_priority.get(), tracer.current())
+        return {"items": [{"id": request["calendarId"], "summary": "Event",
+                           "start": {"dateTime": "2026-07-10T09:00:00Z"}, "end": {"dateTime": "2026-07-10T10:00:00Z"}}]}
+
+def test_fetches_run_in_the_callers_context():
+    calendar = RecordingCalendar()
+    with priority(BACKGROUND):
+        parent = tracer.current()
+        events, errors = MultiCalendar(calendar).merged("2026-07-10T00:00:00Z", "2026-07-11T00:00:00Z", ["work", "home"])
+
+    assert [event["calendarId"] for event in events] == ["work", "home"] and errors == {}
+    assert calendar.seen == {"work": (BACKGROUND, parent), "home": (BACKGROUND, parent)}
@@ -0,0 +1,45 @@
+from modules.Database import Database
+from modules.CalendarSync import eventToRow
+from modules.Recurrence import occurrences, seriesEnd
+
+def timedSeries(rule):
+    return eventToRow({"id": "weekly", "status": "confirmed", "summary": "Weekly",
+                       "start": {"dateTime": "2026-03-02T11:00:00-05:00", "timeZone": "America/New_York"},
+                       "end": {"dateTime": "2026-03-02T12:00:00-05:00", "timeZone": "America/New_York"},
+                       "recurrence": [rule]}, "primary")
+
+def test_date_only_until_on_timed_series_runs_to_end_of_that_day():
+    series = timedSeries("RRULE:FREQ=WEEKLY;UNTIL=20260330")
+
+    starts = [instance["start"] for instance in occurrences(series)]
+
+    # The 30th is included, and the series keeps 11:00 New York time across the DST change
+    assert starts == ["2026-03-02T16:00:00Z", "2026-03-09T15:00:00Z", "2026-03-16T15:00:00Z",
+                      "2026-03-23T15:00:00Z", "2026-03-30T15:00:00Z"]
+    assert series["seriesEnd"] == "2026-03-30T16:00:00Z"
+
+def test_date_only_until_series_is_read_in_later_windows(tmp_path):
+    database = Database(f"sqlite:///{tmp_path / 'events.db'}")
+    database.upsertEvents([timedSeries("RRULE:FREQ=WEEKLY;UNTIL=20260401")])
+
+    rows = database.getEvents(start="2026-03-20T00:00:00Z", end="2026-04-10T00:00:00Z")
+
+    assert [row["id"] for row in rows] == ["weekly_20260323T150000Z", "weekly_20260330T150000Z"]
+
+def test_dated_exdate_on_timed_series_skips_that_day():
+    series = timedSeries("RRULE:FREQ=WEEKLY;COUNT=3")
+    series["recurrence"] += "\nEXDATE;VALUE=DATE:20260309"
+
+    assert [instance["start"] for instance in occurrences(series)] == ["2026-03-02T16:00:00Z", "2026-03-16T15:00:00Z"]
+
+def test_utc_until_on_all_day_series():
+    series = eventToRow({"id": "daily", "summary": "Trip", "start": {"date": "2026-03-02"}, "end": {"date": "2026-03-03"},
+                         "recurrence": ["RRULE:FREQ=DAILY;UNTIL=20260304T000000Z"]}, "primary")
+
+    assert [instance["id"] for instance in occurrences(series)] == ["daily_20260302", "daily_20260303", "daily_20260304"]
+
+def test_unreadable_rule_is_logged_and_not_stored_as_finished(caplog):
+    series = timedSeries("RRULE:FREQ=SOMETIMES;COUNT=3")
+
+    assert seriesEnd(series) is None
+    assert "Cannot expand recurrence" in caplog.text
@@ -0,0 +1,92 @@
+import httplib2
+import pytest
+from googleapiclient.errors import HttpError
+
+from modules.RequestScheduler import ApiScheduler, TokenBucket, getScheduler
+
+def throttled():
+    return HttpError(httplib2.Response({"status": 429}), b'{"error": {"code": 429, "message": "Rate limit"}}')
+
+def test_calendar_schedulers_are_per_user():
+    alice, bob = getScheduler("calendar", "alice"), getScheduler("calendar", "bob")
+
+    assert alice is getScheduler("calendar", "alice")
+    assert alice is not bob and alice.bucket is not bob.bucket
+    assert alice.name == "calendar:alice"
+
+def test_gemini_scheduler_is_shared():
+    assert getScheduler("gemini") is getScheduler("gemini")
+
+def test_bucket_allows_a_burst_then_the_rate():
+    bucket = TokenBucket(rate=10.0, burst=3)
+    now = bucket.updated
+
+    for _ in range(3):
+        assert bucket.wait(now) == 0.0
+        bucket.take(now)
+
+    assert bucket.wait(now) == pytest.approx(0.1)
+    assert bucket.wait(now + 0.1) == 0.0
+    # Idle time never saves up more than the burst
+    assert bucket.wait(now + 60) == 0.0 and bucket.tokens == 3
+
+def test_successes_grow_the_limit_by_about_one_per_window():
+    scheduler = ApiScheduler("test", rate=1e9, burst=1e9, concurrency=4, maxConcurrency=6)
+
+    for _ in range(4):
+        scheduler.call(lambda: None)
+
+    assert 4.9 < scheduler.limit < 5.0
+    for _ in range(100):
+        scheduler.call(lambda: None)
+    assert scheduler.limit == 6
+
+def test_throttling_halves_the_limit_once_per_window():
+    scheduler = ApiScheduler("test", rate=1e9, burst=1e9, concurrency=8)
+    # A burst admitted under one limit, all of it throttled
+    admissions = [scheduler.acquire() for _ in range(8)]
+    for admission in admissions:
+        scheduler.release(throttled=True, admission=admission)
+
+    assert scheduler.limit == 4 and scheduler.inFlight == 0
+
+    # A request admitted after the cut is a new window
+    scheduler.release(throttled=True, admission=scheduler.acquire())
+    assert scheduler.limit == 2
+
+def test_limit_never_drops_below_the_minimum():
+    scheduler = ApiScheduler("test", rate=1e9, burst=1e9, concurrency=2, minConcurrency=1)
+
+    for _ in range(5):
+        scheduler.observe(throttled=True)
+
+    assert scheduler.limit == 1
+
+def test_throttled_calls_are_retried_and_counted(monkeypatch):
+    monkeypatch.setattr("modules.RequestScheduler.time.sleep", lambda seconds: None)
+    scheduler = ApiScheduler("test", rate=1e9, burst=1e9, concurrency=4)
+    responses = iter([throttled(), throttled(), "ok"])
+
+    def call():
+        response = next(responses)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    assert scheduler.call(call) == "ok"
+    stats = scheduler.stats()
+    assert (stats["calls"], stats["retries"], stats["throttled"], stats["inFlight"]) == (1, 2, 2, 0)
+    assert scheduler.limit < 4
+
+def test_writes_are_not_resent_after_a_server_error(monkeypatch):
+    monkeypatch.setattr("modules.RequestScheduler.time.sleep", lambda seconds: None)
+    scheduler = ApiScheduler("test", rate=1e9, burst=1e9)
+    attempts = []
+
+    def insert():
+        attempts.append(1)
+        raise HttpError(httplib2.Response({"status": 500}), b"{}")
+
+    with pytest.raises(HttpError):
+        scheduler.call(insert, idempotent=False)
+    assert len(attempts) == 1
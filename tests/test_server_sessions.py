@@ -0,0 +1,29 @@
+import datetime
+import zoneinfo
+
+import pytest
+from google.oauth2.credentials import Credentials
+
+import main
+
+ZONES = {"tokyo": "Asia/Tokyo", "denver": "America/Denver"}
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    tokens = {user: Credentials(token=f"test-{user}") for user in ZONES}
+    monkeypatch.setattr(main, "USERS_DIR", str(tmp_path))
+    monkeypatch.setattr(main, "calendar_time_zone", lambda creds, calendar_id="primary": ZONES[main.user_of(creds)])
+    server = main.build_server(client=None, credentials=tokens.__getitem__, port=0, quiet=True)
+    yield server
+    server.server_close()
+
+def test_sessions_read_dates_in_their_users_zone(server):
+    tokyo = server.manager.create("tokyo").assistant
+    denver = server.manager.create("denver").assistant
+    # 20:00 in Denver is already the next day in Tokyo
+    now = datetime.datetime(2026, 7, 10, 20, 0, tzinfo=zoneinfo.ZoneInfo("America/Denver"))
+
+    routes = [assistant.router.route("what do I have tomorrow?", now) for assistant in (tokyo, denver)]
+
+    assert [route.args["time_min"][:10] for route in routes] == ["2026-07-12", "2026-07-11"]
+    assert tokyo.router is server.manager.create("tokyo").assistant.router
@@ -0,0 +1,63 @@
+import datetime
+import http.client
+import json
+import threading
+
+import pytest
+from google.auth.exceptions import RefreshError
+from google.oauth2.credentials import Credentials
+
+from modules import TokenManager as tokenModule
+from modules.SessionServer import SessionManager, SessionServer
+from modules.TokenManager import AuthorizationError, TokenManager
+
+@pytest.fixture
+def noFlow(monkeypatch):
+    def flow(*args, **kwargs):
+        raise AssertionError("the OAuth flow must not start")
+    monkeypatch.setattr(tokenModule.InstalledAppFlow, "from_client_secrets_file", flow)
+
+def expiredToken(path):
+    creds = Credentials(token="old", refresh_token="revoked", token_uri="https://oauth2.googleapis.com/token",
+                        client_id="id", client_secret="secret",
+                        expiry=datetime.datetime(2020, 1, 1))
+    path.write_text(creds.to_json())
+
+def test_revoked_refresh_token_raises_instead_of_prompting(tmp_path, monkeypatch, noFlow):
+    expiredToken(tmp_path / "token.json")
+    def refresh(self, request):
+        raise RefreshError("invalid_grant: Token has been expired or revoked.")
+    monkeypatch.setattr(Credentials, "refresh", refresh)
+
+    with pytest.raises(AuthorizationError, match="Cannot refresh"):
+        TokenManager(str(tmp_path / "token.json")).credentials()
+
+def test_missing_token_raises_off_the_main_thread_even_when_interactive(tmp_path, noFlow):
+    errors = []
+    def load():
+        try:
+            TokenManager(str(tmp_path / "token.json")).credentials(interactive=True)
+        except AuthorizationError as error:
+            errors.append(error)
+
+    thread = threading.Thread(target=load)
+    thread.start()
+    thread.join()
+
+    assert len(errors) == 1
+
+def test_server_answers_authorization_errors_with_401():
+    def credentials(user):
+        raise AuthorizationError(f"{user}.json holds no usable credentials")
+    server = SessionServer(("127.0.0.1", 0), SessionManager(lambda user, creds: None, credentials), quiet=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        connection = http.client.HTTPConnection(*server.server_address[:2], timeout=10)
+        connection.request("POST", "/sessions", headers={"X-User": "alice"})
+        response = connection.getresponse()
+
+        assert response.status == 401
+        assert "no usable credentials" in json.loads(response.read())["error"]
+    finally:
+        server.shutdown()
+        server.server_close()